@@ -0,0 +1,84 @@
+"""
+连接池基准测试
+
+对比两种上游请求方式的单次请求开销:
+- before: 每次调用新建 httpx.AsyncClient (旧实现)
+- after:  使用进程级共享连接池 (make_api_request)
+
+运行:
+    python benchmarks/bench_connection_pool.py --requests 500
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_upstream import run_stub_in_background  # noqa: E402
+
+
+def summarize(label: str, samples: list[float]) -> None:
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[int(len(samples_ms) * 0.95) - 1]
+    print(
+        f"{label:<8} mean={statistics.mean(samples_ms):7.3f}ms "
+        f"p50={statistics.median(samples_ms):7.3f}ms p95={p95:7.3f}ms"
+    )
+
+
+async def bench(requests: int, port: int) -> None:
+    import httpx
+
+    base_url = f"http://127.0.0.1:{port}"
+    os.environ["JIMENG_API_URL"] = base_url
+    os.environ.setdefault("JIMENG_API_KEY", "bench")
+
+    from jimeng_mcp import server
+    from jimeng_mcp.http_client import close_http_client
+
+    payload = {"model": "jimeng-4.5", "prompt": "bench"}
+    headers = {"Authorization": "Bearer bench", "Content-Type": "application/json"}
+
+    async with run_stub_in_background(port=port):
+        before = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            async with httpx.AsyncClient(timeout=30) as client:
+                response = await client.post(
+                    f"{base_url}/v1/images/generations", json=payload, headers=headers
+                )
+                response.json()
+            before.append(time.perf_counter() - start)
+
+        after = []
+        # 请求日志只记录警告以上级别, 只测量连接开销
+        logging.getLogger("jimeng_mcp").setLevel(logging.WARNING)
+        try:
+            for _ in range(requests):
+                start = time.perf_counter()
+                await server.make_api_request("/v1/images/generations", payload, timeout=30)
+                after.append(time.perf_counter() - start)
+        finally:
+            await close_http_client()
+
+    print(f"上游桩服务: {base_url}, 请求数: {requests}")
+    summarize("before", before)
+    summarize("after", after)
+    print(f"单次请求节省: {(statistics.mean(before) - statistics.mean(after)) * 1000:.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="连接池基准测试")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+    asyncio.run(bench(args.requests, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+冷启动基准测试
+
+Claude Desktop 为每个会话启动一个新的 stdio 服务器进程, 这里测量:
+- python: 空解释器的启动时间, 作为参照
+- import: 导入 jimeng_mcp.server 的进程总耗时 (含解释器启动)
+- list_tools: 从启动 stdio 服务器进程到收到第一个 tools/list 响应的时间
+  (initialize 握手 + tools/list, 不访问上游)
+
+每项运行 --runs 次取中位数。超出预算时以非零状态退出, 可作为回归检查:
+- --budget-import-ms / --budget-list-tools-ms: 绝对预算(毫秒)
+- --compare: 与之前的结果对比, 任一项超过基线的 (1 + --max-regression) 倍视为回归
+
+运行:
+    python benchmarks/bench_startup.py --runs 10 --output benchmarks/results/startup.json
+    python benchmarks/bench_startup.py --compare benchmarks/results/startup.json --max-regression 0.2
+    python benchmarks/bench_startup.py --budget-import-ms 1500 --budget-list-tools-ms 2500
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+
+METRICS = ("python", "import", "list_tools")
+
+PROTOCOL_VERSION = "2024-11-05"
+
+
+def server_env(state_dir: str) -> dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")]))
+    env.setdefault("JIMENG_API_KEY", "bench")
+    # 启动路径上不访问上游, 也不读写已有的本地状态
+    env["JIMENG_API_URL"] = "http://127.0.0.1:9"
+    env["JIMENG_CACHE_PATH"] = ""
+    env["JIMENG_JOB_STORE_PATH"] = ""
+    env["JIMENG_SHARED_STATE_PATH"] = ""
+    env["JIMENG_STATE_DIR"] = state_dir
+    return env
+
+
+def time_process(args: list[str], env: dict[str, str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(args, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def time_first_list_tools(env: dict[str, str]) -> float:
+    """启动 stdio 服务器, 返回收到第一个 tools/list 响应的耗时(秒)"""
+    messages = [
+        {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "protocolVersion": PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "bench-startup", "version": "0"},
+        }},
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+    ]
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "jimeng_mcp.server", "--mode", "stdio"],
+        env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        text=True, encoding="utf-8",
+    )
+    try:
+        # 服务器按顺序处理, 可以一次写入全部消息
+        process.stdin.write("".join(json.dumps(message) + "\n" for message in messages))
+        process.stdin.flush()
+        for line in process.stdout:
+            response = json.loads(line)
+            if response.get("id") == 2:
+                elapsed = time.perf_counter() - start
+                if not response.get("result", {}).get("tools"):
+                    raise RuntimeError(f"tools/list 响应异常: {line.strip()}")
+                return elapsed
+        raise RuntimeError("服务器在响应 tools/list 之前退出")
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def measure(runs: int) -> dict[str, dict[str, float]]:
+    samples: dict[str, list[float]] = {metric: [] for metric in METRICS}
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = server_env(state_dir)
+        # 预热一次, 生成字节码缓存, 与用户实际的启动条件一致
+        time_process([sys.executable, "-c", "import jimeng_mcp.server"], env)
+        for _ in range(runs):
+            samples["python"].append(time_process([sys.executable, "-c", "pass"], env))
+            samples["import"].append(time_process([sys.executable, "-c", "import jimeng_mcp.server"], env))
+            samples["list_tools"].append(time_first_list_tools(env))
+    return {
+        metric: {
+            "median_ms": round(statistics.median(values) * 1000, 1),
+            "min_ms": round(min(values) * 1000, 1),
+            "max_ms": round(max(values) * 1000, 1),
+        }
+        for metric, values in samples.items()
+    }
+
+
+def check_budget(results: dict[str, Any], args) -> list[str]:
+    """超出预算的项, 为空表示通过"""
+    failures = []
+    budgets = {"import": args.budget_import_ms, "list_tools": args.budget_list_tools_ms}
+    for metric, budget in budgets.items():
+        value = results[metric]["median_ms"]
+        if budget is not None and value > budget:
+            failures.append(f"{metric} {value:.1f}ms 超出预算 {budget:.1f}ms")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        print(f"\n📊 与基线对比 ({args.compare})")
+        for metric in METRICS:
+            old = baseline.get(metric, {}).get("median_ms")
+            if not old:
+                continue
+            value = results[metric]["median_ms"]
+            change = value / old - 1
+            print(f"{metric:<11} {old:8.1f}ms -> {value:8.1f}ms  {change:+7.1%}")
+            if metric != "python" and change > args.max_regression:
+                failures.append(f"{metric} 比基线慢 {change:.1%}, 超过允许的 {args.max_regression:.0%}")
+    return failures
+
+
+def parse_args(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="冷启动基准测试")
+    parser.add_argument("--runs", type=int, default=10, help="每项的运行次数 (默认: 10)")
+    parser.add_argument("--budget-import-ms", type=float, default=None, help="导入耗时预算(毫秒)")
+    parser.add_argument("--budget-list-tools-ms", type=float, default=None, help="首个 tools/list 响应的耗时预算(毫秒)")
+    parser.add_argument("--compare", default=None, help="用于对比的基线结果JSON文件")
+    parser.add_argument(
+        "--max-regression", type=float, default=0.2,
+        help="与基线对比时允许的最大变慢比例 (默认: 0.2)",
+    )
+    parser.add_argument("--output", default=None, help="结果JSON文件路径")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    sys.path.insert(0, SRC_DIR)
+    from jimeng_mcp import __version__
+
+    results = measure(args.runs)
+    for metric in METRICS:
+        values = results[metric]
+        print(
+            f"{metric:<11} median={values['median_ms']:8.1f}ms "
+            f"min={values['min_ms']:8.1f}ms max={values['max_ms']:8.1f}ms"
+        )
+
+    if args.output:
+        report = {
+            "version": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已写入 {args.output}")
+
+    failures = check_budget(results, args)
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    if args.budget_import_ms or args.budget_list_tools_ms or args.compare:
+        print("✅ 启动耗时在预算内")
+
+
+if __name__ == "__main__":
+    main()
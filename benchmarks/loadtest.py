@@ -0,0 +1,491 @@
+"""
+三种服务器模式的负载测试
+
+启动本地桩服务 (stub_upstream.py) 作为即梦上游, 再分别以 stdio、SSE、HTTP
+模式启动服务器子进程, 按递增的并发数发起工具调用, 统计:
+- 吞吐量 (请求/秒)
+- 延迟 p50/p95/p99
+- 服务器进程的内存 (RSS) 和打开的文件描述符数 (读取 /proc, 仅Linux)
+
+桩服务的延迟反映上游生成耗时, 设为 0 时测量的是服务器自身开销。
+结果写入JSON文件, 可用 --compare 与之前版本的结果对比。
+--workers 1,2,4 时 SSE/HTTP 模式按每个工作进程数各运行一次, 并输出吞吐量相对
+单工作进程的倍数; 多工作进程的结果以 "模式@N" 为键。
+
+运行:
+    python benchmarks/loadtest.py --modes http,sse,stdio --concurrency 1,4,16,64 \\
+        --requests 200 --latency lognormal:0.2,0.4 --output benchmarks/results/0.1.0.json
+    python benchmarks/loadtest.py --compare benchmarks/results/0.1.0.json --output new.json
+    python benchmarks/loadtest.py --modes http --workers 1,2,4 --concurrency 16,64,256 --latency 0
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+
+sys.path.insert(0, BENCH_DIR)
+
+from stub_upstream import add_stub_arguments  # noqa: E402
+
+MODES = ("stdio", "sse", "http")
+
+# HTTP 模式下工具对应的路由
+HTTP_ROUTES = {
+    "text_to_image": "/text-to-image",
+    "text_to_video": "/text-to-video",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """最近秩百分位数"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class ProcessSampler:
+    """定期读取 /proc/<pid> 下的 RSS 和文件描述符数, 记录峰值
+
+    多工作进程模式下统计服务器进程及其全部子进程的合计值。
+    """
+
+    def __init__(self, pid: Optional[int], interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.rss_peak = 0
+        self.fds_peak = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self) -> tuple[Optional[int], Optional[int]]:
+        """返回 (RSS字节数, 文件描述符数), 无法读取时为 None"""
+        if self.pid is None:
+            return None, None
+        rss = fds = None
+        for pid in [self.pid, *child_pids(self.pid)]:
+            try:
+                with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            rss = (rss or 0) + int(line.split()[1]) * 1024
+                            break
+                fds = (fds or 0) + len(os.listdir(f"/proc/{pid}/fd"))
+            except OSError:
+                pass
+        return rss, fds
+
+    async def _run(self) -> None:
+        while True:
+            rss, fds = self.sample()
+            self.rss_peak = max(self.rss_peak, rss or 0)
+            self.fds_peak = max(self.fds_peak, fds or 0)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self) -> "ProcessSampler":
+        self.rss_peak = self.fds_peak = 0
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    def result(self) -> dict[str, Any]:
+        rss, fds = self.sample()
+        if rss is None:
+            return {"rss_mb_peak": None, "rss_mb_end": None, "fds_peak": None, "fds_end": None}
+        return {
+            "rss_mb_peak": round(self.rss_peak / 2**20, 1),
+            "rss_mb_end": round(rss / 2**20, 1),
+            "fds_peak": self.fds_peak,
+            "fds_end": fds,
+        }
+
+
+def iter_children(parent: int):
+    """产出 parent 的直接子进程 (进程号, 命令行)"""
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as f:
+                ppid = f.read().rsplit(")", 1)[1].split()[1]
+            if ppid != str(parent):
+                continue
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read().decode(errors="replace")
+        except (OSError, IndexError):
+            continue
+        yield int(entry), cmdline
+
+
+def child_pids(parent: int) -> list[int]:
+    return [pid for pid, _ in iter_children(parent)]
+
+
+def find_child_pid(marker: str) -> Optional[int]:
+    """在当前进程的子进程中查找命令行包含 marker 的进程 (stdio 客户端启动的服务器)"""
+    for pid, cmdline in iter_children(os.getpid()):
+        if marker in cmdline:
+            return pid
+    return None
+
+
+def server_env(stub_url: str, max_concurrency: int) -> dict[str, str]:
+    """服务器子进程的环境变量: 上游指向桩服务, 关闭缓存, 放宽准入限制"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")]))
+    env["JIMENG_API_URL"] = stub_url
+    env["JIMENG_API_KEY"] = "bench"
+    env["JIMENG_CACHE"] = "0"
+    env.setdefault("JIMENG_LOG_LEVEL", "WARNING")
+    env.setdefault("JIMENG_MAX_CONCURRENCY", str(max_concurrency))
+    env.setdefault("JIMENG_MAX_QUEUE", str(max_concurrency * 4))
+    return env
+
+
+async def wait_for_http(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"服务未能启动: {url}")
+                await asyncio.sleep(0.1)
+
+
+@contextlib.asynccontextmanager
+async def spawn(args: list[str], env: dict[str, str], ready_url: str):
+    """启动子进程并等待 ready_url 可访问, 退出时终止"""
+    proc = subprocess.Popen(args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await wait_for_http(ready_url)
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+class HttpDriver:
+    """通过 REST 接口调用工具"""
+
+    def __init__(self, base_url: str, tool: str):
+        self.base_url = base_url
+        self.route = HTTP_ROUTES[tool]
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def open(self, concurrency: int) -> None:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        self.client = httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=600)
+
+    async def call(self, worker: int, prompt: str) -> bool:
+        response = await self.client.post(self.route, json={"prompt": prompt})
+        return response.status_code < 400 and response.json().get("success", True) is not False
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class McpDriver:
+    """通过 MCP 客户端会话调用工具
+
+    SSE 模式下每个并发工作者使用独立的会话 (模拟多个客户端);
+    stdio 模式只有一个会话, 并发请求在同一连接上复用。
+    """
+
+    def __init__(self, connect, tool: str, per_worker: bool):
+        self.connect = connect
+        self.tool = tool
+        self.per_worker = per_worker
+        self.sessions: list[Any] = []
+        self._stack: Optional[contextlib.AsyncExitStack] = None
+
+    async def open(self, concurrency: int) -> None:
+        from mcp import ClientSession
+
+        self._stack = contextlib.AsyncExitStack()
+        for _ in range(concurrency if self.per_worker else 1):
+            read, write = await self._stack.enter_async_context(self.connect())
+            session = await self._stack.enter_async_context(ClientSession(read, write))
+            await session.initialize()
+            self.sessions.append(session)
+
+    async def call(self, worker: int, prompt: str) -> bool:
+        session = self.sessions[worker % len(self.sessions)]
+        result = await session.call_tool(self.tool, {"prompt": prompt})
+        return not result.isError
+
+    async def close(self) -> None:
+        self.sessions = []
+        await self._stack.aclose()
+
+
+async def run_level(driver, mode: str, concurrency: int, requests: int, pid_lookup) -> dict[str, Any]:
+    """以固定并发数完成 requests 个请求
+
+    Args:
+        pid_lookup: 返回服务器进程号的函数, 在连接建立后调用
+    """
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker(index: int) -> None:
+        nonlocal errors
+        for n in counter:
+            # 每个请求使用不同的提示词, 避免缓存与请求合并
+            prompt = f"loadtest {mode} c{concurrency} #{n} {time.time_ns()}"
+            start = time.perf_counter()
+            try:
+                ok = await driver.call(index, prompt)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    await driver.open(concurrency)
+    try:
+        await driver.call(0, f"loadtest {mode} warmup {time.time_ns()}")
+        sampler = ProcessSampler(pid_lookup())
+        with sampler:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(i) for i in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        server = sampler.result()
+    finally:
+        await driver.close()
+
+    samples = sorted(s * 1000 for s in latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.mean(samples), 2) if samples else 0.0,
+            "p50": round(percentile(samples, 50), 2),
+            "p95": round(percentile(samples, 95), 2),
+            "p99": round(percentile(samples, 99), 2),
+            "max": round(samples[-1], 2) if samples else 0.0,
+        },
+        "server": server,
+    }
+
+
+async def bench_mode(mode: str, args, stub_url: str, workers: int = 1) -> list[dict[str, Any]]:
+    env = server_env(stub_url, max(args.concurrency))
+    server_args = [sys.executable, "-m", "jimeng_mcp.server", "--mode", mode]
+    label = result_key(mode, workers)
+    results = []
+
+    async def run_levels(driver, pid_lookup) -> None:
+        for concurrency in args.concurrency:
+            requests = max(args.requests, concurrency)
+            level = await run_level(driver, mode, concurrency, requests, pid_lookup)
+            results.append(level)
+            print_level(label, level)
+
+    if mode == "stdio":
+        from mcp.client.stdio import StdioServerParameters, stdio_client
+
+        params = StdioServerParameters(command=server_args[0], args=server_args[1:], env=env)
+        with open(os.devnull, "w") as errlog:
+            driver = McpDriver(lambda: stdio_client(params, errlog=errlog), args.tool, per_worker=False)
+            await run_levels(driver, lambda: find_child_pid("jimeng_mcp.server"))
+        return results
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    ready_url = f"{base_url}/stats" if mode == "sse" else f"{base_url}/health"
+    server_args += ["--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)]
+    # 每次运行使用新的共享状态目录, 不受之前运行留下的任务和租约影响
+    with tempfile.TemporaryDirectory(prefix="jimeng-loadtest-") as state_dir:
+        env["JIMENG_STATE_DIR"] = state_dir
+        async with spawn(server_args, env, ready_url) as proc:
+            if mode == "sse":
+                from mcp.client.sse import sse_client
+
+                driver = McpDriver(lambda: sse_client(f"{base_url}/sse"), args.tool, per_worker=True)
+            else:
+                driver = HttpDriver(base_url, args.tool)
+            await run_levels(driver, lambda: proc.pid)
+    return results
+
+
+def result_key(mode: str, workers: int) -> str:
+    """结果中的键: 单进程为模式名, 多进程为 "模式@N" """
+    return mode if workers <= 1 else f"{mode}@{workers}"
+
+
+def print_level(mode: str, level: dict[str, Any]) -> None:
+    latency = level["latency_ms"]
+    server = level["server"]
+    rss = f"{server['rss_mb_peak']}MB" if server["rss_mb_peak"] is not None else "-"
+    fds = server["fds_peak"] if server["fds_peak"] is not None else "-"
+    print(
+        f"{mode:<8} c={level['concurrency']:<4} {level['throughput_rps']:>9.2f} req/s "
+        f"p50={latency['p50']:>8.1f}ms p95={latency['p95']:>8.1f}ms p99={latency['p99']:>8.1f}ms "
+        f"errors={level['errors']:<4} rss={rss} fds={fds}"
+    )
+
+
+def print_comparison(baseline: dict[str, Any], current: dict[str, Any]) -> None:
+    """按模式和并发数对比吞吐量与 p95 延迟"""
+    print(f"\n📊 与基线对比 ({baseline.get('version')} @ {baseline.get('generated_at')})")
+    for mode, levels in current["results"].items():
+        previous = {level["concurrency"]: level for level in baseline.get("results", {}).get(mode, [])}
+        for level in levels:
+            old = previous.get(level["concurrency"])
+            if old is None:
+                continue
+            rps = level["throughput_rps"] / old["throughput_rps"] - 1 if old["throughput_rps"] else 0.0
+            p95 = level["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1 if old["latency_ms"]["p95"] else 0.0
+            print(f"{mode:<8} c={level['concurrency']:<4} throughput {rps:+7.1%}  p95 {p95:+7.1%}")
+
+
+def print_scaling(results: dict[str, Any], modes: list[str], workers: list[int]) -> None:
+    """各并发级别下吞吐量相对单工作进程的倍数"""
+    print("\n📈 吞吐量随工作进程数的变化 (相对1个工作进程)")
+    for mode in modes:
+        if mode == "stdio" or mode not in results:
+            continue
+        baseline = {level["concurrency"]: level["throughput_rps"] for level in results[mode]}
+        for count in workers:
+            if count <= 1:
+                continue
+            for level in results[result_key(mode, count)]:
+                base = baseline.get(level["concurrency"])
+                ratio = f"{level['throughput_rps'] / base:5.2f}x" if base else "    -"
+                print(f"{mode:<6} workers={count:<3} c={level['concurrency']:<4} {ratio}")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCH_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main_async(args) -> dict[str, Any]:
+    sys.path.insert(0, SRC_DIR)
+    from jimeng_mcp import __version__
+
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub_args = [
+        sys.executable, os.path.join(BENCH_DIR, "stub_upstream.py"),
+        "--port", str(stub_port), "--latency", args.latency, "--error-rate", str(args.error_rate),
+    ]
+    if args.video_latency:
+        stub_args += ["--video-latency", args.video_latency]
+
+    report: dict[str, Any] = {
+        "version": __version__,
+        "git_revision": git_revision(),
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "tool": args.tool,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "requests": args.requests,
+            "latency": args.latency,
+            "video_latency": args.video_latency,
+            "error_rate": args.error_rate,
+        },
+        "results": {},
+    }
+    # 桩服务单独运行在子进程中, 不与负载生成器争用事件循环
+    async with spawn(stub_args, dict(os.environ), f"{stub_url}/stats"):
+        for mode in args.modes:
+            # stdio 只有一个进程, 不参与多工作进程对比
+            for workers in ([1] if mode == "stdio" else args.workers):
+                print(f"\n🚀 {mode} 模式, {workers} 个工作进程")
+                report["results"][result_key(mode, workers)] = await bench_mode(mode, args, stub_url, workers)
+        if len(args.workers) > 1:
+            print_scaling(report["results"], args.modes, args.workers)
+        async with httpx.AsyncClient() as client:
+            report["stub"] = (await client.get(f"{stub_url}/stats")).json()
+    return report
+
+
+def parse_args(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="即梦MCP服务器负载测试")
+    parser.add_argument("--modes", default="http,sse,stdio", help="逗号分隔的模式 (默认: http,sse,stdio)")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="逗号分隔的并发数 (默认: 1,4,16,64)")
+    parser.add_argument("--requests", type=int, default=200, help="每个并发级别的请求数 (默认: 200)")
+    parser.add_argument(
+        "--workers", default="1",
+        help="逗号分隔的SSE/HTTP工作进程数, 如 1,2,4 对比吞吐量随进程数的变化 (默认: 1)",
+    )
+    parser.add_argument("--tool", choices=sorted(HTTP_ROUTES), default="text_to_image")
+    parser.add_argument("--output", default=None, help="结果JSON文件路径")
+    parser.add_argument("--compare", default=None, help="用于对比的基线结果JSON文件")
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"未知的模式: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    args.workers = sorted({int(w) for w in args.workers.split(",") if w.strip()})
+    if 1 not in args.workers and len(args.workers) > 1:
+        args.workers.insert(0, 1)
+    return args
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    report = asyncio.run(main_async(args))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已写入 {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+本地即梦API桩服务
+
+模拟 jimeng-free-api-all 的接口, 用于在不访问真实服务的情况下
+测量本MCP服务器自身的开销。
+
+延迟用分布描述, 格式为 "分布:参数" (单位: 秒):
+- 0.05 或 fixed:0.05        固定延迟
+- uniform:0.5,2             在 [0.5, 2] 内均匀分布
+- normal:1,0.2              均值 1, 标准差 0.2 (截断到 0 以上)
+- lognormal:1,0.5           中位数 1, 对数标准差 0.5 (长尾, 接近真实生成耗时)
+- exp:1                     均值 1 的指数分布
+
+运行:
+    python benchmarks/stub_upstream.py --port 9100 --latency 0.05
+    python benchmarks/stub_upstream.py --latency lognormal:0.5,0.4 --video-latency lognormal:3,0.5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import math
+import random
+import time
+from typing import Callable, Optional, Union
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+import uvicorn
+
+# /v1/models 返回的模型列表
+STUB_MODELS = ("jimeng-4.5", "jimeng-4.1", "jimeng-4.0", "jimeng-video-3.0", "jimeng-video-3.0-pro")
+
+LatencySpec = Union[float, str, None]
+
+
+def parse_latency(spec: LatencySpec) -> Callable[[], float]:
+    """把延迟描述解析为采样函数, 返回值不小于 0"""
+    if spec is None or spec == "":
+        return lambda: 0.0
+    if isinstance(spec, (int, float)):
+        value = float(spec)
+        return lambda: value
+
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    try:
+        args = [float(p) for p in params.split(",")]
+    except ValueError:
+        raise ValueError(f"无效的延迟参数: {spec}") from None
+    kind = kind.strip().lower()
+
+    if kind == "fixed" and len(args) == 1:
+        sample = lambda: args[0]
+    elif kind == "uniform" and len(args) == 2:
+        sample = lambda: random.uniform(args[0], args[1])
+    elif kind == "normal" and len(args) == 2:
+        sample = lambda: random.gauss(args[0], args[1])
+    elif kind == "lognormal" and len(args) == 2:
+        mu = math.log(args[0])
+        sample = lambda: random.lognormvariate(mu, args[1])
+    elif kind == "exp" and len(args) == 1:
+        sample = lambda: random.expovariate(1 / args[0]) if args[0] > 0 else 0.0
+    else:
+        raise ValueError(f"无效的延迟分布: {spec}")
+    return lambda: max(0.0, sample())
+
+
+def create_stub_app(
+    latency: LatencySpec = 0.0,
+    video_latency: LatencySpec = None,
+    error_rate: float = 0.0,
+) -> Starlette:
+    """创建桩服务应用
+
+    Args:
+        latency: 图像生成请求的延迟描述, 见模块说明
+        video_latency: 视频生成请求的延迟描述, 默认与 latency 相同
+        error_rate: 按比例返回 503, 用于观察重试和熔断
+    """
+    image_delay = parse_latency(latency)
+    video_delay = parse_latency(video_latency) if video_latency is not None else image_delay
+    stats = {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def generation_handler(delay: Callable[[], float], suffix: str):
+        async def handle_generation(request: Request):
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            try:
+                body = await request.json()
+                seconds = delay()
+                if seconds:
+                    await asyncio.sleep(seconds)
+                if error_rate and random.random() < error_rate:
+                    stats["errors"] += 1
+                    return JSONResponse({"error": "stub unavailable"}, status_code=503)
+                return JSONResponse({
+                    "created": int(time.time()),
+                    "data": [{
+                        "url": f"https://stub.local/{stats['requests']}.{suffix}",
+                        "revised_prompt": body.get("prompt", ""),
+                    }],
+                })
+            finally:
+                stats["in_flight"] -= 1
+
+        return handle_generation
+
+    async def handle_models(request: Request):
+        return JSONResponse({
+            "object": "list",
+            "data": [
+                {"id": model, "object": "model", "owned_by": "jimeng-stub"} for model in STUB_MODELS
+            ],
+        })
+
+    async def handle_stats(request: Request):
+        return JSONResponse(stats)
+
+    image_handler = generation_handler(image_delay, "png")
+    app = Starlette(routes=[
+        Route("/v1/images/generations", image_handler, methods=["POST"]),
+        Route("/v1/images/compositions", image_handler, methods=["POST"]),
+        Route("/v1/videos/generations", generation_handler(video_delay, "mp4"), methods=["POST"]),
+        Route("/v1/models", handle_models, methods=["GET"]),
+        Route("/stats", handle_stats, methods=["GET"]),
+    ])
+    app.state.stats = stats
+    return app
+
+
+@contextlib.asynccontextmanager
+async def run_stub_in_background(host: str = "127.0.0.1", port: int = 9100, **kwargs):
+    """在当前事件循环中后台运行桩服务, 退出上下文时关闭"""
+    app = create_stub_app(**kwargs)
+    config = uvicorn.Config(app, host=host, port=port, log_level="warning")
+    stub = uvicorn.Server(config)
+    task = asyncio.create_task(stub.serve())
+    while not stub.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield app
+    finally:
+        stub.should_exit = True
+        await task
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    """桩服务的延迟与错误率参数, 与负载测试共用"""
+    parser.add_argument("--latency", default="0", help="图像请求的延迟分布, 如 0.05 或 lognormal:0.5,0.4")
+    parser.add_argument("--video-latency", default=None, help="视频请求的延迟分布 (默认同 --latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的比例, 0~1")
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="本地即梦API桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+    app = create_stub_app(
+        latency=args.latency, video_latency=args.video_latency, error_rate=args.error_rate
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
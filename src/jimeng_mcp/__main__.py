@@ -0,0 +1,5 @@
+"""python -m jimeng_mcp 入口"""
+
+from .cli import main
+
+main()
@@ -0,0 +1,275 @@
+"""
+准入控制与背压
+
+限制每个工具同时发往上游的请求数, 超出的请求进入有界等待队列。
+队列已满或排队超时时立即拒绝, 并根据近期的完成速率估算建议的重试时间,
+避免突发流量压垮上游或让内存无限增长。
+
+后台任务 (jobs.py) 在提交时已经以202接受, 不能再因排队被拒绝: 在 background()
+代码块内获取槽位的请求进入单独的后台队列, 不受队列长度和排队时间限制, 也不占用
+交互请求的队列名额; 槽位释放时优先移交给排队的交互请求 (它们有排队超时), 然后才是后台任务。
+
+环境变量:
+- JIMENG_MAX_CONCURRENCY: 每个工具的最大并发上游请求数 (默认: 16)
+- JIMENG_MAX_CONCURRENCY_<TOOL>: 覆盖单个工具的并发数, 如 JIMENG_MAX_CONCURRENCY_TEXT_TO_VIDEO
+- JIMENG_MAX_QUEUE: 每个工具的最大排队请求数 (默认: 64)
+- JIMENG_MAX_QUEUE_TIME: 最长排队时间(秒) (默认: 60)
+
+多工作进程模式 (JIMENG_WORKERS > 1) 下, 并发上限和队列长度是整个服务的总量,
+平分给各工作进程 (向上取整, 至少为1), 所有进程合计约为配置的值。
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import math
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from .errors import StructuredToolError
+
+# 用于估算完成速率的最近完成记录数
+_DRAIN_WINDOW = 50
+
+# 当前代码块是否在后台任务中执行
+_background: contextvars.ContextVar[bool] = contextvars.ContextVar("jimeng_admission_background", default=False)
+
+
+@contextlib.contextmanager
+def background():
+    """在代码块内获取的槽位按后台任务排队, 不会因队列已满或排队超时被拒绝"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class AdmissionRejected(StructuredToolError):
+    """请求未被准入 (队列已满或排队超时)"""
+
+    def __init__(self, tool: str, reason: str, retry_after: float, queue_depth: int):
+        if reason == "queue_full":
+            message = f"{tool} 请求过多, 等待队列已满, 请 {retry_after:.0f} 秒后重试"
+        else:
+            message = f"{tool} 排队超时, 上游繁忙, 请 {retry_after:.0f} 秒后重试"
+        super().__init__(
+            message,
+            tool=tool,
+            reason=reason,
+            retry_after=retry_after,
+            queue_depth=queue_depth,
+        )
+        self.tool = tool
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def code(self) -> str:
+        return self.reason
+
+    @property
+    def status_code(self) -> int:
+        return 429 if self.reason == "queue_full" else 503
+
+    def headers(self) -> dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class ToolGate:
+    """单个工具的并发限制和有界等待队列"""
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_queue_time: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        # 后台任务的等待队列, 不受 max_queue 和 max_queue_time 限制
+        self._background: deque[asyncio.Future] = deque()
+        self._completions: deque[float] = deque(maxlen=_DRAIN_WINDOW)
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def background_depth(self) -> int:
+        return len(self._background)
+
+    def drain_rate(self) -> float:
+        """近期每秒完成的请求数, 没有足够数据时返回0"""
+        if len(self._completions) < 2:
+            return 0.0
+        span = time.monotonic() - self._completions[0]
+        return len(self._completions) / span if span > 0 else 0.0
+
+    def retry_after(self) -> float:
+        """按当前排队长度和完成速率估算需要等待的秒数"""
+        rate = self.drain_rate()
+        if rate <= 0:
+            return self.max_queue_time
+        return min(max(1.0, (self.queue_depth + 1) / rate), self.max_queue_time * 10)
+
+    async def acquire(self, background: bool = False) -> None:
+        """获取一个并发槽位, 必要时排队等待
+
+        Args:
+            background: 是否为后台任务; 后台任务一直排队直到获得槽位, 不会被拒绝
+        """
+        if self.active < self.limit and not self._waiters and not self._background:
+            self.active += 1
+            self._record_wait(0.0)
+            return
+
+        if background:
+            await self._acquire_background()
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self.name, "queue_full", self.retry_after(), self.queue_depth)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_queue_time)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                self.timed_out += 1
+                raise AdmissionRejected(
+                    self.name, "queue_timeout", self.retry_after(), self.queue_depth
+                ) from None
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                # 槽位已经移交给本请求, 需要归还
+                self.release()
+            raise
+        self._record_wait(time.monotonic() - start)
+
+    async def _acquire_background(self) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        self._background.append(waiter)
+        start = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                with contextlib.suppress(ValueError):
+                    self._background.remove(waiter)
+            raise
+        self._record_wait(time.monotonic() - start)
+
+    def release(self) -> None:
+        """归还槽位, 有排队请求时直接移交给队首, 交互请求优先于后台任务"""
+        self._completions.append(time.monotonic())
+        for waiters in (self._waiters, self._background):
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.active -= 1
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "background_depth": self.background_depth,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_time_avg": round(self.wait_time_total / self.admitted, 4) if self.admitted else 0.0,
+            "wait_time_max": round(self.wait_time_max, 4),
+            "drain_rate": round(self.drain_rate(), 4),
+        }
+
+    def _abandon(self, waiter: asyncio.Future) -> bool:
+        """放弃排队; 如果槽位已经移交给该等待者则返回True"""
+        if waiter.done() and not waiter.cancelled():
+            return True
+        waiter.cancel()
+        with contextlib.suppress(ValueError):
+            self._waiters.remove(waiter)
+        return False
+
+    def _record_wait(self, waited: float) -> None:
+        self.admitted += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+
+
+class AdmissionController:
+    """按工具划分的准入控制"""
+
+    def __init__(
+        self,
+        limit: int = 16,
+        max_queue: int = 64,
+        max_queue_time: float = 60.0,
+        limits: Optional[dict[str, int]] = None,
+    ):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.limits = dict(limits or {})
+        self._gates: dict[str, ToolGate] = {}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """根据环境变量创建"""
+        workers = max(1, int(os.getenv("JIMENG_WORKERS", "1")))
+
+        def share(total: int) -> int:
+            return max(1, math.ceil(total / workers))
+
+        prefix = "JIMENG_MAX_CONCURRENCY_"
+        limits = {
+            name[len(prefix):].lower(): share(int(value))
+            for name, value in os.environ.items()
+            if name.startswith(prefix) and value
+        }
+        return cls(
+            limit=share(int(os.getenv("JIMENG_MAX_CONCURRENCY", "16"))),
+            max_queue=share(int(os.getenv("JIMENG_MAX_QUEUE", "64"))),
+            max_queue_time=float(os.getenv("JIMENG_MAX_QUEUE_TIME", "60")),
+            limits=limits,
+        )
+
+    def gate(self, tool: str) -> ToolGate:
+        gate = self._gates.get(tool)
+        if gate is None:
+            gate = ToolGate(
+                tool,
+                self.limits.get(tool, self.limit),
+                self.max_queue,
+                self.max_queue_time,
+            )
+            self._gates[tool] = gate
+        return gate
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tool: str) -> AsyncIterator[None]:
+        """在并发槽位内执行代码块; 在 background() 内调用时按后台任务排队"""
+        gate = self.gate(tool)
+        await gate.acquire(background=_background.get())
+        try:
+            yield
+        finally:
+            gate.release()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {name: gate.stats() for name, gate in self._gates.items()}
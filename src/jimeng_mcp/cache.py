@@ -0,0 +1,222 @@
+"""
+生成结果缓存
+
+以规范化请求参数的哈希为键缓存上游返回结果, 相同的提示词、宽高比、分辨率、
+精细度和模型再次请求时直接返回, 不再占用上游额度。
+
+- 内存层: LRU, 同时受条目数和字节数预算约束
+- 持久层: 可选的SQLite文件, 服务重启后仍然有效
+- 过期时间: 取配置的TTL与结果中CDN链接自身过期时间的较小值
+
+环境变量:
+- JIMENG_CACHE: 是否启用结果缓存 (默认: 1)
+- JIMENG_CACHE_MAX_ENTRIES: 内存层最大条目数 (默认: 1000)
+- JIMENG_CACHE_MAX_BYTES: 内存层最大字节数 (默认: 16777216)
+- JIMENG_CACHE_TTL: 缓存有效期(秒), 不应超过CDN链接有效期 (默认: 3600)
+- JIMENG_CACHE_PATH: SQLite持久层文件路径, 为空时只使用内存层 (默认: 空)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
+
+# CDN签名链接中表示过期时间戳的查询参数
+_EXPIRY_PARAMS = ("x-expires", "expires", "Expires", "x-oss-expires")
+
+# 在CDN链接过期前预留的安全时间(秒)
+_EXPIRY_MARGIN = 60
+
+
+def _canonical(value: Any) -> Any:
+    """规范化请求值, 使语义相同的请求得到相同的键"""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def request_key(endpoint: str, data: dict[str, Any]) -> str:
+    """计算请求的内容哈希键"""
+    payload = json.dumps(
+        {"endpoint": endpoint, "data": _canonical(data)},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def url_expiry(url: str) -> Optional[float]:
+    """从CDN签名链接中解析过期时间戳, 无法解析时返回None"""
+    query = parse_qs(urlparse(url).query)
+    for name in _EXPIRY_PARAMS:
+        values = query.get(name)
+        if values:
+            try:
+                return float(values[0])
+            except ValueError:
+                continue
+    return None
+
+
+def result_expiry(result: dict[str, Any], ttl: float, now: Optional[float] = None) -> float:
+    """计算结果的过期时间: 配置TTL与所有链接中最早过期时间的较小值"""
+    now = time.time() if now is None else now
+    expires_at = now + ttl
+    for item in result.get("data", []):
+        expiry = url_expiry(item.get("url", "")) if isinstance(item, dict) else None
+        if expiry is not None:
+            expires_at = min(expires_at, expiry - _EXPIRY_MARGIN)
+    return expires_at
+
+
+class ResultCache:
+    """两级(内存LRU + 可选SQLite)生成结果缓存"""
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 3600,
+        path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path or None
+        self._entries: OrderedDict[str, tuple[float, str, int]] = OrderedDict()
+        self._bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResultCache"]:
+        """根据环境变量创建缓存, 禁用时返回None"""
+        if os.getenv("JIMENG_CACHE", "1").strip().lower() in ("0", "false", "no", "off"):
+            return None
+        return cls(
+            max_entries=int(os.getenv("JIMENG_CACHE_MAX_ENTRIES", "1000")),
+            max_bytes=int(os.getenv("JIMENG_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            ttl=float(os.getenv("JIMENG_CACHE_TTL", "3600")),
+            path=os.getenv("JIMENG_CACHE_PATH", ""),
+        )
+
+    async def get(self, key: str) -> Optional[dict[str, Any]]:
+        """查询缓存, 未命中或已过期时返回None"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, encoded, _ = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(encoded)
+            self._remove(key)
+
+        if self.path:
+            row = await asyncio.to_thread(self._disk_get, key, now)
+            if row is not None:
+                expires_at, encoded = row
+                self._store(key, expires_at, encoded)
+                self.hits += 1
+                self.disk_hits += 1
+                return json.loads(encoded)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, result: dict[str, Any]) -> None:
+        """写入缓存, 已过期的结果不会写入"""
+        expires_at = result_expiry(result, self.ttl)
+        if expires_at <= time.time():
+            return
+        encoded = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+        self._store(key, expires_at, encoded)
+        if self.path:
+            await asyncio.to_thread(self._disk_set, key, expires_at, encoded)
+
+    def stats(self) -> dict[str, Any]:
+        """缓存命中统计"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "persistent": bool(self.path),
+        }
+
+    def close(self) -> None:
+        """关闭持久层连接"""
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _store(self, key: str, expires_at: float, encoded: str) -> None:
+        size = len(encoded.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (expires_at, encoded, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            db.execute("DELETE FROM result_cache WHERE expires_at <= ?", (time.time(),))
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple[float, str]]:
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT expires_at, value FROM result_cache WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _disk_set(self, key: str, expires_at: float, encoded: str) -> None:
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO result_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, encoded, expires_at),
+            )
+            db.commit()
@@ -0,0 +1,78 @@
+"""
+命令行入口
+
+Claude Desktop 等客户端为每个会话启动一个新的 stdio 进程, 启动时间直接影响
+首次调用的等待。这里只做不依赖 MCP SDK 的轻量工作: 加载 .env、解析参数、检查配置;
+配置有效后才导入服务器模块, 并且只导入所选模式需要的传输层
+(SSE/HTTP 模式的 starlette、uvicorn 在 create_sse_app/create_http_app 中导入)。
+
+服务器模块的配置 (上游、缓存、任务记录等) 在导入时从环境变量读取,
+因此 .env 必须在导入之前加载, 服务器模块本身不再加载 .env 或检查密钥。
+
+运行:
+    jimeng-mcp --mode stdio
+    python -m jimeng_mcp --mode http --port 8000
+"""
+
+import argparse
+import asyncio
+import os
+from typing import Optional
+
+
+def load_config() -> None:
+    """加载 .env 并检查必需的配置, 缺少时以错误信息退出"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if not os.getenv("JIMENG_API_KEY", "").strip() and not os.getenv("JIMENG_UPSTREAMS_FILE"):
+        raise SystemExit("❌ JIMENG_API_KEY 环境变量是必需的 (或通过 JIMENG_UPSTREAMS_FILE 指定上游配置)")
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="即梦MCP服务器 - 支持stdio/sse/http三种模式"
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=["stdio", "sse", "http"],
+        default="stdio",
+        help="服务器模式 (默认: stdio)"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="0.0.0.0",
+        help="SSE/HTTP模式的主机地址 (默认: 0.0.0.0)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8000,
+        help="SSE/HTTP模式的端口号 (默认: 8000)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="SSE/HTTP模式的工作进程数, 共享同一端口和本地状态 (默认: JIMENG_WORKERS 或 1)"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """服务器主入口"""
+    args = parse_args(argv)
+    load_config()
+    if args.workers is None:
+        args.workers = int(os.getenv("JIMENG_WORKERS", "1"))
+
+    from . import server
+
+    asyncio.run(server.serve(args))
+
+
+if __name__ == "__main__":
+    main()
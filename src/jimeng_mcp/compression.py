@@ -0,0 +1,158 @@
+"""
+HTTP 响应压缩
+
+HTTP 模式的 JSON 响应 (附带预览图的工具结果、任务列表、运行时统计) 可能较大。
+客户端在 Accept-Encoding 中声明支持时, 不小于 JIMENG_HTTP_COMPRESSION_MIN_SIZE 的响应压缩后返回:
+安装了 brotli (pip install "jimeng-mcp[brotli]") 且客户端接受 br 时使用 br, 否则使用 gzip。
+
+只压缩一次性返回的响应体; 流式响应 (任务事件流、NDJSON 批量结果) 需要逐条送达, 原样返回。
+已设置 Content-Encoding 的响应和图像、视频等本身已压缩的内容 (镜像文件) 也不压缩。
+较大的响应体在线程中压缩, 不阻塞事件循环。
+
+环境变量:
+- JIMENG_HTTP_COMPRESSION: auto (默认, 按 Accept-Encoding 选择 br 或 gzip)、gzip、br 或 off
+- JIMENG_HTTP_COMPRESSION_MIN_SIZE: 压缩的最小响应大小(字节) (默认: 1024)
+"""
+
+import asyncio
+import gzip
+import os
+from typing import Any, Optional
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+BROTLI_AVAILABLE = brotli is not None
+
+# 不压缩的内容类型前缀: 流式事件和本身已压缩的媒体
+_SKIP_TYPES = (b"text/event-stream", b"image/", b"video/", b"audio/", b"application/zip", b"application/gzip")
+
+# 超过该大小的响应体在线程中压缩
+_THREAD_THRESHOLD = 256 * 1024
+
+
+def compression_options() -> Optional[dict[str, Any]]:
+    """根据环境变量得到 CompressionMiddleware 的参数, 未启用时返回None"""
+    mode = os.getenv("JIMENG_HTTP_COMPRESSION", "auto").strip().lower()
+    if mode in ("off", "0", "false", "no", "none"):
+        return None
+    if mode == "auto":
+        encodings = ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+    elif mode == "gzip":
+        encodings = ("gzip",)
+    elif mode == "br":
+        if not BROTLI_AVAILABLE:
+            raise RuntimeError(
+                "JIMENG_HTTP_COMPRESSION=br 需要安装 brotli。\n"
+                "请运行: pip install brotli"
+            )
+        encodings = ("br", "gzip")
+    else:
+        raise ValueError(f"未知的压缩方式: {mode} (可选: auto、gzip、br、off)")
+    return {
+        "encodings": encodings,
+        "minimum_size": int(os.getenv("JIMENG_HTTP_COMPRESSION_MIN_SIZE", "1024")),
+    }
+
+
+def accepted_encoding(header: str, encodings: tuple[str, ...]) -> Optional[str]:
+    """按服务器的偏好顺序选择 Accept-Encoding 中可接受的编码, 都不接受时返回None"""
+    accepted: dict[str, float] = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=4)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class CompressionMiddleware:
+    """压缩一次性返回的大响应体 (ASGI 中间件)"""
+
+    def __init__(self, app, encodings: tuple[str, ...] = ("gzip",), minimum_size: int = 1024):
+        self.app = app
+        self.encodings = encodings
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = b",".join(value for key, value in scope["headers"] if key == b"accept-encoding")
+        encoding = accepted_encoding(header.decode("latin-1"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[dict[str, Any]] = None
+        passthrough = False
+
+        async def send_compressed(message: dict[str, Any]) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # 等到第一段响应体才能决定是否压缩
+                start = message
+                return
+            body = message.get("body", b"")
+            if (
+                message["type"] != "http.response.body"
+                or message.get("more_body", False)
+                or not self._compressible(start, body)
+            ):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) >= _THREAD_THRESHOLD:
+                compressed = await asyncio.to_thread(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            if len(compressed) >= len(body):
+                await send(start)
+                await send(message)
+                return
+            headers = [
+                (key, value) for key, value in start["headers"]
+                if key not in (b"content-length", b"vary")
+            ]
+            vary = [value for key, value in start["headers"] if key == b"vary"]
+            headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _compressible(self, start: dict[str, Any], body: bytes) -> bool:
+        if len(body) < self.minimum_size or start["status"] in (204, 206, 304):
+            return False
+        for key, value in start["headers"]:
+            if key == b"content-encoding":
+                return False
+            if key == b"content-type" and value.lower().startswith(_SKIP_TYPES):
+                return False
+        return True
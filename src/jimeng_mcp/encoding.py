@@ -0,0 +1,47 @@
+"""
+JSON 编码
+
+HTTP 响应、NDJSON 批量结果和任务事件流使用这里的编码函数。
+安装了 orjson (pip install "jimeng-mcp[fast]") 时使用 orjson, 直接得到 UTF-8 字节,
+否则使用标准库 json。两者的输出都是紧凑格式, 非ASCII字符不转义。
+
+orjson 不能序列化的对象 (如 pydantic 模型) 通过 default 转换:
+有 model_dump 方法时使用其结果, 否则转为字符串。
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+ORJSON_AVAILABLE = orjson is not None
+
+
+def _default(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    return str(value)
+
+
+def dumpb(value: Any) -> bytes:
+    """编码为 UTF-8 JSON 字节"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps(value: Any) -> str:
+    """编码为 JSON 字符串"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def loads(data: str | bytes) -> Any:
+    """解码 JSON 字符串或字节"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
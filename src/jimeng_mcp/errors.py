@@ -0,0 +1,32 @@
+"""
+结构化错误
+
+需要让客户端按类型处理的错误 (如排队已满、限流) 统一继承 StructuredToolError:
+- MCP 调用: 错误内容是JSON文档, 并标记为 isError
+- HTTP 调用: 使用对应的状态码和响应头 (如 Retry-After)
+"""
+
+import json
+from typing import Any
+
+
+class StructuredToolError(Exception):
+    """可结构化返回给客户端的工具错误"""
+
+    code = "tool_error"
+    status_code = 500
+
+    def __init__(self, message: str, **details: Any):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+    def headers(self) -> dict[str, str]:
+        """HTTP模式下附加的响应头"""
+        return {}
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"error": {"code": self.code, "message": self.message, **self.details}}
+
+    def __str__(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
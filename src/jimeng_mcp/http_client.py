@@ -0,0 +1,187 @@
+"""
+上游HTTP连接池
+
+整个进程共享一个 httpx.AsyncClient, 复用与即梦API之间的TCP/TLS连接,
+避免每次工具调用都重新进行DNS解析、TCP握手和TLS协商。
+
+如果安装了 h2 (pip install "httpx[http2]"), 默认启用HTTP/2多路复用。
+
+请求地址来自客户端或上游时 (输入图像预检、结果镜像、Webhook 回调), 通过
+internal_target / stream_public 拒绝内网、本机、链路本地和保留地址, 防止借服务器访问内网 (SSRF)。
+
+环境变量:
+- JIMENG_HTTP_MAX_CONNECTIONS: 连接池最大连接数 (默认: 100)
+- JIMENG_HTTP_MAX_KEEPALIVE: 最大空闲保活连接数 (默认: 20)
+- JIMENG_HTTP_KEEPALIVE_EXPIRY: 空闲连接保活时间(秒) (默认: 30)
+- JIMENG_HTTP_CONNECT_TIMEOUT: 建立连接超时(秒) (默认: 10)
+- JIMENG_HTTP2: 是否启用HTTP/2, auto/1/0 (默认: auto, 即安装了h2时启用)
+"""
+
+import asyncio
+import importlib.util
+import ipaddress
+import os
+import socket
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def http2_enabled() -> bool:
+    """根据 JIMENG_HTTP2 和 h2 是否安装决定是否启用HTTP/2"""
+    setting = os.getenv("JIMENG_HTTP2", "auto").strip().lower()
+    if setting in ("0", "false", "no", "off"):
+        return False
+    available = importlib.util.find_spec("h2") is not None
+    if setting in ("1", "true", "yes", "on") and not available:
+        raise RuntimeError(
+            "JIMENG_HTTP2=1 需要安装HTTP/2支持。\n"
+            "请运行: pip install \"httpx[http2]\""
+        )
+    return available
+
+
+def build_limits() -> httpx.Limits:
+    """根据环境变量构建连接池限制"""
+    return httpx.Limits(
+        max_connections=_env_int("JIMENG_HTTP_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=_env_int("JIMENG_HTTP_MAX_KEEPALIVE", 20),
+        keepalive_expiry=_env_float("JIMENG_HTTP_KEEPALIVE_EXPIRY", 30.0),
+    )
+
+
+def connect_timeout() -> float:
+    """建立连接的超时(秒)"""
+    return _env_float("JIMENG_HTTP_CONNECT_TIMEOUT", 10.0)
+
+
+def request_timeout(total: float) -> httpx.Timeout:
+    """单次请求的超时: 总超时为 total, 连接建立阶段仍受 JIMENG_HTTP_CONNECT_TIMEOUT 约束
+
+    httpx 的 timeout 参数会整体替换客户端的默认超时, 直接传数字会使连接超时也变成 total,
+    所以调用方应通过这里构造超时。
+    """
+    return httpx.Timeout(total, connect=min(total, connect_timeout()))
+
+
+class InternalAddressError(ValueError):
+    """请求目标是内网或本机地址"""
+
+
+def public_address(address: str) -> bool:
+    """IP地址是否为公网地址; 内网、本机、链路本地、保留和组播地址都不是"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def internal_host(host: str) -> bool:
+    """不经解析即可判断的内部主机: localhost 或非公网的IP字面量"""
+    if host == "localhost" or host.endswith(".localhost"):
+        return True
+    try:
+        return not public_address(host)
+    except ValueError:
+        return False
+
+
+async def resolve_host(host: str, port: int) -> list[str]:
+    """解析主机名得到的全部IP地址"""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+async def internal_target(url: str, allowed_hosts: frozenset[str] = frozenset()) -> Optional[str]:
+    """URL 的主机是内网或本机地址 (或解析到这类地址) 时返回原因, 否则返回None
+
+    allowed_hosts 中的主机不检查。解析失败时返回None, 由随后的请求报告连接错误。
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host in allowed_hosts:
+        return None
+    if internal_host(host):
+        return f"主机 {host} 是内网或本机地址"
+    try:
+        addresses = await resolve_host(host, parts.port or (443 if parts.scheme == "https" else 80))
+    except (OSError, UnicodeError):
+        return None
+    for address in addresses:
+        if not public_address(address):
+            return f"主机 {host} 解析到内网或本机地址 {address}"
+    return None
+
+
+@asynccontextmanager
+async def stream_public(
+    client: httpx.AsyncClient, method: str, url: str, **kwargs
+) -> AsyncIterator[httpx.Response]:
+    """流式请求公网地址, 手动跟随重定向, 每一跳发出前都检查目标地址
+
+    Raises:
+        InternalAddressError: 初始地址或某一跳重定向指向内网或本机地址
+        httpx.TooManyRedirects: 重定向次数超过客户端的 max_redirects
+    """
+    request = client.build_request(method, url, **kwargs)
+    for _ in range(client.max_redirects + 1):
+        reason = await internal_target(str(request.url))
+        if reason is not None:
+            raise InternalAddressError(reason)
+        response = await client.send(request, stream=True, follow_redirects=False)
+        if response.next_request is None:
+            try:
+                yield response
+            finally:
+                await response.aclose()
+            return
+        request = response.next_request
+        await response.aclose()
+    raise httpx.TooManyRedirects("重定向次数过多", request=request)
+
+
+def create_http_client(**kwargs) -> httpx.AsyncClient:
+    """创建配置好连接池的 AsyncClient
+
+    单次请求的总超时在调用时通过 timeout=request_timeout(...) 覆盖,
+    这里的默认超时只约束连接建立阶段。
+    """
+    kwargs.setdefault("limits", build_limits())
+    kwargs.setdefault("http2", http2_enabled())
+    kwargs.setdefault("timeout", request_timeout(300.0))
+    return httpx.AsyncClient(**kwargs)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取进程级共享的 AsyncClient, 首次调用时创建"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def open_http_client() -> httpx.AsyncClient:
+    """在服务器启动时预先创建共享客户端"""
+    return get_http_client()
+
+
+async def close_http_client() -> None:
+    """关闭共享客户端并释放所有连接, 在服务器退出时调用"""
+    global _client
+    client, _client = _client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
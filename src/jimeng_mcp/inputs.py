@@ -0,0 +1,223 @@
+"""
+本地文件与 base64 图像输入
+
+image_composition.images 和 image_to_video.file_paths 除URL外还接受:
+- 本地文件路径 (需位于 JIMENG_INPUT_ALLOWED_DIRS 之内)
+- file:// URI (同上)
+- base64 数据: data:image/png;base64,... 或纯 base64 字符串
+
+即梦只能读取可访问的URL, 因此这些输入以内容 SHA-256 为键写入镜像存储
+(见 mirror.py), 再以镜像链接传给即梦。已处理过的输入会被记住:
+本地文件按 (路径, 大小, 修改时间), base64 按其文本的哈希, 再次引用时直接复用链接,
+不再读取和写入。文件按块读取、解码和写入, 不会整体读入内存。
+
+需要启用 JIMENG_MIRROR, 并设置 JIMENG_PUBLIC_BASE_URL 或 JIMENG_MIRROR_URL_PREFIX,
+使即梦能够访问这些文件。只接受 PNG/JPEG/WebP/GIF/BMP 图像。
+
+环境变量:
+- JIMENG_INPUT_ALLOWED_DIRS: 允许读取的本地目录, 逗号分隔 (默认: 空, 不接受本地路径)
+- JIMENG_INPUT_MAX_BYTES: 单个输入文件大小上限 (默认: 52428800)
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+from urllib.parse import unquote, urlparse
+from urllib.request import url2pathname
+
+from .mirror import AssetMirror
+from .upstream import split_list
+
+# 每次读取的字节数; base64 按 4 的倍数切分, 解码后同样约为这个大小
+_CHUNK_SIZE = 256 * 1024
+_B64_CHUNK = _CHUNK_SIZE // 3 * 4
+
+# 记住已处理输入的数量上限
+_MAX_REMEMBERED = 4096
+
+_DATA_URL = re.compile(r"^data:([\w/+.-]*)(;[\w=-]+)*;base64,", re.IGNORECASE)
+_BASE64_TEXT = re.compile(r"^[A-Za-z0-9+/\s]+={0,2}\s*$")
+
+# 文件头 → (扩展名, Content-Type)
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png", "image/png"),
+    (b"\xff\xd8\xff", ".jpg", "image/jpeg"),
+    (b"GIF87a", ".gif", "image/gif"),
+    (b"GIF89a", ".gif", "image/gif"),
+    (b"BM", ".bmp", "image/bmp"),
+)
+
+
+def sniff_image(head: bytes) -> Optional[tuple[str, str]]:
+    """根据文件头识别图像格式, 返回 (扩展名, Content-Type), 不是支持的图像时返回None"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp", "image/webp"
+    for signature, extension, content_type in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension, content_type
+    return None
+
+
+def is_remote(value: str) -> bool:
+    return value.startswith(("http://", "https://"))
+
+
+class InputResolver:
+    """把本地文件和 base64 输入转换为即梦可访问的URL"""
+
+    def __init__(
+        self,
+        mirror: Optional[AssetMirror],
+        allowed_dirs: Optional[list[str]] = None,
+        max_bytes: int = 50 * 1024 * 1024,
+    ):
+        self.mirror = mirror
+        self.allowed_dirs = [os.path.realpath(d) for d in allowed_dirs or []]
+        self.max_bytes = max_bytes
+        self._remembered: OrderedDict[tuple, str] = OrderedDict()
+        self.uploads = 0
+        self.reused = 0
+
+    @classmethod
+    def from_env(cls, mirror: Optional[AssetMirror]) -> "InputResolver":
+        return cls(
+            mirror,
+            allowed_dirs=split_list(os.getenv("JIMENG_INPUT_ALLOWED_DIRS")),
+            max_bytes=int(os.getenv("JIMENG_INPUT_MAX_BYTES", str(50 * 1024 * 1024))),
+        )
+
+    async def resolve_all(self, values: list[str]) -> list[str]:
+        """按原顺序转换一组输入, URL 原样返回"""
+        if all(is_remote(value) for value in values):
+            return list(values)
+        return list(await asyncio.gather(*(self.resolve(value) for value in values)))
+
+    async def resolve(self, value: str) -> str:
+        """转换单个输入
+
+        Raises:
+            ValueError: 输入无效、不是图像、不在允许的目录或未配置可访问的镜像
+        """
+        value = value.strip()
+        if is_remote(value):
+            return value
+        if value.startswith("data:"):
+            return await self._from_base64(value)
+        if value.startswith("file://"):
+            parsed = urlparse(value)
+            return await self._from_file(url2pathname(unquote(parsed.path)))
+        if _looks_like_path(value):
+            return await self._from_file(value)
+        if len(value) >= 64 and _BASE64_TEXT.match(value):
+            return await self._from_base64(value)
+        raise ValueError(f"无法识别的图像输入: {value[:80]}, 应为URL、本地路径、file:// URI 或 base64 数据")
+
+    async def _from_file(self, path: str) -> str:
+        real = os.path.realpath(os.path.expanduser(path))
+        if not self.allowed_dirs:
+            raise ValueError("读取本地文件需要设置 JIMENG_INPUT_ALLOWED_DIRS")
+        if not any(_within(real, root) for root in self.allowed_dirs):
+            raise ValueError(f"本地文件不在允许的目录内: {path}")
+        try:
+            stat = await asyncio.to_thread(os.stat, real)
+        except OSError:
+            raise ValueError(f"本地文件不存在: {path}") from None
+        if stat.st_size > self.max_bytes:
+            raise ValueError(f"本地文件过大: {stat.st_size} 字节, 上限 {self.max_bytes}")
+
+        # 文件未变化时直接复用上次的链接
+        memo = ("file", real, stat.st_size, stat.st_mtime_ns)
+        url = self._recall(memo)
+        if url is None:
+            url = await self._store(_read_file(real), real)
+            self._remember(memo, url)
+        return url
+
+    async def _from_base64(self, value: str) -> str:
+        match = _DATA_URL.match(value)
+        text = value[match.end():] if match else value
+        if len(text) * 3 // 4 > self.max_bytes:
+            raise ValueError(f"base64 数据过大, 上限 {self.max_bytes} 字节")
+
+        memo = ("base64", hashlib.sha256(text.encode("ascii", "ignore")).hexdigest())
+        url = self._recall(memo)
+        if url is None:
+            url = await self._store(_decode_base64(text), "base64")
+            self._remember(memo, url)
+        return url
+
+    async def _store(self, chunks: AsyncIterator[bytes], source: str) -> str:
+        if self.mirror is None or not self.mirror.public:
+            raise ValueError(
+                "本地文件和 base64 输入需要启用 JIMENG_MIRROR, "
+                "并设置 JIMENG_PUBLIC_BASE_URL 或 JIMENG_MIRROR_URL_PREFIX 使即梦可以访问"
+            )
+        # 先读取第一块识别图像格式, 不是图像时不写入存储
+        first = await anext(chunks, b"")
+        kind = sniff_image(first)
+        if kind is None:
+            await chunks.aclose()
+            raise ValueError("输入不是支持的图像格式 (PNG/JPEG/WebP/GIF/BMP)")
+        extension, content_type = kind
+        asset = await self.mirror.store(_prepend(first, chunks), source, extension, content_type)
+        self.uploads += 1
+        return asset.url
+
+    def _recall(self, memo: tuple) -> Optional[str]:
+        url = self._remembered.get(memo)
+        if url is not None:
+            self._remembered.move_to_end(memo)
+            self.reused += 1
+        return url
+
+    def _remember(self, memo: tuple, url: str) -> None:
+        self._remembered[memo] = url
+        while len(self._remembered) > _MAX_REMEMBERED:
+            self._remembered.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        return {"uploads": self.uploads, "reused": self.reused, "remembered": len(self._remembered)}
+
+
+def _looks_like_path(value: str) -> bool:
+    return (
+        value.startswith(("/", "./", "../", "~", "\\\\"))
+        or re.match(r"^[A-Za-z]:[\\/]", value) is not None
+    )
+
+
+def _within(path: str, root: str) -> bool:
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:
+        return False
+
+
+async def _read_file(path: str) -> AsyncIterator[bytes]:
+    with await asyncio.to_thread(open, path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, _CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def _prepend(first: bytes, rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+
+async def _decode_base64(text: str) -> AsyncIterator[bytes]:
+    # 去掉换行等空白后按 4 的倍数切分, 每段单独解码
+    text = "".join(text.split())
+    try:
+        for start in range(0, len(text), _B64_CHUNK):
+            yield base64.b64decode(text[start:start + _B64_CHUNK], validate=True)
+    except binascii.Error:
+        raise ValueError("无效的 base64 数据") from None
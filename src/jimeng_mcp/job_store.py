@@ -0,0 +1,268 @@
+"""
+任务持久化
+
+把每次生成请求 (异步任务和直接的工具调用) 记录到 SQLite 文件 (WAL 模式):
+状态、参数、时间戳、结果 (内容列表和结构化结果) 和结果链接。服务重启后, 已完成任务的结果仍可查询,
+未完成的异步任务按 JIMENG_JOB_RECOVERY 重新执行或标记为失败 (见 jobs.py)。
+
+写入是批量的: 状态变化只放入内存中的待写队列 (同一任务的多次变化合并为一行),
+由后台线程每隔 JIMENG_JOB_STORE_FLUSH_INTERVAL 秒在一个事务中写入,
+请求路径上没有磁盘IO。进程退出时 close() 写入剩余的变化。
+
+每行记录写入它的进程 (owner)。多个工作进程共享同一文件时, 启动恢复只认领
+持有进程已经退出的未完成任务, 并以条件更新保证每个任务只被一个进程认领。
+
+环境变量:
+- JIMENG_JOB_STORE_PATH: SQLite 文件路径, 为空时不持久化 (默认: 空)
+- JIMENG_JOB_STORE_FLUSH_INTERVAL: 批量写入间隔(秒) (默认: 0.2)
+- JIMENG_JOB_STORE_TTL: 已结束任务在文件中的保留时间(秒) (默认: 604800)
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from mcp.types import EmbeddedResource, ImageContent, TextContent
+
+from .jobs import Job, JobStatus
+from .shared import new_owner, owner_alive
+from .tools import ToolResult
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = (
+    "id", "tool", "arguments", "status", "created_at", "started_at", "finished_at",
+    "result", "urls", "error", "client_id", "background", "attempts", "structured", "owner",
+)
+
+_CONTENT_TYPES = {"text": TextContent, "image": ImageContent, "resource": EmbeddedResource}
+
+_UNFINISHED = tuple(status.value for status in JobStatus if not status.finished)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def job_row(job: Job) -> tuple:
+    """任务当前状态对应的数据库行"""
+    result = None
+    if job.result is not None:
+        result = _dumps([
+            item.model_dump(exclude_none=True) if hasattr(item, "model_dump") else item
+            for item in job.result
+        ])
+    structured = getattr(job.result, "structured", None)
+    return (
+        job.id, job.tool, _dumps(job.arguments), job.status.value,
+        job.created_at, job.started_at, job.finished_at,
+        result, _dumps(job.urls), job.error, job.client_id,
+        int(job.background), job.attempts,
+        _dumps(structured) if structured is not None else None,
+    )
+
+
+def row_job(row: tuple) -> Job:
+    """从数据库行还原任务"""
+    values = dict(zip(_COLUMNS, row))
+    result = None
+    if values["result"] is not None:
+        result = [
+            _CONTENT_TYPES[item.get("type")].model_validate(item)
+            if item.get("type") in _CONTENT_TYPES else item
+            for item in json.loads(values["result"])
+        ]
+    if values["structured"] is not None:
+        result = ToolResult(result or [], json.loads(values["structured"]))
+    return Job(
+        id=values["id"],
+        tool=values["tool"],
+        arguments=json.loads(values["arguments"]),
+        status=JobStatus(values["status"]),
+        created_at=values["created_at"],
+        started_at=values["started_at"],
+        finished_at=values["finished_at"],
+        result=result,
+        error=values["error"],
+        client_id=values["client_id"],
+        background=bool(values["background"]),
+        attempts=values["attempts"],
+    )
+
+
+class JobStore:
+    """SQLite 任务记录, 写入由后台线程批量完成"""
+
+    def __init__(self, path: str, flush_interval: float = 0.2, ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.owner = new_owner()
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        # 待写入的行, 同一任务只保留最新状态
+        self._pending: dict[str, tuple] = {}
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._closed = False
+        self._writer: Optional[threading.Thread] = None
+        self.writes = 0
+        self.flushes = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["JobStore"]:
+        """根据环境变量创建, 未配置路径时返回None"""
+        path = os.getenv("JIMENG_JOB_STORE_PATH", "").strip()
+        if not path:
+            return None
+        return cls(
+            path,
+            flush_interval=float(os.getenv("JIMENG_JOB_STORE_FLUSH_INTERVAL", "0.2")),
+            ttl=float(os.getenv("JIMENG_JOB_STORE_TTL", str(7 * 24 * 3600))),
+        )
+
+    def save(self, job: Job) -> None:
+        """记录任务当前状态, 不等待写入磁盘"""
+        row = (*job_row(job), self.owner)
+        with self._pending_lock:
+            self._pending[job.id] = row
+            if self._writer is None and not self._closed:
+                self._writer = threading.Thread(target=self._run, name="jimeng-job-store", daemon=True)
+                self._writer.start()
+        self._wakeup.set()
+
+    def load(self, job_id: str) -> Optional[Job]:
+        """按ID读取任务, 包括尚未写入磁盘的状态"""
+        with self._pending_lock:
+            row = self._pending.get(job_id)
+        if row is None:
+            with self._db_lock:
+                row = self._connect().execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+        return row_job(row) if row is not None else None
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> list[Job]:
+        """按创建时间倒序列出任务"""
+        query = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+        params: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._db_lock:
+            rows = {row[0]: row for row in self._connect().execute(query, (*params, limit))}
+        with self._pending_lock:
+            rows.update(self._pending)
+        jobs = [row_job(row) for row in rows.values()]
+        if status:
+            jobs = [job for job in jobs if job.status.value == status]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)[:limit]
+
+    def claim_unfinished(self) -> list[Job]:
+        """认领持有进程已退出的未完成任务, 按创建时间排序"""
+        with self._db_lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = db.execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE status IN "
+                    f"({', '.join('?' for _ in _UNFINISHED)}) ORDER BY created_at",
+                    _UNFINISHED,
+                ).fetchall()
+                rows = [row for row in rows if not owner_alive(row[-1], self.owner)]
+                db.executemany(
+                    "UPDATE jobs SET owner = ? WHERE id = ?", [(self.owner, row[0]) for row in rows]
+                )
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+        return [row_job(row) for row in rows]
+
+    def flush(self) -> int:
+        """把待写入的行写入磁盘, 返回写入的行数"""
+        with self._pending_lock:
+            rows = list(self._pending.values())
+            self._pending.clear()
+        if not rows:
+            return 0
+        with self._db_lock:
+            db = self._connect()
+            with db:
+                db.executemany(
+                    f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                    rows,
+                )
+        self.writes += len(rows)
+        self.flushes += 1
+        return len(rows)
+
+    def stats(self) -> dict[str, Any]:
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {"pending": pending, "writes": self.writes, "flushes": self.flushes}
+
+    def close(self) -> None:
+        """停止后台写入线程, 写入剩余的变化并关闭连接"""
+        with self._pending_lock:
+            self._closed = True
+            writer = self._writer
+        self._stop.set()
+        self._wakeup.set()
+        if writer is not None:
+            writer.join()
+        self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait()
+            # 等待一个写入间隔, 使这段时间内的变化在同一个事务中写入; 关闭时立即写入
+            self._stop.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.warning("⚠️ 任务记录写入失败", extra={"error": str(e)})
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            # WAL 模式下 NORMAL 只在检查点时 fsync, 进程崩溃不会丢失已提交的事务
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, tool TEXT NOT NULL, arguments TEXT NOT NULL, "
+                "status TEXT NOT NULL, created_at REAL NOT NULL, started_at REAL, "
+                "finished_at REAL, result TEXT, urls TEXT, error TEXT, client_id TEXT, "
+                "background INTEGER NOT NULL DEFAULT 1, attempts INTEGER NOT NULL DEFAULT 0, "
+                "structured TEXT, owner TEXT)"
+            )
+            # 较早版本创建的文件没有 structured / owner 列
+            columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+            if "structured" not in columns:
+                db.execute("ALTER TABLE jobs ADD COLUMN structured TEXT")
+            if "owner" not in columns:
+                db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at)")
+            db.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at <= ?",
+                (time.time() - self.ttl,),
+            )
+            db.commit()
+            self._db = db
+        return self._db
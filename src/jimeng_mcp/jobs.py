@@ -0,0 +1,442 @@
+"""
+异步任务管理
+
+长时间运行的生成请求 (最长15分钟) 以后台 asyncio 任务执行,
+客户端提交后立即拿到任务ID, 之后通过轮询查询状态和结果,
+无需在整个生成过程中保持连接。
+
+也可以订阅单个任务或某个客户端全部任务的状态变化事件:
+每次状态变化只生成一次事件, 直接写入所有订阅者的队列, 不为订阅者创建任务。
+
+配置了任务持久化 (见 job_store.py) 时, 任务和直接的工具调用都会记录到文件中;
+内存中已清理的任务从文件中查询。启动时 recover() 处理上次运行时未结束的任务:
+异步任务重新执行 (resume) 或标记为失败 (fail); 直接调用的客户端已断开, 总是标记为失败。
+退出时被中断的异步任务以 pending 状态写入, 下次启动时重新执行。
+
+环境变量:
+- JIMENG_JOB_MAX_RETAINED: 最多保留的已结束任务数 (默认: 1000)
+- JIMENG_JOB_TTL: 已结束任务的保留时间(秒) (默认: 3600)
+- JIMENG_JOB_RECOVERY: 启动时如何处理未结束的异步任务, resume 或 fail (默认: resume)
+- JIMENG_JOB_MAX_ATTEMPTS: 异步任务最多执行的次数, 达到后不再恢复 (默认: 2)
+
+异步任务结束 (包括启动恢复时标记为失败) 后调用 on_finished, 用于 Webhook 回调 (见 webhooks.py)。
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterable, Optional
+
+if TYPE_CHECKING:
+    from .job_store import JobStore
+
+logger = logging.getLogger(__name__)
+
+# 没有结构化结果时, 从结果文本中提取生成结果链接
+_URL_PATTERN = re.compile(r"https?://\S+")
+
+# 每个订阅者最多缓存的未读事件数, 超出时丢弃最早的事件
+_SUBSCRIBER_QUEUE_SIZE = 64
+
+
+class JobStatus(str, Enum):
+    """任务状态"""
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    @property
+    def finished(self) -> bool:
+        return self in (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class JobNotFoundError(KeyError):
+    """任务不存在或已过期"""
+
+    def __init__(self, job_id: str):
+        super().__init__(job_id)
+        self.job_id = job_id
+
+    def __str__(self) -> str:
+        return f"未找到任务: {self.job_id}"
+
+
+@dataclass
+class Job:
+    """一次后台生成任务"""
+    id: str
+    tool: str
+    arguments: dict[str, Any]
+    status: JobStatus = JobStatus.PENDING
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[list[Any]] = None
+    error: Optional[str] = None
+    client_id: Optional[str] = None
+    # False 表示直接的工具调用, 只记录不在后台执行
+    background: bool = True
+    attempts: int = 0
+    task: Optional[asyncio.Task] = field(default=None, repr=False, compare=False)
+
+    @property
+    def elapsed(self) -> float:
+        """已运行时间(秒), 未开始时为0"""
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return end - self.started_at
+
+    @property
+    def urls(self) -> list[str]:
+        """结果中的图像/视频链接, 优先取结构化结果中的 urls"""
+        structured = getattr(self.result, "structured", None)
+        if structured and isinstance(structured.get("urls"), list):
+            return list(structured["urls"])
+        urls = []
+        for item in self.result or []:
+            urls.extend(_URL_PATTERN.findall(getattr(item, "text", "") or ""))
+        return urls
+
+    def to_dict(self, include_result: bool = False) -> dict[str, Any]:
+        """转换为可JSON序列化的字典"""
+        data = {
+            "job_id": self.id,
+            "tool": self.tool,
+            "status": self.status.value,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed": round(self.elapsed, 3),
+            "error": self.error,
+            "client_id": self.client_id,
+        }
+        if include_result:
+            data["result"] = [
+                item.model_dump() if hasattr(item, "model_dump") else item
+                for item in (self.result or [])
+            ]
+        return data
+
+
+def job_event(job: Job) -> dict[str, Any]:
+    """任务当前状态对应的事件, 已成功的任务附带结果链接"""
+    event = {"event": job.status.value, "job": job.to_dict()}
+    if job.status is JobStatus.SUCCEEDED:
+        event["urls"] = job.urls
+    return event
+
+
+class JobSubscription:
+    """任务事件订阅, 以上下文管理器使用, 退出时自动取消订阅"""
+
+    def __init__(self, manager: "JobManager", job_id: Optional[str], client_id: Optional[str]):
+        self._manager = manager
+        self.job_id = job_id
+        self.client_id = client_id
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(_SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+
+    def push(self, event: dict[str, Any]) -> None:
+        if self.queue.full():
+            # 订阅者读取过慢时丢弃最早的事件, 最新状态总能送达
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self) -> dict[str, Any]:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self._manager._unsubscribe(self)
+
+    def __enter__(self) -> "JobSubscription":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+ToolRunner = Callable[[str, dict[str, Any]], Awaitable[list[Any]]]
+
+
+class JobManager:
+    """在后台执行生成任务并跟踪其状态"""
+
+    def __init__(
+        self,
+        runner: ToolRunner,
+        tools: Iterable[str],
+        max_retained: Optional[int] = None,
+        ttl: Optional[float] = None,
+        store: Optional["JobStore"] = None,
+        recovery: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+        validate: Optional[Callable[[str, dict[str, Any]], None]] = None,
+        on_finished: Optional[Callable[[Job], None]] = None,
+    ):
+        self._runner = runner
+        # 异步任务结束时的回调, 不应阻塞或抛出异常
+        self._on_finished = on_finished
+        # 提交时校验工具参数, 参数无效时抛出异常, 不创建任务
+        self._validate = validate
+        self._tools = frozenset(tools)
+        self._jobs: dict[str, Job] = {}
+        self._job_subscribers: dict[str, set[JobSubscription]] = {}
+        self._client_subscribers: dict[str, set[JobSubscription]] = {}
+        self._closing = False
+        self.store = store
+        self.max_retained = max_retained if max_retained is not None else int(
+            os.getenv("JIMENG_JOB_MAX_RETAINED", "1000")
+        )
+        self.ttl = ttl if ttl is not None else float(os.getenv("JIMENG_JOB_TTL", "3600"))
+        self.recovery = (recovery or os.getenv("JIMENG_JOB_RECOVERY", "resume")).strip().lower()
+        if self.recovery not in ("resume", "fail"):
+            raise ValueError(f"未知的任务恢复策略: {self.recovery}, 可选 resume/fail")
+        self.max_attempts = max_attempts if max_attempts is not None else int(
+            os.getenv("JIMENG_JOB_MAX_ATTEMPTS", "2")
+        )
+
+    @property
+    def tools(self) -> frozenset[str]:
+        return self._tools
+
+    def submit(
+        self,
+        tool: str,
+        arguments: dict[str, Any],
+        client_id: Optional[str] = None,
+    ) -> Job:
+        """提交任务并立即返回, 任务在后台执行
+
+        Args:
+            tool: 生成工具名
+            arguments: 工具参数
+            client_id: 提交方标识, 用于订阅该客户端全部任务的事件
+        """
+        if tool not in self._tools:
+            raise ValueError(f"不支持异步执行的工具: {tool}")
+        if not isinstance(arguments, dict) or not arguments:
+            raise ValueError("参数是必需的")
+        if self._validate is not None:
+            self._validate(tool, arguments)
+
+        self._prune()
+        job = Job(id=uuid.uuid4().hex, tool=tool, arguments=dict(arguments), client_id=client_id)
+        self._start(job)
+        return job
+
+    async def record(
+        self,
+        tool: str,
+        arguments: dict[str, Any],
+        call: Callable[[], Awaitable[list[Any]]],
+    ) -> list[Any]:
+        """执行一次直接的工具调用, 配置了持久化时记录其状态和结果
+
+        Args:
+            tool: 生成工具名
+            arguments: 工具参数
+            call: 执行工具调用的协程函数, 异常原样抛出
+        """
+        if self.store is None:
+            return await call()
+        job = Job(
+            id=uuid.uuid4().hex, tool=tool, arguments=dict(arguments),
+            status=JobStatus.RUNNING, background=False, attempts=1,
+        )
+        job.started_at = job.created_at
+        self.store.save(job)
+        try:
+            job.result = await call()
+            job.status = JobStatus.SUCCEEDED
+            return job.result
+        except asyncio.CancelledError:
+            job.status = JobStatus.CANCELLED
+            job.error = "调用已取消"
+            raise
+        except Exception as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+            raise
+        finally:
+            job.finished_at = time.time()
+            self.store.save(job)
+
+    async def get(self, job_id: str) -> Job:
+        """按ID获取任务, 内存中没有时在线程中从持久化记录中查询, 不阻塞事件循环"""
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = await asyncio.to_thread(self.store.load, job_id)
+        if job is None:
+            raise JobNotFoundError(job_id)
+        return job
+
+    def owns(self, job_id: str) -> bool:
+        """任务是否由本进程执行或跟踪; 多工作进程模式下其他进程的任务只能从持久化记录中查询"""
+        return job_id in self._jobs
+
+    async def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> list[Job]:
+        """按创建时间倒序列出任务, 持久化记录在线程中查询"""
+        wanted = JobStatus(status) if status else None
+        jobs = {}
+        if self.store is not None:
+            stored = await asyncio.to_thread(self.store.list_jobs, status, limit)
+            jobs = {job.id: job for job in stored}
+        # 内存中的任务状态最新
+        jobs.update(self._jobs)
+        selected = [job for job in jobs.values() if wanted is None or job.status is wanted]
+        return sorted(selected, key=lambda job: job.created_at, reverse=True)[:limit]
+
+    async def recover(self) -> int:
+        """处理上次运行时未结束的任务, 在服务器启动时调用, 返回重新执行的任务数"""
+        if self.store is None:
+            return 0
+        jobs = await asyncio.to_thread(self.store.claim_unfinished)
+        resumed = 0
+        for job in jobs:
+            if (
+                job.background
+                and self.recovery == "resume"
+                and job.tool in self._tools
+                and job.attempts < self.max_attempts
+            ):
+                job.status = JobStatus.PENDING
+                job.started_at = None
+                self._start(job)
+                resumed += 1
+                continue
+            job.status = JobStatus.FAILED
+            job.error = "服务重启, 任务中断"
+            job.finished_at = time.time()
+            self.store.save(job)
+            if job.background:
+                self._notify_finished(job)
+        if jobs:
+            logger.info("♻️ 已处理上次未完成的任务", extra={
+                "resumed": resumed, "failed": len(jobs) - resumed
+            })
+        return resumed
+
+    def subscribe(
+        self,
+        job_id: Optional[str] = None,
+        client_id: Optional[str] = None,
+    ) -> JobSubscription:
+        """订阅单个任务或某个客户端全部任务的状态变化事件"""
+        if (job_id is None) == (client_id is None):
+            raise ValueError("job_id 和 client_id 必须且只能指定一个")
+        subscription = JobSubscription(self, job_id, client_id)
+        if job_id is not None:
+            self._job_subscribers.setdefault(job_id, set()).add(subscription)
+        else:
+            self._client_subscribers.setdefault(client_id, set()).add(subscription)
+        return subscription
+
+    @property
+    def subscribers(self) -> int:
+        """当前订阅者数"""
+        return sum(len(subs) for subs in self._job_subscribers.values()) + sum(
+            len(subs) for subs in self._client_subscribers.values()
+        )
+
+    def count(self, status: JobStatus) -> int:
+        return sum(1 for job in self._jobs.values() if job.status is status)
+
+    async def shutdown(self) -> None:
+        """取消所有未完成的任务, 在服务器退出时调用
+
+        配置了持久化时, 被中断的任务记录为 pending, 下次启动时由 recover() 处理。
+        """
+        self._closing = True
+        tasks = [job.task for job in self._jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start(self, job: Job) -> None:
+        self._jobs[job.id] = job
+        self._publish(job)
+        job.task = asyncio.create_task(self._execute(job), name=f"jimeng-job-{job.id}")
+
+    async def _execute(self, job: Job) -> None:
+        job.status = JobStatus.RUNNING
+        job.started_at = time.time()
+        job.attempts += 1
+        self._publish(job)
+        try:
+            job.result = await self._runner(job.tool, job.arguments)
+            job.status = JobStatus.SUCCEEDED
+        except asyncio.CancelledError:
+            if self._closing and self.store is not None:
+                # 服务器退出导致的取消: 保留为待执行, 重启后恢复
+                job.status = JobStatus.PENDING
+                job.started_at = None
+            else:
+                job.status = JobStatus.CANCELLED
+                job.error = "任务已取消"
+            raise
+        except Exception as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        finally:
+            if job.status.finished:
+                job.finished_at = time.time()
+            job.task = None
+            self._publish(job)
+            if job.status.finished:
+                self._notify_finished(job)
+
+    def _notify_finished(self, job: Job) -> None:
+        if self._on_finished is None:
+            return
+        try:
+            self._on_finished(job)
+        except Exception as e:
+            logger.warning("⚠️ 任务结束回调出错", extra={"job_id": job.id, "error": str(e)})
+
+    def _publish(self, job: Job) -> None:
+        """持久化并向该任务和其客户端的订阅者广播当前状态"""
+        if self.store is not None:
+            self.store.save(job)
+        subscribers = list(self._job_subscribers.get(job.id, ()))
+        if job.client_id is not None:
+            subscribers.extend(self._client_subscribers.get(job.client_id, ()))
+        if not subscribers:
+            return
+        event = job_event(job)
+        for subscription in subscribers:
+            subscription.push(event)
+
+    def _unsubscribe(self, subscription: JobSubscription) -> None:
+        if subscription.job_id is not None:
+            index, key = self._job_subscribers, subscription.job_id
+        else:
+            index, key = self._client_subscribers, subscription.client_id
+        subs = index.get(key)
+        if subs is not None:
+            subs.discard(subscription)
+            if not subs:
+                del index[key]
+
+    def _prune(self) -> None:
+        """清理过期和超出保留数量的已结束任务"""
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.status.finished]
+        for job in finished:
+            if now - (job.finished_at or now) > self.ttl:
+                del self._jobs[job.id]
+        finished = [job for job in finished if job.id in self._jobs]
+        overflow = len(finished) - self.max_retained
+        if overflow > 0:
+            finished.sort(key=lambda job: job.finished_at or 0)
+            for job in finished[:overflow]:
+                del self._jobs[job.id]
@@ -0,0 +1,198 @@
+"""
+结构化日志
+
+请求路径上的日志通过 QueueHandler 写入内存队列, 由 QueueListener 在后台线程
+写出, 事件循环不会因日志I/O阻塞。每条日志带有当前请求的 request_id、tool、model,
+JSON格式便于采集和检索。
+
+stdio 模式下 stdout 是MCP协议通道, 日志只写入 stderr (或日志文件)。
+上游返回数据等大段内容只在 DEBUG 级别记录, 按比例采样并截断。
+
+环境变量:
+- JIMENG_LOG_LEVEL: 日志级别 (默认: INFO)
+- JIMENG_LOG_FORMAT: json 或 text (默认: json)
+- JIMENG_LOG_FILE: 额外写入的日志文件路径 (默认: 空)
+- JIMENG_LOG_PAYLOAD_MAX: 单条日志中数据内容的最大字符数 (默认: 512)
+- JIMENG_LOG_PAYLOAD_SAMPLE: 记录数据内容的采样比例, 0~1 (默认: 1)
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger("jimeng_mcp")
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "jimeng_request_id", default=None
+)
+_tool: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("jimeng_tool", default=None)
+_model: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("jimeng_model", default=None)
+
+# LogRecord 自带的属性, 其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None)).keys()
+) | {"message", "asctime", "request_id", "tool", "model"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+@contextlib.contextmanager
+def request_context(
+    tool: Optional[str] = None,
+    model: Optional[str] = None,
+    request_id: Optional[str] = None,
+) -> Iterator[str]:
+    """为一次请求设置日志上下文, 已有 request_id 时沿用"""
+    rid = request_id or _request_id.get() or uuid.uuid4().hex[:16]
+    tokens = [(_request_id, _request_id.set(rid))]
+    if tool is not None:
+        tokens.append((_tool, _tool.set(tool)))
+    if model is not None:
+        tokens.append((_model, _model.set(model)))
+    try:
+        yield rid
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """在产生日志的任务中读取上下文, 写入 LogRecord"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        record.tool = _tool.get()
+        record.model = _model.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in ("request_id", "tool", "model"):
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRS and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """便于本地查看的文本格式, 结构化字段附在消息后"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            name: value for name, value in vars(record).items()
+            if name not in _RECORD_ATTRS and not name.startswith("_")
+        }
+        prefix = time.strftime("%H:%M:%S", time.localtime(record.created))
+        rid = getattr(record, "request_id", None)
+        line = f"{prefix} {record.levelname:<7} " + (f"[{rid}] " if rid else "") + record.getMessage()
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class StdStreamHandler(logging.StreamHandler):
+    """写入 sys.stdout/sys.stderr, 每次写出时读取当前的流对象"""
+
+    def __init__(self, stream_name: str):
+        self._stream_name = stream_name
+        super().__init__()
+
+    @property
+    def stream(self):
+        return getattr(sys, self._stream_name)
+
+    @stream.setter
+    def stream(self, value) -> None:
+        pass
+
+
+def payload(value: Any, limit: Optional[int] = None) -> str:
+    """把数据内容转换为截断后的字符串, 用于日志"""
+    limit = limit if limit is not None else int(os.getenv("JIMENG_LOG_PAYLOAD_MAX", "512"))
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    if len(text) > limit:
+        return f"{text[:limit]}…(+{len(text) - limit})"
+    return text
+
+
+def log_payload(message: str, value: Any, **fields: Any) -> None:
+    """按采样比例在 DEBUG 级别记录数据内容"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    rate = float(os.getenv("JIMENG_LOG_PAYLOAD_SAMPLE", "1"))
+    if rate < 1 and random.random() >= rate:
+        return
+    logger.debug(message, extra={"payload": payload(value), **fields})
+
+
+def setup_logging(mode: str = "stdio") -> logging.handlers.QueueListener:
+    """配置日志输出, 在服务器启动时调用一次
+
+    Args:
+        mode: 服务器模式, stdio 模式下不向 stdout 写日志
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = os.getenv("JIMENG_LOG_LEVEL", "INFO").upper()
+    formatter: logging.Formatter = (
+        TextFormatter() if os.getenv("JIMENG_LOG_FORMAT", "json").lower() == "text" else JsonFormatter()
+    )
+
+    stream = "stderr" if mode == "stdio" else "stdout"
+    handlers: list[logging.Handler] = [StdStreamHandler(stream)]
+    log_file = os.getenv("JIMENG_LOG_FILE")
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    logger.handlers[:] = [queue_handler]
+    logger.setLevel(level)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """写出队列中剩余的日志并停止后台线程"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,245 @@
+"""
+Prometheus 格式运行指标
+
+计数器、仪表和直方图都只在事件循环线程中更新, 更新只是对字典中数值的加减,
+不需要加锁。排队深度、缓存命中等已有统计通过回调在导出时读取, 不增加请求路径开销。
+
+HTTP 和 SSE 模式通过 /metrics 导出; stdio 模式可以设置 JIMENG_METRICS_FILE,
+定期把指标写入文件 (可配合 node_exporter 的 textfile collector 使用)。
+
+环境变量:
+- JIMENG_METRICS_FILE: stdio 模式下指标文件路径 (默认: 空, 不写文件)
+- JIMENG_METRICS_INTERVAL: 写入指标文件的间隔(秒) (默认: 15)
+"""
+
+import asyncio
+import bisect
+import math
+import os
+from typing import Callable, Iterable, Optional
+
+# 生成耗时从数秒到十几分钟, 默认桶覆盖这一范围
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120, 180, 300, 450, 600, 900)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    """可增可减的仪表"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+
+class CallbackGauge(_Metric):
+    """导出时通过回调读取的仪表, 回调返回 {标签值元组: 数值}"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Iterable[str],
+        callback: Callable[[], dict[LabelValues, float]],
+    ):
+        super().__init__(name, help, labels)
+        self._callback = callback
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in self._callback().items()
+        ]
+
+
+class Histogram(_Metric):
+    """固定分桶的直方图"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数..., 总和, 总数]
+        self._values: dict[LabelValues, list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[index] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return int(state[-1]) if state else 0
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {int(cumulative)}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, inf)} {int(state[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {int(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def callback_gauge(
+        self,
+        name: str,
+        help: str,
+        labels: Iterable[str],
+        callback: Callable[[], dict[LabelValues, float]],
+    ) -> CallbackGauge:
+        return self._register(CallbackGauge(name, help, labels, callback))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """导出 Prometheus 文本格式 (0.0.4)"""
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path: str, text: Optional[str] = None) -> None:
+        """原子地写入指标文件
+
+        Args:
+            path: 文件路径
+            text: 已导出的指标文本; 在其他线程写文件时应先在事件循环中调用 render()
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render() if text is None else text)
+        os.replace(tmp_path, path)
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已存在: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+async def dump_periodically(
+    registry: MetricsRegistry,
+    path: Optional[str] = None,
+    interval: Optional[float] = None,
+) -> None:
+    """定期把指标写入文件, 直到任务被取消; 取消时再写入一次"""
+    path = path if path is not None else os.getenv("JIMENG_METRICS_FILE", "")
+    if not path:
+        return
+    interval = interval if interval is not None else float(os.getenv("JIMENG_METRICS_INTERVAL", "15"))
+    try:
+        while True:
+            await asyncio.to_thread(registry.write_file, path, registry.render())
+            await asyncio.sleep(interval)
+    finally:
+        registry.write_file(path)
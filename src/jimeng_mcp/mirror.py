@@ -0,0 +1,377 @@
+"""
+生成结果镜像
+
+即梦返回的CDN链接会过期, 下游从远端CDN拉取也较慢。启用镜像后, 每次生成成功时
+把结果文件流式下载到内容寻址的存储 (本地目录或S3兼容对象存储), 工具返回的
+结果在原始链接旁附上稳定的镜像链接。
+
+- 内容寻址: 以文件内容的 SHA-256 为键 (<前2位>/<哈希>.<扩展名>), 相同内容只存一份
+- 分块写入: 边下载边计算哈希并分块写入临时文件, 不在内存中缓冲整个文件
+- 校验: 核对 Content-Length, 上游提供 Content-MD5 时一并校验
+- 重定向: 跟随CDN返回的重定向; 链接来自上游, 初始地址和每一跳都不允许指向内网或本机地址
+- 并发: 全进程共享下载并发上限, 同一链接的并发镜像请求合并为一次下载
+- 等待: 工具调用最多等待 JIMENG_MIRROR_WAIT 秒, 未完成的下载在后台继续
+
+HTTP 模式通过 /assets/<键> 提供本地镜像文件, 支持 Range 请求。
+
+环境变量:
+- JIMENG_MIRROR: 镜像存储, off/local/s3 (默认: off)
+- JIMENG_MIRROR_DIR: 本地镜像目录 (默认: ./jimeng_assets)
+- JIMENG_MIRROR_S3_BUCKET: S3存储桶 (需要 pip install boto3)
+- JIMENG_MIRROR_S3_PREFIX: S3对象键前缀 (默认: 空)
+- JIMENG_MIRROR_S3_ENDPOINT: S3兼容存储的端点地址 (默认: 空, 即AWS)
+- JIMENG_MIRROR_URL_PREFIX: 镜像链接前缀, 如 https://cdn.example.com/jimeng (默认: 空)
+- JIMENG_PUBLIC_BASE_URL: 本服务HTTP模式的外部访问地址, 未设置链接前缀时
+  本地镜像链接为 <地址>/assets/<键> (默认: 空, 使用 file:// 链接)
+- JIMENG_MIRROR_CONCURRENCY: 同时进行的下载数 (默认: 4)
+- JIMENG_MIRROR_MAX_BYTES: 单个文件大小上限 (默认: 524288000)
+- JIMENG_MIRROR_WAIT: 工具调用等待镜像完成的最长时间(秒) (默认: 60)
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional
+from urllib.parse import urlparse
+
+from .http_client import get_http_client, request_timeout, stream_public
+
+logger = logging.getLogger(__name__)
+
+# 镜像键的格式, 用于校验 /assets 请求路径
+KEY_PATTERN = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]{1,5})?$")
+
+# 从链接路径中识别的扩展名, 其余情况按 Content-Type 推断
+_KNOWN_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".mp4", ".mov", ".webm")
+
+# 每次读取的块大小和累计多少字节写一次磁盘
+_CHUNK_SIZE = 256 * 1024
+_WRITE_SIZE = 1024 * 1024
+
+# 下载超时(秒)
+_DOWNLOAD_TIMEOUT = 300.0
+
+# 记住已镜像链接的数量上限
+_MAX_REMEMBERED = 10000
+
+
+class MirrorError(Exception):
+    """下载或校验失败"""
+
+
+@dataclass
+class MirroredAsset:
+    """一个已镜像的文件"""
+    source_url: str
+    key: str
+    url: str
+    sha256: str
+    size: int
+    content_type: str
+
+
+def asset_extension(url: str, content_type: str) -> str:
+    """根据链接路径或 Content-Type 确定扩展名"""
+    suffix = os.path.splitext(urlparse(url).path)[1].lower()
+    if suffix in _KNOWN_EXTENSIONS:
+        return suffix
+    guessed = mimetypes.guess_extension(content_type) if content_type else None
+    return guessed or ""
+
+
+class LocalStorage:
+    """本地目录存储"""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.spool_dir = os.path.join(self.root, ".tmp")
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def put(self, tmp_path: str, key: str, content_type: str) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def default_url(self, key: str) -> str:
+        return Path(self.path(key)).as_uri()
+
+
+class S3Storage:
+    """S3兼容对象存储"""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError(
+                "JIMENG_MIRROR=s3 需要安装 boto3。\n"
+                "请运行: pip install boto3"
+            ) from None
+        self.bucket = bucket
+        self.prefix = prefix
+        self.spool_dir = os.path.join(tempfile.gettempdir(), "jimeng_mirror")
+        self._client = boto3.client("s3", endpoint_url=endpoint_url or None)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except Exception:
+            return False
+
+    def put(self, tmp_path: str, key: str, content_type: str) -> None:
+        # upload_file 对大文件自动分片上传
+        extra = {"ContentType": content_type} if content_type else {}
+        self._client.upload_file(tmp_path, self.bucket, self.prefix + key, ExtraArgs=extra)
+        os.remove(tmp_path)
+
+    def default_url(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self.prefix}{key}"
+
+
+class AssetMirror:
+    """把生成结果下载到内容寻址存储"""
+
+    def __init__(
+        self,
+        storage: Any,
+        url_prefix: Optional[str] = None,
+        concurrency: int = 4,
+        max_bytes: int = 500 * 1024 * 1024,
+        wait: float = 60.0,
+    ):
+        self.storage = storage
+        self.url_prefix = url_prefix.rstrip("/") if url_prefix else None
+        self.max_bytes = max_bytes
+        self.wait = wait
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._done: OrderedDict[str, MirroredAsset] = OrderedDict()
+        self.mirrored = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.bytes = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["AssetMirror"]:
+        """根据环境变量创建镜像, 未启用时返回None"""
+        kind = os.getenv("JIMENG_MIRROR", "off").strip().lower()
+        if kind in ("", "0", "off", "false", "no"):
+            return None
+        url_prefix = os.getenv("JIMENG_MIRROR_URL_PREFIX", "")
+        if kind == "local":
+            storage: Any = LocalStorage(os.getenv("JIMENG_MIRROR_DIR", "./jimeng_assets"))
+            public_base = os.getenv("JIMENG_PUBLIC_BASE_URL", "").rstrip("/")
+            if not url_prefix and public_base:
+                url_prefix = f"{public_base}/assets"
+        elif kind == "s3":
+            bucket = os.getenv("JIMENG_MIRROR_S3_BUCKET", "")
+            if not bucket:
+                raise ValueError("JIMENG_MIRROR=s3 时需要设置 JIMENG_MIRROR_S3_BUCKET")
+            storage = S3Storage(
+                bucket,
+                prefix=os.getenv("JIMENG_MIRROR_S3_PREFIX", ""),
+                endpoint_url=os.getenv("JIMENG_MIRROR_S3_ENDPOINT"),
+            )
+        else:
+            raise ValueError(f"未知的 JIMENG_MIRROR: {kind}, 可选 off/local/s3")
+        return cls(
+            storage,
+            url_prefix=url_prefix or None,
+            concurrency=int(os.getenv("JIMENG_MIRROR_CONCURRENCY", "4")),
+            max_bytes=int(os.getenv("JIMENG_MIRROR_MAX_BYTES", str(500 * 1024 * 1024))),
+            wait=float(os.getenv("JIMENG_MIRROR_WAIT", "60")),
+        )
+
+    def asset_url(self, key: str) -> str:
+        """镜像文件对外的链接"""
+        if self.url_prefix:
+            return f"{self.url_prefix}/{key}"
+        return self.storage.default_url(key)
+
+    @property
+    def public(self) -> bool:
+        """镜像链接是否可以被外部 (如即梦上游) 访问"""
+        return self.url_prefix is not None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """/assets 路由使用: 返回本地镜像文件路径, 键无效或文件不存在时返回None"""
+        if not isinstance(self.storage, LocalStorage) or not KEY_PATTERN.match(key):
+            return None
+        path = self.storage.path(key)
+        return path if os.path.isfile(path) else None
+
+    async def mirror_all(self, urls: list[str]) -> dict[str, Optional[MirroredAsset]]:
+        """镜像一组链接, 最多等待 self.wait 秒
+
+        Returns:
+            原始链接 → 镜像结果; 失败或尚未完成的为 None (未完成的下载在后台继续)
+        """
+        results: dict[str, Optional[MirroredAsset]] = {}
+        pending: dict[str, asyncio.Task] = {}
+        for url in dict.fromkeys(urls):
+            if url in self._done:
+                self._done.move_to_end(url)
+                results[url] = self._done[url]
+            elif urlparse(url).scheme in ("http", "https"):
+                pending[url] = self._task_for(url)
+            else:
+                results[url] = None
+        if pending:
+            done, _ = await asyncio.wait(pending.values(), timeout=self.wait)
+            for url, task in pending.items():
+                ok = task in done and not task.cancelled() and task.exception() is None
+                results[url] = task.result() if ok else None
+        return results
+
+    def _task_for(self, url: str) -> asyncio.Task:
+        # 同一链接正在下载时复用同一个任务
+        task = self._tasks.get(url)
+        if task is None:
+            task = asyncio.create_task(self._download(url))
+            self._tasks[url] = task
+            task.add_done_callback(lambda t: self._finished(url, t))
+        return task
+
+    def _finished(self, url: str, task: asyncio.Task) -> None:
+        self._tasks.pop(url, None)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.failed += 1
+            logger.warning("⚠️ 镜像失败", extra={"url": url, "error": str(error) or type(error).__name__})
+            return
+        asset = task.result()
+        self._done[url] = asset
+        while len(self._done) > _MAX_REMEMBERED:
+            self._done.popitem(last=False)
+
+    async def store(
+        self,
+        chunks: AsyncIterator[bytes],
+        source: str,
+        extension: str = "",
+        content_type: str = "",
+    ) -> MirroredAsset:
+        """把分块数据写入存储, 用于本地文件和 base64 等非链接来源
+
+        Args:
+            chunks: 文件内容的异步分块迭代器
+            source: 来源描述, 仅用于日志
+            extension: 镜像键的扩展名 (含点号)
+            content_type: 文件的 Content-Type
+        """
+        async with self._semaphore:
+            tmp_path, sha256, _, size = await self._spool(chunks)
+            key = await self._commit(tmp_path, sha256, extension, content_type)
+        return self._stored(source, key, sha256, size, content_type)
+
+    async def _download(self, url: str) -> MirroredAsset:
+        async with self._semaphore:
+            async with stream_public(
+                get_http_client(), "GET", url, timeout=request_timeout(_DOWNLOAD_TIMEOUT)
+            ) as response:
+                response.raise_for_status()
+                headers = response.headers
+                # 压缩传输时解压后写入, 长度和MD5针对的是压缩后的数据, 无法校验
+                encoded = headers.get("content-encoding", "identity").lower() != "identity"
+                length = int(headers["content-length"]) if "content-length" in headers else None
+                if length is not None and length > self.max_bytes and not encoded:
+                    raise MirrorError(f"文件过大: {length} 字节")
+                tmp_path, sha256, md5, size = await self._spool(response.aiter_bytes(_CHUNK_SIZE))
+
+            content_type = headers.get("content-type", "").split(";")[0].strip()
+            try:
+                if not encoded:
+                    if length is not None and size != length:
+                        raise MirrorError(f"文件不完整: 收到 {size} 字节, 应为 {length} 字节")
+                    expected_md5 = headers.get("content-md5")
+                    if expected_md5 and base64.b64encode(md5).decode() != expected_md5.strip():
+                        raise MirrorError("Content-MD5 校验失败")
+            except MirrorError:
+                await asyncio.to_thread(os.remove, tmp_path)
+                raise
+            key = await self._commit(tmp_path, sha256, asset_extension(url, content_type), content_type)
+        return self._stored(url, key, sha256, size, content_type)
+
+    async def _spool(self, chunks: AsyncIterator[bytes]) -> tuple[str, str, bytes, int]:
+        """把分块数据写入临时文件, 返回 (临时文件路径, SHA-256, MD5摘要, 字节数)"""
+        await asyncio.to_thread(os.makedirs, self.storage.spool_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.storage.spool_dir, suffix=".part")
+        sha256 = hashlib.sha256()
+        md5 = hashlib.md5()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pending: list[bytes] = []
+                buffered = 0
+                async for chunk in chunks:
+                    sha256.update(chunk)
+                    md5.update(chunk)
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise MirrorError(f"文件过大: 超过 {self.max_bytes} 字节")
+                    pending.append(chunk)
+                    buffered += len(chunk)
+                    if buffered >= _WRITE_SIZE:
+                        await asyncio.to_thread(f.write, b"".join(pending))
+                        pending, buffered = [], 0
+                if pending:
+                    await asyncio.to_thread(f.write, b"".join(pending))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path, sha256.hexdigest(), md5.digest(), size
+
+    async def _commit(self, tmp_path: str, sha256: str, extension: str, content_type: str) -> str:
+        """把临时文件放入存储, 相同内容已存在时丢弃临时文件, 返回镜像键"""
+        key = f"{sha256[:2]}/{sha256}{extension}"
+        try:
+            if await asyncio.to_thread(self.storage.exists, key):
+                self.deduplicated += 1
+                await asyncio.to_thread(os.remove, tmp_path)
+            else:
+                await asyncio.to_thread(self.storage.put, tmp_path, key, content_type)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key
+
+    def _stored(self, source: str, key: str, sha256: str, size: int, content_type: str) -> MirroredAsset:
+        self.mirrored += 1
+        self.bytes += size
+        logger.info("📦 镜像完成", extra={"source": source, "key": key, "size": size})
+        return MirroredAsset(source, key, self.asset_url(key), sha256, size, content_type)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "storage": type(self.storage).__name__,
+            "mirrored": self.mirrored,
+            "deduplicated": self.deduplicated,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "pending": len(self._tasks),
+        }
+
+    async def shutdown(self) -> None:
+        """取消未完成的下载"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,205 @@
+"""
+输入图像预检
+
+image_composition.images 和 image_to_video.file_paths 中的URL原样传给即梦。
+链接失效、文件过大或不是图像时, 要等上游长时间处理后才得到含糊的错误。
+启用预检后, 调用上游之前并发检查全部输入URL:
+- 发送只请求前 16 字节的 Range GET (HEAD 拿不到文件头), 跟随重定向
+- 地址: 初始URL和每一跳重定向在发出请求前检查, 指向 localhost 或内网/本机/链路本地/保留地址
+  (包括解析到这类地址的主机名) 时拒绝, 防止借预检探测内网 (SSRF)
+- 状态码: 4xx/5xx 视为不可访问
+- 大小: 由 Content-Range 的总长度或 Content-Length 得到, 超过上限时拒绝
+- Content-Type: 明确不是图像 (text/*、JSON、XML、音视频) 时拒绝;
+  对象存储常返回的 application/octet-stream 等类型交给文件头判断
+- 文件头: 不是 PNG/JPEG/WebP/GIF/BMP 时拒绝
+
+全部检查共用一个总的截止时间, 任一URL不合格时立即以 InputPreflightError 失败
+(MCP 调用 isError, HTTP 调用 400), 其余检查被取消。
+检查结果按URL缓存 JIMENG_PREFLIGHT_TTL 秒 (LRU); 超时和连接错误不缓存。
+同一URL正在检查时, 其他请求等待同一个结果。
+
+本地文件和 base64 输入由 inputs.py 在写入镜像前检查, 不经过这里。
+
+环境变量:
+- JIMENG_PREFLIGHT: 是否启用预检 (默认: 0)
+- JIMENG_PREFLIGHT_DEADLINE: 一次调用中全部检查的截止时间(秒) (默认: 2)
+- JIMENG_PREFLIGHT_TTL: 检查结果的缓存时间(秒) (默认: 300)
+- JIMENG_PREFLIGHT_MAX_BYTES: 单个输入图像的大小上限 (默认: 同 JIMENG_INPUT_MAX_BYTES, 52428800)
+- JIMENG_PREFLIGHT_CACHE_ENTRIES: 缓存的URL数 (默认: 4096)
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+
+from .errors import StructuredToolError
+from .http_client import InternalAddressError, get_http_client, request_timeout, stream_public
+from .inputs import sniff_image
+
+logger = logging.getLogger(__name__)
+
+# 读取的文件头字节数, 足够识别支持的图像格式
+_HEAD_BYTES = 16
+
+# 明确不是图像的 Content-Type 前缀
+_NON_IMAGE_TYPES = ("text/", "application/json", "application/xml", "application/xhtml", "video/", "audio/")
+
+_CONTENT_RANGE = re.compile(r"bytes\s+\d+-\d+/(\d+)", re.IGNORECASE)
+
+
+class InputPreflightError(StructuredToolError):
+    """输入图像URL不可用"""
+
+    code = "invalid_input_image"
+    status_code = 400
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"输入图像不可用: {url} ({reason})", url=url, reason=reason)
+        self.url = url
+        self.reason = reason
+
+
+class InputPreflight:
+    """并发检查输入图像URL, 结果按URL短时间缓存"""
+
+    def __init__(
+        self,
+        deadline: float = 2.0,
+        ttl: float = 300.0,
+        max_bytes: int = 50 * 1024 * 1024,
+        cache_entries: int = 4096,
+    ):
+        self.deadline = deadline
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.cache_entries = cache_entries
+        # URL → (过期时间, 不合格原因; None 表示合格)
+        self._cache: OrderedDict[str, tuple[float, Optional[str]]] = OrderedDict()
+        self._checking: dict[str, asyncio.Future] = {}
+        self.checked = 0
+        self.cache_hits = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["InputPreflight"]:
+        """根据环境变量创建, 未启用时返回None"""
+        if os.getenv("JIMENG_PREFLIGHT", "0").strip().lower() not in ("1", "true", "yes", "on"):
+            return None
+        default_max_bytes = os.getenv("JIMENG_INPUT_MAX_BYTES", str(50 * 1024 * 1024))
+        return cls(
+            deadline=float(os.getenv("JIMENG_PREFLIGHT_DEADLINE", "2")),
+            ttl=float(os.getenv("JIMENG_PREFLIGHT_TTL", "300")),
+            max_bytes=int(os.getenv("JIMENG_PREFLIGHT_MAX_BYTES", default_max_bytes)),
+            cache_entries=int(os.getenv("JIMENG_PREFLIGHT_CACHE_ENTRIES", "4096")),
+        )
+
+    async def check_all(self, urls: list[str]) -> None:
+        """并发检查一组URL, 任一不合格或超过截止时间时抛出 InputPreflightError"""
+        pending = {
+            asyncio.ensure_future(self._check_one(url)): url
+            for url in dict.fromkeys(urls)
+        }
+        if not pending:
+            return
+        deadline = time.monotonic() + self.deadline
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    url = next(iter(pending.values()))
+                    self.rejected += 1
+                    raise InputPreflightError(url, f"{self.deadline:g} 秒内无法访问")
+                for future in done:
+                    url = pending.pop(future)
+                    reason = future.result()
+                    if reason is not None:
+                        self.rejected += 1
+                        raise InputPreflightError(url, reason)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def _check_one(self, url: str) -> Optional[str]:
+        """检查单个URL, 返回不合格原因, 合格时返回None"""
+        cached = self._cache.get(url)
+        if cached is not None and cached[0] > time.monotonic():
+            self._cache.move_to_end(url)
+            self.cache_hits += 1
+            return cached[1]
+
+        checking = self._checking.get(url)
+        if checking is None:
+            checking = asyncio.ensure_future(self._probe(url))
+            self._checking[url] = checking
+            checking.add_done_callback(lambda _: self._checking.pop(url, None))
+        # 一个调用方被取消时不影响等待同一检查的其他调用方
+        return await asyncio.shield(checking)
+
+    async def _probe(self, url: str) -> Optional[str]:
+        self.checked += 1
+        try:
+            async with stream_public(
+                get_http_client(), "GET", url,
+                headers={"Range": f"bytes=0-{_HEAD_BYTES - 1}"},
+                timeout=request_timeout(self.deadline),
+            ) as response:
+                reason = self._inspect_headers(response)
+                if reason is None:
+                    head = b""
+                    async for chunk in response.aiter_bytes():
+                        head += chunk
+                        if len(head) >= _HEAD_BYTES:
+                            break
+                    if sniff_image(head) is None:
+                        reason = "不是支持的图像格式 (PNG/JPEG/WebP/GIF/BMP)"
+        except httpx.HTTPError as e:
+            # 超时和连接错误可能是暂时的, 不缓存
+            return f"无法访问: {type(e).__name__}"
+        except InternalAddressError as e:
+            reason = f"不允许访问: {e}"
+        except (httpx.InvalidURL, ValueError) as e:
+            # URL 本身无效 (端口、非法字符等), 结果是确定的, 与其他原因一样缓存
+            reason = f"URL无效: {e}"
+
+        self._cache[url] = (time.monotonic() + self.ttl, reason)
+        self._cache.move_to_end(url)
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+        if reason is not None:
+            logger.info("🚫 输入图像预检未通过", extra={"url": url, "reason": reason})
+        return reason
+
+    def _inspect_headers(self, response: httpx.Response) -> Optional[str]:
+        if response.status_code == 416:
+            return "文件为空"
+        if response.status_code >= 400:
+            return f"返回状态码 {response.status_code}"
+        size = None
+        match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+        if response.status_code == 206 and match:
+            size = int(match.group(1))
+        elif response.status_code == 200 and response.headers.get("Content-Length", "").isdigit():
+            size = int(response.headers["Content-Length"])
+        if size is not None and size > self.max_bytes:
+            return f"文件过大: {size} 字节, 上限 {self.max_bytes}"
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type.startswith(_NON_IMAGE_TYPES):
+            return f"Content-Type 为 {content_type}"
+        return None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "checked": self.checked,
+            "cache_hits": self.cache_hits,
+            "rejected": self.rejected,
+            "cached": len(self._cache),
+        }
@@ -0,0 +1,234 @@
+"""
+结果预览图
+
+启用后, 图像生成成功时下载结果图像, 缩放为尺寸和字节数受限的预览图 (WebP 或 JPEG),
+作为 MCP ImageContent 与文本结果一起返回, 客户端不必再访问链接即可显示。
+多张结果拼成一张联系表 (contact sheet)。
+
+解码、缩放和编码占用CPU, 在 ProcessPoolExecutor 中执行, 不阻塞事件循环;
+进程池在第一次生成预览时才创建。预览按源链接的哈希缓存在内存中 (LRU)。
+预览是尽力而为的: 下载或解码失败时只记录日志, 不影响工具结果。
+
+需要安装 Pillow: pip install "jimeng-mcp[preview]"
+
+环境变量:
+- JIMENG_PREVIEW: 是否返回预览图 (默认: 0)
+- JIMENG_PREVIEW_MAX_SIZE: 预览图最长边的像素数 (默认: 512)
+- JIMENG_PREVIEW_FORMAT: webp 或 jpeg (默认: webp)
+- JIMENG_PREVIEW_QUALITY: 初始编码质量 1-100 (默认: 75)
+- JIMENG_PREVIEW_MAX_BYTES: 预览图字节数上限, 超出时降低质量或尺寸重新编码 (默认: 262144)
+- JIMENG_PREVIEW_WORKERS: 进程池大小, 0 表示在线程中执行 (默认: 2)
+- JIMENG_PREVIEW_CACHE_ENTRIES: 缓存的预览数 (默认: 256)
+- JIMENG_PREVIEW_SOURCE_MAX_BYTES: 单张源图的下载大小上限 (默认: 33554432)
+"""
+
+import asyncio
+import base64
+import hashlib
+import importlib.util
+import io
+import logging
+import math
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+from mcp.types import ImageContent
+
+from .http_client import get_http_client, request_timeout
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+# 联系表中缩略图之间的间距(像素)和背景色
+_SHEET_GAP = 4
+_SHEET_BACKGROUND = (32, 32, 32)
+
+# 超出字节上限时每次降低的质量, 质量低于下限后改为缩小尺寸
+_QUALITY_STEP = 15
+_MIN_QUALITY = 30
+_SHRINK = 0.75
+
+# 下载超时(秒)
+_DOWNLOAD_TIMEOUT = 60.0
+
+
+def build_preview(
+    sources: list[bytes],
+    max_size: int,
+    fmt: str,
+    quality: int,
+    max_bytes: int,
+) -> bytes:
+    """把一张或多张源图编码为预览图, 在工作进程中执行
+
+    Args:
+        sources: 源图的原始字节
+        max_size: 预览图最长边
+        fmt: webp 或 jpeg
+        quality: 初始编码质量
+        max_bytes: 预览图字节数上限
+    """
+    from PIL import Image
+
+    images = []
+    for data in sources:
+        image = Image.open(io.BytesIO(data))
+        # draft 让 JPEG 在解码时直接缩小, 减少大图的解码开销
+        image.draft("RGB", (max_size, max_size))
+        images.append(image.convert("RGB"))
+
+    if len(images) == 1:
+        sheet = images[0]
+        sheet.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    else:
+        columns = math.ceil(math.sqrt(len(images)))
+        rows = math.ceil(len(images) / columns)
+        cell = max(1, (max_size - _SHEET_GAP * (columns - 1)) // columns)
+        sheet = Image.new(
+            "RGB",
+            (columns * cell + _SHEET_GAP * (columns - 1), rows * cell + _SHEET_GAP * (rows - 1)),
+            _SHEET_BACKGROUND,
+        )
+        for index, image in enumerate(images):
+            image.thumbnail((cell, cell), Image.Resampling.LANCZOS)
+            x = (index % columns) * (cell + _SHEET_GAP) + (cell - image.width) // 2
+            y = (index // columns) * (cell + _SHEET_GAP) + (cell - image.height) // 2
+            sheet.paste(image, (x, y))
+
+    while True:
+        buffer = io.BytesIO()
+        sheet.save(buffer, format=fmt.upper(), quality=quality)
+        if buffer.tell() <= max_bytes or max(sheet.size) <= 64:
+            return buffer.getvalue()
+        if quality - _QUALITY_STEP >= _MIN_QUALITY:
+            quality -= _QUALITY_STEP
+        else:
+            size = (max(1, int(sheet.width * _SHRINK)), max(1, int(sheet.height * _SHRINK)))
+            sheet = sheet.resize(size, Image.Resampling.LANCZOS)
+
+
+class PreviewRenderer:
+    """下载结果图像并在进程池中生成预览"""
+
+    def __init__(
+        self,
+        max_size: int = 512,
+        fmt: str = "webp",
+        quality: int = 75,
+        max_bytes: int = 256 * 1024,
+        workers: int = 2,
+        cache_entries: int = 256,
+        source_max_bytes: int = 32 * 1024 * 1024,
+    ):
+        if fmt not in MIME_TYPES:
+            raise ValueError(f"未知的预览格式: {fmt}, 可选 webp/jpeg")
+        self.max_size = max_size
+        self.fmt = fmt
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.cache_entries = cache_entries
+        self.source_max_bytes = source_max_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._cache: OrderedDict[str, ImageContent] = OrderedDict()
+        self.hits = 0
+        self.rendered = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["PreviewRenderer"]:
+        """根据环境变量创建, 未启用时返回None"""
+        if os.getenv("JIMENG_PREVIEW", "0").strip().lower() not in ("1", "true", "yes", "on"):
+            return None
+        if importlib.util.find_spec("PIL") is None:
+            raise RuntimeError(
+                "JIMENG_PREVIEW=1 需要安装 Pillow。\n"
+                "请运行: pip install \"jimeng-mcp[preview]\""
+            )
+        return cls(
+            max_size=int(os.getenv("JIMENG_PREVIEW_MAX_SIZE", "512")),
+            fmt=os.getenv("JIMENG_PREVIEW_FORMAT", "webp").strip().lower(),
+            quality=int(os.getenv("JIMENG_PREVIEW_QUALITY", "75")),
+            max_bytes=int(os.getenv("JIMENG_PREVIEW_MAX_BYTES", str(256 * 1024))),
+            workers=int(os.getenv("JIMENG_PREVIEW_WORKERS", "2")),
+            cache_entries=int(os.getenv("JIMENG_PREVIEW_CACHE_ENTRIES", "256")),
+            source_max_bytes=int(os.getenv("JIMENG_PREVIEW_SOURCE_MAX_BYTES", str(32 * 1024 * 1024))),
+        )
+
+    def cache_key(self, urls: list[str]) -> str:
+        """源链接和预览参数的哈希"""
+        settings = f"{self.max_size}|{self.fmt}|{self.quality}|{self.max_bytes}"
+        return hashlib.sha256("\n".join([settings, *urls]).encode("utf-8")).hexdigest()
+
+    async def render(self, urls: list[str]) -> Optional[ImageContent]:
+        """生成预览, 失败时返回None"""
+        if not urls:
+            return None
+        key = self.cache_key(urls)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        try:
+            sources = await asyncio.gather(*(self._fetch(url) for url in urls))
+            data = await self._run(
+                build_preview, list(sources), self.max_size, self.fmt, self.quality, self.max_bytes
+            )
+        except Exception as e:
+            self.failed += 1
+            logger.warning("⚠️ 预览生成失败", extra={"error": str(e) or type(e).__name__})
+            return None
+
+        self.rendered += 1
+        content = ImageContent(
+            type="image",
+            data=base64.b64encode(data).decode("ascii"),
+            mimeType=MIME_TYPES[self.fmt],
+        )
+        self._cache[key] = content
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+        return content
+
+    async def _fetch(self, url: str) -> bytes:
+        chunks: list[bytes] = []
+        size = 0
+        async with get_http_client().stream("GET", url, timeout=request_timeout(_DOWNLOAD_TIMEOUT)) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > self.source_max_bytes:
+                    raise ValueError(f"源图过大: 超过 {self.source_max_bytes} 字节")
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def _run(self, fn, *args: Any) -> bytes:
+        if self.workers <= 0:
+            return await asyncio.to_thread(fn, *args)
+        if self._pool is None:
+            # spawn 启动的工作进程不继承事件循环和后台线程的状态
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "rendered": self.rendered,
+            "cache_hits": self.hits,
+            "failed": self.failed,
+            "cached": len(self._cache),
+            "workers": self.workers if self._pool is not None else 0,
+        }
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
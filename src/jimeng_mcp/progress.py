@@ -0,0 +1,247 @@
+"""
+生成进度通知
+
+客户端在请求中提供 progressToken 时, 生成期间定期发送MCP进度通知,
+包含已耗时间、根据同一工具和模型近期完成情况估算的预计耗时, 以及当前阶段:
+
+- queued: 排队等待并发槽位
+- coalesced: 等待其他工作进程中相同请求的结果
+- submitted: 已向上游发送请求
+- waiting_upstream: 等待上游生成
+- mirroring: 镜像生成结果 (启用 JIMENG_MIRROR 时)
+- previewing: 生成预览图 (启用 JIMENG_PREVIEW 时)
+- formatting: 整理结果
+
+各层代码通过 set_phase() 更新阶段, 不需要关心当前请求是否需要进度通知。
+多个调用方合并为一次上游调用时 (singleflight.py), 共享调用中的阶段通过 PhaseFanout
+转发给所有等待者的 ProgressReporter。
+
+环境变量:
+- JIMENG_PROGRESS_INTERVAL: 进度通知间隔(秒) (默认: 5)
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import os
+import statistics
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Optional
+
+PHASE_LABELS = {
+    "preflight": "检查输入图像",
+    "queued": "排队中",
+    "coalesced": "等待相同请求",
+    "submitted": "已提交",
+    "waiting_upstream": "等待即梦生成",
+    "mirroring": "镜像结果",
+    "previewing": "生成预览",
+    "formatting": "整理结果",
+}
+
+# 没有历史数据时的预计耗时(秒)
+DEFAULT_DURATIONS = {
+    "text_to_image": 90.0,
+    "image_composition": 90.0,
+    "text_to_video": 300.0,
+    "image_to_video": 300.0,
+}
+
+# 每个 (工具, 模型) 保留的最近完成耗时数
+_HISTORY_SIZE = 20
+
+
+class DurationEstimator:
+    """按工具和模型估算生成耗时 (最近完成耗时的中位数)"""
+
+    def __init__(self, defaults: Optional[dict[str, float]] = None):
+        self.defaults = dict(DEFAULT_DURATIONS if defaults is None else defaults)
+        self._history: dict[tuple[str, str], deque[float]] = {}
+
+    def record(self, tool: str, model: str, duration: float) -> None:
+        history = self._history.setdefault((tool, model), deque(maxlen=_HISTORY_SIZE))
+        history.append(duration)
+
+    def estimate(self, tool: str, model: str) -> float:
+        history = self._history.get((tool, model))
+        if history:
+            return statistics.median(history)
+        return self.defaults.get(tool, 120.0)
+
+
+class ProgressReporter:
+    """跟踪一次生成的阶段, 有进度令牌时向MCP请求定期发送进度通知"""
+
+    def __init__(
+        self,
+        session: Any,
+        token: Any,
+        expected: float,
+        interval: float = 5.0,
+    ):
+        self.session = session
+        self.token = token
+        self.expected = expected
+        self.interval = interval
+        self.phase = "queued"
+        self.submitted = False
+        self.started = time.monotonic()
+        self._ticker: Optional[asyncio.Task] = None
+        self._pending: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.session is not None and self.token is not None
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        await self.send()
+        self._ticker = asyncio.create_task(self._tick())
+
+    async def stop(self) -> None:
+        if self._ticker is not None:
+            self._ticker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._ticker
+            self._ticker = None
+        # 确保阶段通知在工具返回结果之前发出
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def set_phase(self, phase: str, shared: bool = False) -> None:
+        """切换阶段并立即发送一次通知
+
+        Args:
+            phase: 新阶段
+            shared: 阶段来自其他调用方发起的合并调用; 本请求没有请求上游, 不计入耗时估算
+        """
+        if phase == "submitted" and not shared:
+            self.submitted = True
+        if phase == self.phase:
+            return
+        self.phase = phase
+        if self.enabled:
+            task = asyncio.ensure_future(self.send())
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def send(self) -> None:
+        elapsed = self.elapsed
+        # 超过预计耗时后总量随已耗时增长, 保证进度单调且不超过总量
+        total = max(self.expected, elapsed + self.interval)
+        message = (
+            f"{PHASE_LABELS.get(self.phase, self.phase)} · "
+            f"已耗时 {elapsed:.0f}秒 / 预计 {self.expected:.0f}秒"
+        )
+        try:
+            await self.session.send_progress_notification(
+                self.token, round(elapsed, 1), total=round(total, 1), message=message
+            )
+        except Exception:
+            # 客户端断开等情况不影响生成本身
+            pass
+
+    async def _tick(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.phase == "submitted":
+                self.phase = "waiting_upstream"
+            await self.send()
+
+
+class PhaseFanout:
+    """合并调用的阶段转发: 共享的上游调用更新阶段时转发给所有等待者"""
+
+    def __init__(self, owner: Any = None):
+        """
+        Args:
+            owner: 发起调用的请求的 ProgressReporter (或外层的 PhaseFanout)
+        """
+        self.owner = owner
+        self.phase: Optional[str] = None
+        self._followers: list[Any] = [owner] if owner is not None else []
+
+    def join(self, follower: Any) -> None:
+        """加入等待者, 立即同步当前阶段"""
+        if follower is None:
+            return
+        self._followers.append(follower)
+        if self.phase is not None:
+            follower.set_phase(self.phase, shared=follower is not self.owner)
+
+    def leave(self, follower: Any) -> None:
+        with contextlib.suppress(ValueError):
+            self._followers.remove(follower)
+
+    def set_phase(self, phase: str, shared: bool = False) -> None:
+        self.phase = phase
+        for follower in self._followers:
+            follower.set_phase(phase, shared=shared or follower is not self.owner)
+
+    async def run(self, fn: Any) -> Any:
+        """在本对象作为当前进度接收方的上下文中执行 fn()"""
+        _current.set(self)
+        return await fn()
+
+
+# 当前请求的进度接收方: ProgressReporter, 或合并调用中的 PhaseFanout
+_current: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar(
+    "jimeng_progress", default=None
+)
+
+
+def current_reporter() -> Optional[Any]:
+    """当前请求的进度接收方, 没有时返回None"""
+    return _current.get()
+
+
+def set_phase(phase: str) -> None:
+    """更新当前请求的生成阶段, 没有进度通知时不做任何事"""
+    reporter = _current.get()
+    if reporter is not None:
+        reporter.set_phase(phase)
+
+
+class ProgressTracker:
+    """为每次生成创建 ProgressReporter, 并记录各工具/模型的耗时"""
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval if interval is not None else float(
+            os.getenv("JIMENG_PROGRESS_INTERVAL", "5")
+        )
+        self.estimator = DurationEstimator()
+
+    @contextlib.asynccontextmanager
+    async def track(
+        self,
+        tool: str,
+        model: str,
+        progress: Optional[tuple[Any, Any]] = None,
+    ) -> AsyncIterator[ProgressReporter]:
+        """在生成期间发送进度通知, 成功完成后记录耗时
+
+        Args:
+            tool: 工具名
+            model: 模型名
+            progress: (会话, 进度令牌), 为None时只记录耗时
+        """
+        session, progress_token = progress if progress is not None else (None, None)
+        reporter = ProgressReporter(
+            session, progress_token, self.estimator.estimate(tool, model), self.interval
+        )
+        await reporter.start()
+        token = _current.set(reporter)
+        try:
+            yield reporter
+            # 命中缓存或与其他请求合并时没有真正请求上游, 不计入耗时估算
+            if reporter.submitted:
+                self.estimator.record(tool, model, reporter.elapsed)
+        finally:
+            _current.reset(token)
+            await reporter.stop()
@@ -0,0 +1,283 @@
+"""
+按客户端限流 (令牌桶)
+
+admission.py 限制的是发往上游的总并发, 单个客户端仍可以占满全部上游配额。
+这里为每个客户端维护一个令牌桶: 容量 JIMENG_RATE_LIMIT_BURST, 每分钟补充
+JIMENG_RATE_LIMIT 个令牌; 每次调用按工具扣除不同数量的令牌 (视频比图像贵),
+令牌不足时立即拒绝:
+- HTTP 调用: 429, 附带 X-RateLimit-Limit、X-RateLimit-Remaining、X-RateLimit-Reset
+  (桶补满还需的秒数) 和 Retry-After; 成功的响应同样附带 X-RateLimit-* 响应头
+- MCP 调用 (SSE 模式): isError 的 JSON 错误文档, 错误码 rate_limited
+stdio 模式只有一个本地客户端, 不限流。
+
+客户端标识依次取:
+- X-API-Key 请求头或 Authorization 中的令牌, 仅当它在 JIMENG_CLIENT_KEYS 中 (只保存其哈希);
+  任意令牌都可以随意更换, 不在列表中的令牌不作为标识, 否则轮换令牌即可绕过限流
+- 客户端IP (JIMENG_RATE_LIMIT_TRUST_PROXY=1 时取 X-Forwarded-For 中的第一个地址)
+- SSE 会话ID, 仅在取不到IP时使用 (重新连接即可得到新会话)
+多工作进程模式下 POST /messages 转发给会话所在进程时, 由收到请求的进程确定标识并随请求转发
+(见 server.FORWARDED_CLIENT_HEADER), 所在进程只在内部 socket 上的请求中信任它。
+
+令牌桶按最近使用时间排列在 OrderedDict 中, 检查是 O(1) 的。空闲到足以补满的桶与新桶
+等价, 每次检查顺带从最久未用的一端清理几个这样的桶; 桶数超过
+JIMENG_RATE_LIMIT_MAX_BUCKETS 时丢弃最久未用的桶。
+
+多工作进程模式下令牌桶保存在共享状态 SQLite 文件中 (见 shared.py), 每次检查是一个
+写事务, 所有工作进程共用同一个客户端的配额; 空闲的桶同样在检查时按更新时间清理。
+
+环境变量:
+- JIMENG_RATE_LIMIT: 每个客户端每分钟补充的令牌数, 0 表示不限流 (默认: 0)
+- JIMENG_RATE_LIMIT_BURST: 令牌桶容量 (默认: 同 JIMENG_RATE_LIMIT)
+- JIMENG_RATE_LIMIT_COSTS: 各工具消耗的令牌数, 如 "text_to_video=10,image_to_video=10"
+  (默认: text_to_image=1, image_composition=2, text_to_video=10, image_to_video=10)
+- JIMENG_RATE_LIMIT_MAX_BUCKETS: 最多保留的令牌桶数 (默认: 1000000)
+- JIMENG_RATE_LIMIT_TRUST_PROXY: 是否信任 X-Forwarded-For (默认: 0)
+- JIMENG_CLIENT_KEYS: 按密钥单独计数的客户端 API 密钥, 逗号分隔 (默认: 空, 全部按IP计数)
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Mapping, Optional
+
+from .errors import StructuredToolError
+from .shared import SharedState
+
+DEFAULT_COSTS = {
+    "text_to_image": 1.0,
+    "image_composition": 2.0,
+    "text_to_video": 10.0,
+    "image_to_video": 10.0,
+}
+
+# 每次检查最多清理的空闲令牌桶数, 使清理的开销分摊到每次检查
+_EVICT_PER_CHECK = 8
+
+
+class RateLimitStatus:
+    """一次检查后客户端令牌桶的状态"""
+
+    __slots__ = ("limit", "remaining", "reset_after")
+
+    def __init__(self, limit: float, remaining: float, reset_after: float):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_after = reset_after
+
+    def headers(self) -> dict[str, str]:
+        return {
+            "X-RateLimit-Limit": str(int(self.limit)),
+            "X-RateLimit-Remaining": str(max(0, math.floor(self.remaining))),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+
+
+class RateLimited(StructuredToolError):
+    """客户端令牌不足"""
+
+    code = "rate_limited"
+    status_code = 429
+
+    def __init__(self, tool: str, cost: float, status: RateLimitStatus, retry_after: float):
+        super().__init__(
+            f"{tool} 请求过于频繁, 请 {max(1, math.ceil(retry_after))} 秒后重试",
+            tool=tool,
+            cost=cost,
+            limit=status.limit,
+            remaining=max(0, math.floor(status.remaining)),
+            retry_after=retry_after,
+        )
+        self.status = status
+        self.retry_after = retry_after
+
+    def headers(self) -> dict[str, str]:
+        return {**self.status.headers(), "Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+def key_digest(key: str) -> str:
+    """API 密钥的哈希, 内存中只保存哈希"""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def client_identity(
+    headers: Mapping[str, str],
+    session_id: Optional[str] = None,
+    address: Optional[str] = None,
+    trust_proxy: bool = False,
+    client_keys: frozenset[str] = frozenset(),
+) -> Optional[str]:
+    """按已登记的 API 密钥、IP、SSE 会话的顺序确定客户端标识, 都没有时返回None
+
+    Args:
+        client_keys: 已登记密钥的哈希 (key_digest), 其他密钥被忽略
+    """
+    if client_keys:
+        key = headers.get("x-api-key")
+        if not key:
+            scheme, _, token = headers.get("authorization", "").partition(" ")
+            if scheme.lower() == "bearer":
+                key = token.strip()
+        if key:
+            digest = key_digest(key)
+            if digest in client_keys:
+                return f"key:{digest}"
+    if trust_proxy:
+        forwarded = headers.get("x-forwarded-for", "").split(",")[0].strip()
+        if forwarded:
+            address = forwarded
+    if address:
+        return f"ip:{address}"
+    return f"session:{session_id}" if session_id else None
+
+
+class RateLimiter:
+    """每个客户端一个令牌桶, 配置了共享状态时保存在所有工作进程共用的 SQLite 文件中"""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: Optional[float] = None,
+        costs: Optional[dict[str, float]] = None,
+        max_buckets: int = 1_000_000,
+        trust_proxy: bool = False,
+        client_keys: tuple[str, ...] = (),
+        state: Optional[SharedState] = None,
+    ):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 令牌桶容量, 默认为一分钟补充的令牌数
+            costs: 各工具消耗的令牌数, 未列出的工具消耗1个
+            max_buckets: 最多保留的令牌桶数
+            trust_proxy: 是否按 X-Forwarded-For 识别客户端IP
+            client_keys: 按密钥单独计数的客户端 API 密钥
+            state: 多进程共享状态, 为None时令牌桶只保存在本进程内存中
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else rate * 60
+        self.costs = {**DEFAULT_COSTS, **(costs or {})}
+        self.max_buckets = max_buckets
+        self.trust_proxy = trust_proxy
+        self.client_keys = frozenset(key_digest(key) for key in client_keys)
+        self.state = state
+        # 空闲这么久的令牌桶已经补满, 与新桶等价
+        self._idle_after = self.burst / rate
+        # 客户端 → (令牌数, 更新时间), 按更新时间从旧到新排列
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_env(cls, state: Optional[SharedState] = None) -> Optional["RateLimiter"]:
+        """根据环境变量创建, 未启用时返回None"""
+        per_minute = float(os.getenv("JIMENG_RATE_LIMIT", "0"))
+        if per_minute <= 0:
+            return None
+        costs = {}
+        for part in os.getenv("JIMENG_RATE_LIMIT_COSTS", "").split(","):
+            tool, sep, cost = part.partition("=")
+            if not sep:
+                continue
+            costs[tool.strip()] = float(cost)
+        return cls(
+            rate=per_minute / 60,
+            burst=float(os.getenv("JIMENG_RATE_LIMIT_BURST", str(per_minute))),
+            costs=costs,
+            max_buckets=int(os.getenv("JIMENG_RATE_LIMIT_MAX_BUCKETS", "1000000")),
+            trust_proxy=os.getenv("JIMENG_RATE_LIMIT_TRUST_PROXY", "0").strip().lower() in ("1", "true", "yes", "on"),
+            client_keys=tuple(key.strip() for key in os.getenv("JIMENG_CLIENT_KEYS", "").split(",") if key.strip()),
+            state=state,
+        )
+
+    def cost(self, tool: str) -> float:
+        return self.costs.get(tool, 1.0)
+
+    async def check(self, client: str, tool: str, cost: float) -> RateLimitStatus:
+        """扣除令牌, 不足时抛出 RateLimited; 配置了共享状态时在线程中读写共享的令牌桶"""
+        if self.state is None:
+            return self.acquire(client, tool, cost)
+        cost = min(cost, self.burst)
+        tokens, allowed = await asyncio.to_thread(
+            self.state.execute, lambda db: self._take_shared(db, client, cost)
+        )
+        return self._status(tool, cost, tokens, allowed)
+
+    def acquire(self, client: str, tool: str, cost: float) -> RateLimitStatus:
+        """扣除本进程内存中的令牌, 不足时抛出 RateLimited
+
+        单次消耗超过桶容量时按容量计, 否则这样的调用永远无法通过。
+        """
+        now = time.monotonic()
+        self._evict(now)
+        cost = min(cost, self.burst)
+        buckets = self._buckets
+        entry = buckets.get(client)
+        if entry is None:
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, entry[0] + (now - entry[1]) * self.rate)
+            buckets.move_to_end(client)
+
+        if tokens < cost:
+            buckets[client] = (tokens, now)
+            return self._status(tool, cost, tokens, False)
+
+        tokens -= cost
+        buckets[client] = (tokens, now)
+        if len(buckets) > self.max_buckets:
+            buckets.popitem(last=False)
+            self.evicted += 1
+        return self._status(tool, cost, tokens, True)
+
+    def _status(self, tool: str, cost: float, tokens: float, allowed: bool) -> RateLimitStatus:
+        status = RateLimitStatus(self.burst, tokens, (self.burst - tokens) / self.rate)
+        if not allowed:
+            self.rejected += 1
+            raise RateLimited(tool, cost, status, (cost - tokens) / self.rate)
+        self.allowed += 1
+        return status
+
+    def _take_shared(self, db: sqlite3.Connection, client: str, cost: float) -> tuple[float, bool]:
+        """在写事务中扣除共享令牌桶, 返回 (剩余令牌数, 是否扣除成功)"""
+        # 各进程的单调时钟不可比较, 共享的桶使用系统时间
+        now = time.time()
+        self.evicted += db.execute(
+            "DELETE FROM rate_buckets WHERE client IN "
+            "(SELECT client FROM rate_buckets WHERE updated_at <= ? ORDER BY updated_at LIMIT ?)",
+            (now - self._idle_after, _EVICT_PER_CHECK),
+        ).rowcount
+        row = db.execute("SELECT tokens, updated_at FROM rate_buckets WHERE client = ?", (client,)).fetchone()
+        tokens = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+        if tokens < cost:
+            return tokens, False
+        tokens -= cost
+        db.execute(
+            "INSERT OR REPLACE INTO rate_buckets (client, tokens, updated_at) VALUES (?, ?, ?)",
+            (client, tokens, now),
+        )
+        return tokens, True
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        for _ in range(_EVICT_PER_CHECK):
+            if not buckets:
+                return
+            client = next(iter(buckets))
+            if now - buckets[client][1] < self._idle_after:
+                return
+            del buckets[client]
+            self.evicted += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "shared": self.state is not None,
+            "clients": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,228 @@
+"""
+重试与熔断
+
+- 重试: 使用带抖动的指数退避重试, 429/503 响应中的 Retry-After 会被遵守。
+  所有上游调用都是生成接口的 POST, 不是幂等的, 因此只在请求确定未被处理时
+  (连接失败、429、503) 重试; 读取超时、502/504 等可能发生在上游已开始生成之后, 不重试。
+- 熔断: 每个上游端点一个熔断器, 连续失败达到阈值后打开, 打开期间直接失败,
+  冷却时间过后进入半开状态, 放行少量探测请求, 成功则恢复。
+
+环境变量:
+- JIMENG_RETRY_MAX_ATTEMPTS: 最大尝试次数 (默认: 2)
+- JIMENG_RETRY_BASE_DELAY: 退避基础时间(秒) (默认: 0.5)
+- JIMENG_RETRY_MAX_DELAY: 单次退避上限(秒), 同时限制 Retry-After (默认: 30)
+- JIMENG_CB_FAILURE_THRESHOLD: 打开熔断器的连续失败次数 (默认: 5)
+- JIMENG_CB_RESET_TIMEOUT: 熔断打开后进入半开状态前的冷却时间(秒) (默认: 30)
+- JIMENG_CB_HALF_OPEN_MAX: 半开状态下同时放行的探测请求数 (默认: 1)
+"""
+
+import email.utils
+import logging
+import math
+import os
+import random
+import time
+from typing import Optional
+
+import httpx
+
+from .errors import StructuredToolError
+
+logger = logging.getLogger(__name__)
+
+# 表示请求未被处理, 可以安全重试的状态码
+SAFE_RETRY_STATUS = frozenset({429, 503})
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """解析 Retry-After 头 (秒数或HTTP日期), 无法解析时返回None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, parsed.timestamp() - now)
+
+
+class RetryPolicy:
+    """带抖动的指数退避重试策略"""
+
+    def __init__(
+        self,
+        max_attempts: int = 2,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            max_attempts=int(os.getenv("JIMENG_RETRY_MAX_ATTEMPTS", "2")),
+            base_delay=float(os.getenv("JIMENG_RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(os.getenv("JIMENG_RETRY_MAX_DELAY", "30")),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的退避时间 (full jitter)"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """判断第 attempt 次尝试的错误是否应重试, 返回等待时间; 不重试时返回None"""
+        if attempt >= self.max_attempts:
+            return None
+
+        if isinstance(error, httpx.HTTPStatusError):
+            if error.response.status_code not in SAFE_RETRY_STATUS:
+                return None
+            retry_after = parse_retry_after(error.response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_delay)
+            return self.backoff(attempt)
+
+        # 连接未建立, 请求一定没有发出; 读取超时等错误可能发生在上游已开始生成之后, 不重试
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return self.backoff(attempt)
+        return None
+
+
+class CircuitOpenError(StructuredToolError):
+    """熔断器打开, 请求被直接拒绝"""
+
+    code = "circuit_open"
+    status_code = 503
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(
+            f"上游 {endpoint} 暂时不可用, 已熔断, 请 {math.ceil(retry_after)} 秒后重试",
+            endpoint=endpoint,
+            retry_after=retry_after,
+        )
+        self.retry_after = retry_after
+
+    def headers(self) -> dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class CircuitBreaker:
+    """单个上游端点的熔断器"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max = max(1, half_open_max)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.rejected = 0
+
+    def allows_request(self) -> bool:
+        """不改变状态地判断当前是否会放行请求"""
+        if self.state == self.OPEN:
+            return time.monotonic() >= self.opened_at + self.reset_timeout
+        if self.state == self.HALF_OPEN:
+            return self.probes < self.half_open_max
+        return True
+
+    def before_call(self) -> None:
+        """发起请求前检查, 熔断打开时抛出 CircuitOpenError"""
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, remaining)
+            self.state = self.HALF_OPEN
+            self.probes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self.probes >= self.half_open_max:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self.probes += 1
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.state != self.CLOSED:
+            logger.info("🔌 熔断器恢复", extra={"breaker": self.name})
+        self.state = self.CLOSED
+        self.probes = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("🔌 熔断器打开", extra={"breaker": self.name, "failures": self.failures})
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.probes = 0
+
+    def record_abandoned(self) -> None:
+        """请求被取消, 归还半开状态下的探测名额"""
+        if self.state == self.HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
+
+
+def is_breaker_failure(error: Exception) -> bool:
+    """判断错误是否说明上游不健康 (传输错误和5xx, 不含4xx)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+class CircuitBreakerRegistry:
+    """按端点管理熔断器"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreakerRegistry":
+        return cls(
+            failure_threshold=int(os.getenv("JIMENG_CB_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("JIMENG_CB_RESET_TIMEOUT", "30")),
+            half_open_max=int(os.getenv("JIMENG_CB_HALF_OPEN_MAX", "1")),
+        )
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name, self.failure_threshold, self.reset_timeout, self.half_open_max
+            )
+            self._breakers[name] = breaker
+        return breaker
+
+    def stats(self) -> dict[str, dict[str, object]]:
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
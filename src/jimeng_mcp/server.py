@@ -11,57 +11,291 @@
 - stdio: 标准输入/输出 (默认,用于Claude Desktop)
 - sse: Server-Sent Events (用于Web客户端)
 - http: HTTP REST API (用于API集成)
+
+启动入口见 cli.py: .env 和必需配置在导入本模块之前加载和检查,
+各模式的传输层 (stdio、SSE、starlette/uvicorn) 只在运行该模式时导入。
 """
 
+if __name__ == "__main__":
+    # python -m jimeng_mcp.server: 交给命令行入口, 配置加载后再以包内模块名导入本模块,
+    # 避免本文件以 __main__ 和 jimeng_mcp.server 两个名字各初始化一次
+    from jimeng_mcp.cli import main
+
+    main()
+    raise SystemExit(0)
+
 import asyncio
+import contextlib
+import importlib.util
+import inspect
+import logging
 import os
 import sys
-import argparse
-from typing import Any, Optional
-from dotenv import load_dotenv
+import time
+from typing import Any, Awaitable, Callable, Optional
 import httpx
-from mcp.server.models import InitializationOptions
 from mcp.server import NotificationOptions, Server
-from mcp.server.stdio import stdio_server
 from mcp.types import (
+    CallToolResult,
     Tool,
     TextContent,
     ImageContent,
     EmbeddedResource,
 )
 
-# 尝试导入SSE和HTTP支持(可选依赖)
-try:
-    from mcp.server.sse import SseServerTransport
-    SSE_AVAILABLE = True
-except ImportError:
-    SSE_AVAILABLE = False
+from .admission import AdmissionController, background
+from .cache import ResultCache, request_key
+from .encoding import dumpb, dumps
+from .compression import CompressionMiddleware, compression_options
+from .errors import StructuredToolError
+from .http_client import get_http_client, open_http_client, close_http_client, request_timeout
+from .inputs import InputResolver, is_remote
+from .job_store import JobStore
+from .jobs import Job, JobManager, JobNotFoundError, JobStatus, JobSubscription, job_event
+from .logs import log_payload, payload, request_context, setup_logging, shutdown_logging
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, dump_periodically
+from .mirror import AssetMirror
+from .preflight import InputPreflight
+from .preview import PreviewRenderer
+from .progress import ProgressTracker, set_phase
+from .ratelimit import RateLimiter, RateLimitStatus, client_identity
+from .resilience import CircuitBreakerRegistry, RetryPolicy, is_breaker_failure, parse_retry_after
+from .shared import SessionRegistry, SharedFlight, SharedState
+from .singleflight import SingleFlight
+from .tools import ToolRegistry, ToolResult, ToolSpec
+from .tracing import Tracer, connection_trace, trace_phase
+from .upstream import UpstreamPool
+from .webhooks import InvalidCallbackError, WebhookDispatcher
+
+
+
+def _installed(*modules: str) -> bool:
+    """可选依赖是否已安装, 只查找不导入"""
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+
+# SSE和HTTP支持(可选依赖), 在创建对应应用时才导入
+SSE_AVAILABLE = _installed("starlette", "sse_starlette", "uvicorn")
+HTTP_AVAILABLE = _installed("starlette", "uvicorn")
+
+logger = logging.getLogger("jimeng_mcp.server")
+
+# 配置 (.env 由 cli.load_config 在导入本模块之前加载)
+DEFAULT_MODEL = os.getenv("JIMENG_MODEL", "jimeng-4.5")
 
-try:
-    from starlette.applications import Starlette
-    from starlette.routing import Route, Mount
-    from starlette.responses import JSONResponse
-    from starlette.middleware.cors import CORSMiddleware
-    import uvicorn
-    HTTP_AVAILABLE = True
-except ImportError:
-    HTTP_AVAILABLE = False
+# 指标 model 标签和耗时估算使用的已知模型, JIMENG_METRICS_MODELS 可追加 (逗号分隔);
+# model 参数由客户端任意填写, 其余取值一律记为 "other", 避免标签基数无限增长
+KNOWN_MODELS = frozenset(
+    {"jimeng-4.5", "jimeng-4.1", "jimeng-4.0", "jimeng-video-3.0", DEFAULT_MODEL}
+    | {m.strip() for m in os.getenv("JIMENG_METRICS_MODELS", "").split(",") if m.strip()}
+)
 
-# 加载环境变量
-load_dotenv()
 
-# 配置
-API_BASE_URL = os.getenv("JIMENG_API_URL", "https://jimeng.duckcloud.fun")
-API_KEY = os.getenv("JIMENG_API_KEY", "")
-DEFAULT_MODEL = os.getenv("JIMENG_MODEL", "jimeng-4.5")
+def model_label(model: Any) -> str:
+    """指标中使用的模型名, 未知模型记为 other"""
+    return model if model in KNOWN_MODELS else "other"
+
+# 上游服务与密钥池: JIMENG_API_URL/JIMENG_API_KEY 可用逗号分隔多个值,
+# 或通过 JIMENG_UPSTREAMS_FILE 指定配置文件。未配置密钥时导入不会失败, 调用时报错
+upstream_pool = UpstreamPool.from_env()
+API_BASE_URL = upstream_pool.targets[0].base_url if upstream_pool.targets else ""
+API_KEY = upstream_pool.targets[0].api_key if upstream_pool.targets else ""
+
+# 上游瞬时故障重试策略 (JIMENG_RETRY_*) 与按端点的熔断器 (JIMENG_CB_*)
+RETRY_POLICY = RetryPolicy.from_env()
+circuit_breakers = CircuitBreakerRegistry.from_env()
+
+# 生成类工具 (均可通过 submit_generation 异步执行)
+GENERATION_TOOLS = ("text_to_image", "image_composition", "text_to_video", "image_to_video")
+
+# 生成结果缓存 (JIMENG_CACHE=0 时禁用)
+result_cache = ResultCache.from_env()
+
+# 相同并发请求合并 (JIMENG_SINGLEFLIGHT=0 时禁用)
+inflight = SingleFlight.from_env()
+
+# 多工作进程之间的共享状态 (设置 JIMENG_SHARED_STATE_PATH 时启用, --workers 会自动设置)
+shared_state = SharedState.from_env()
+shared_flight = SharedFlight.from_env(shared_state) if inflight is not None else None
+
+# 按工具的并发限制和有界等待队列
+admission = AdmissionController.from_env()
+
+# 生成进度通知与按工具/模型的耗时估算
+progress_tracker = ProgressTracker()
+
+# 生成结果镜像到本地目录或S3 (JIMENG_MIRROR=off 时禁用)
+asset_mirror = AssetMirror.from_env()
+
+# 本地文件和 base64 图像输入, 写入镜像存储后以链接传给即梦 (JIMENG_INPUT_*)
+input_resolver = InputResolver.from_env(asset_mirror)
+
+# 调用上游前并发检查输入图像URL (JIMENG_PREFLIGHT=1 时启用)
+input_preflight = InputPreflight.from_env()
+
+# 图像结果的预览图, 以 ImageContent 返回 (JIMENG_PREVIEW=1 时启用, 需要 Pillow)
+preview_renderer = PreviewRenderer.from_env()
 
-if not API_KEY:
-    raise ValueError("JIMENG_API_KEY 环境变量是必需的")
+# 任务和生成请求的持久化记录 (设置 JIMENG_JOB_STORE_PATH 时启用)
+job_store = JobStore.from_env()
+
+# 异步任务结束后的 Webhook 回调 (JIMENG_WEBHOOKS=1 时启用, 其余配置见 JIMENG_WEBHOOK_*)
+webhooks = WebhookDispatcher.from_env()
+
+# 按客户端限流 (设置 JIMENG_RATE_LIMIT 时启用, 多工作进程模式下令牌桶在进程间共享)
+rate_limiter = RateLimiter.from_env(shared_state)
+
+# 请求追踪: 采样的 span 导出到文件或 OTLP 采集器 (JIMENG_TRACE_*)
+tracer = Tracer.from_env()
+
+# 运行指标, HTTP/SSE 模式通过 /metrics 导出
+metrics = MetricsRegistry()
+tool_duration_seconds = metrics.histogram(
+    "jimeng_tool_duration_seconds", "工具调用耗时(秒)", ("tool", "model", "outcome")
+)
+tool_errors_total = metrics.counter(
+    "jimeng_tool_errors_total", "工具调用失败次数, kind 为 timeout/http_<状态码>/empty_data 等", ("tool", "kind")
+)
+tool_in_flight = metrics.gauge("jimeng_tool_in_flight", "进行中的工具调用数", ("tool",))
+upstream_duration_seconds = metrics.histogram(
+    "jimeng_upstream_duration_seconds", "即梦API请求耗时(秒, 含重试)", ("endpoint", "model")
+)
+upstream_errors_total = metrics.counter(
+    "jimeng_upstream_errors_total", "即梦API请求失败次数", ("endpoint", "kind")
+)
+upstream_in_flight = metrics.gauge("jimeng_upstream_in_flight", "进行中的即梦API请求数", ("endpoint",))
+metrics.callback_gauge(
+    "jimeng_admission_queue_depth", "各工具排队等待的请求数", ("tool",),
+    lambda: {(name, ): stats["queue_depth"] for name, stats in admission.stats().items()}
+)
+metrics.callback_gauge(
+    "jimeng_admission_active", "各工具正在占用并发槽位的请求数", ("tool",),
+    lambda: {(name, ): stats["active"] for name, stats in admission.stats().items()}
+)
+metrics.callback_gauge(
+    "jimeng_jobs", "各状态的异步任务数", ("status",),
+    lambda: {(status.value, ): job_manager.count(status) for status in JobStatus}
+)
+
+
+def error_kind(error: BaseException) -> str:
+    """错误分类, 用于指标标签; 沿 __cause__ 查找被包装的原始错误"""
+    while error is not None:
+        if isinstance(error, httpx.TimeoutException):
+            return "timeout"
+        if isinstance(error, httpx.HTTPStatusError):
+            return f"http_{error.response.status_code}"
+        if isinstance(error, httpx.TransportError):
+            return "transport"
+        if isinstance(error, StructuredToolError):
+            return error.code
+        if isinstance(error, GenerationError):
+            return "empty_data"
+        if isinstance(error, asyncio.CancelledError):
+            return "cancelled"
+        error = error.__cause__
+    return "other"
 
 # 创建服务器实例
 server = Server("jimeng-mcp")
 
 
+async def post_with_retry(
+    endpoint: str,
+    data: dict[str, Any],
+    timeout: int
+) -> httpx.Response:
+    """发送请求, 对瞬时故障按重试策略重试
+
+    每次尝试都从上游池中选择 (服务地址, 密钥) 目标, 并经过该端点的熔断器,
+    因此被限流或熔断的目标在重试时会被绕开。
+
+    Returns:
+        状态码为2xx的响应; 不可重试或重试耗尽时抛出最后一次的异常
+    """
+    # 使用进程级共享连接池, 复用已建立的连接
+    client = get_http_client()
+    attempt = 1
+    while True:
+        target = upstream_pool.acquire(
+            healthy=lambda t: circuit_breakers.get(f"{t.base_url}{endpoint}").allows_request()
+        )
+        url = f"{target.base_url}{endpoint}"
+        headers = {
+            "Authorization": f"Bearer {target.api_key}",
+            "Content-Type": "application/json"
+        }
+        breaker = circuit_breakers.get(url)
+        try:
+            breaker.before_call()
+        except Exception:
+            upstream_pool.release(target)
+            raise
+
+        set_phase("submitted")
+        start = time.monotonic()
+        span = tracer.start_span("upstream", endpoint=endpoint, upstream=target.name, attempt=attempt)
+        headers["traceparent"] = span.traceparent()
+        try:
+            response = await client.post(
+                url, json=data, headers=headers, timeout=request_timeout(timeout),
+                extensions={"trace": connection_trace(span)}
+            )
+        except httpx.TransportError as e:
+            span.error = type(e).__name__
+            span.end()
+            upstream_pool.release(target)
+            breaker.record_failure()
+            error: Exception = e
+        except BaseException:
+            span.end()
+            upstream_pool.release(target)
+            breaker.record_abandoned()
+            raise
+        else:
+            span.set(status=response.status_code)
+            span.end()
+            latency = time.monotonic() - start
+            logger.info("上游响应", extra={
+                "endpoint": endpoint,
+                "upstream": target.name,
+                "status": response.status_code,
+                "attempt": attempt,
+                "duration_ms": round(latency * 1000, 1)
+            })
+            upstream_pool.release(
+                target,
+                latency=latency,
+                status=response.status_code,
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+            )
+            try:
+                response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                if is_breaker_failure(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                error = e
+            else:
+                breaker.record_success()
+                return response
+
+        delay = RETRY_POLICY.retry_delay(error, attempt)
+        if delay is None:
+            raise error
+        logger.warning("🔁 上游请求失败, 稍后重试", extra={
+            "endpoint": endpoint,
+            "upstream": target.name,
+            "attempt": attempt,
+            "error": type(error).__name__,
+            "delay": round(delay, 2)
+        })
+        with tracer.span("retry_wait", attempt=attempt):
+            await asyncio.sleep(delay)
+        attempt += 1
+
+
 async def make_api_request(
     endpoint: str,
     data: dict[str, Any],
@@ -72,529 +306,1439 @@ async def make_api_request(
     Args:
         endpoint: API端点
         data: 请求数据
-        timeout: 超时时间(秒),默认300秒
+        timeout: 单次尝试的超时时间(秒),默认300秒
 
     Returns:
         API响应数据
     """
-    url = f"{API_BASE_URL}{endpoint}"
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
+    logger.info("🔄 正在请求即梦API", extra={"endpoint": endpoint, "timeout": timeout})
+    log_payload("请求数据", data, endpoint=endpoint)
+    start = time.monotonic()
 
-    print(f"🔄 正在请求即梦API: {endpoint}")
-    print(f"⏱️  超时时间: {timeout}秒")
+    def elapsed_ms() -> float:
+        return round((time.monotonic() - start) * 1000, 1)
 
+    upstream_in_flight.inc(endpoint=endpoint)
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.post(url, json=data, headers=headers)
-            response.raise_for_status()
-            result = response.json()
-            print(f"✅ API请求成功")
-            print(f"📦 返回数据: {result}")
-            return result
+        with tracer.span("jimeng_api", endpoint=endpoint, model=data.get("model", "")):
+            response = await post_with_retry(endpoint, data, timeout)
+        result = response.json()
+        upstream_duration_seconds.observe(
+            time.monotonic() - start, endpoint=endpoint, model=model_label(data.get("model"))
+        )
+        if not result.get("data"):
+            upstream_errors_total.inc(endpoint=endpoint, kind="empty_data")
+        logger.info("✅ API请求成功", extra={
+            "endpoint": endpoint,
+            "duration_ms": elapsed_ms(),
+            "items": len(result.get("data") or [])
+        })
+        log_payload("📦 返回数据", result, endpoint=endpoint)
+        return result
     except httpx.TimeoutException as e:
-        print(f"❌ API请求超时: {timeout}秒")
+        upstream_errors_total.inc(endpoint=endpoint, kind="timeout")
+        logger.error("❌ API请求超时", extra={"endpoint": endpoint, "timeout": timeout, "duration_ms": elapsed_ms()})
         raise Exception(f"API请求超时({timeout}秒)，即梦API可能响应较慢，请稍后重试") from e
     except httpx.HTTPStatusError as e:
-        print(f"❌ API请求失败: HTTP {e.response.status_code}")
+        upstream_errors_total.inc(endpoint=endpoint, kind=f"http_{e.response.status_code}")
+        logger.error("❌ API请求失败", extra={
+            "endpoint": endpoint,
+            "status": e.response.status_code,
+            "body": payload(e.response.text),
+            "duration_ms": elapsed_ms()
+        })
         raise Exception(f"API请求失败: {e.response.text}") from e
     except Exception as e:
-        print(f"❌ API请求异常: {str(e)}")
+        upstream_errors_total.inc(endpoint=endpoint, kind=error_kind(e))
+        logger.error("❌ API请求异常", extra={"endpoint": endpoint, "error": str(e), "duration_ms": elapsed_ms()})
         raise
+    finally:
+        upstream_in_flight.dec(endpoint=endpoint)
 
 
-@server.list_tools()
-async def handle_list_tools() -> list[Tool]:
-    """列出可用的工具"""
-    return [
-        Tool(
-            name="text_to_image",
-            description=(
-                "使用即梦4.5根据文本提示生成图像。"
-                "基于详细的文本描述创建高质量图像。"
-                "支持多种宽高比和分辨率，jimeng-4.5/4.1/4.0支持智能多图生成。"
-            ),
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "prompt": {
-                        "type": "string",
-                        "description": "要生成图像的详细文本描述，jimeng-4.x支持多图生成（如'生成4张连续场景的图片'）"
-                    },
-                    "negative_prompt": {
-                        "type": "string",
-                        "description": "在生成的图像中要避免的内容(可选)",
-                        "default": ""
-                    },
-                    "ratio": {
-                        "type": "string",
-                        "description": "图像宽高比",
-                        "default": "1:1",
-                        "enum": ["1:1", "4:3", "3:4", "16:9", "9:16", "3:2", "2:3", "21:9"]
-                    },
-                    "resolution": {
-                        "type": "string",
-                        "description": "图像分辨率",
-                        "default": "2k",
-                        "enum": ["1k", "2k", "4k"]
-                    },
-                    "sample_strength": {
-                        "type": "number",
-                        "description": "精细度(0.0-1.0),数值越高越精细",
-                        "default": 0.5,
-                        "minimum": 0.0,
-                        "maximum": 1.0
-                    },
-                    "model": {
-                        "type": "string",
-                        "description": "用于生成的模型(jimeng-4.5推荐, jimeng-4.1, jimeng-4.0等)",
-                        "default": DEFAULT_MODEL
-                    }
-                },
-                "required": ["prompt"]
-            }
+async def admitted_api_request(
+    endpoint: str,
+    data: dict[str, Any],
+    timeout: int = 300,
+    tool: Optional[str] = None
+) -> dict[str, Any]:
+    """经过准入控制的即梦API请求
+
+    超出工具并发上限的请求排队等待, 队列已满或排队超时抛出 AdmissionRejected;
+    后台任务 (run_job_tool) 一直排队直到获得槽位。
+    """
+    queued = tracer.start_span("queue", tool=tool or endpoint)
+    try:
+        async with admission.slot(tool or endpoint):
+            queued.end()
+            return await make_api_request(endpoint, data, timeout)
+    finally:
+        queued.end()
+
+
+async def coalesced_api_request(
+    endpoint: str,
+    data: dict[str, Any],
+    timeout: int = 300,
+    tool: Optional[str] = None
+) -> dict[str, Any]:
+    """合并相同并发请求的即梦API请求
+
+    多个调用方同时发起相同请求时只向上游发起一次调用, 共享同一结果;
+    多工作进程模式下跨进程合并。
+    """
+    if inflight is None:
+        return await admitted_api_request(endpoint, data, timeout, tool)
+
+    key = request_key(endpoint, data)
+    if shared_flight is None:
+        return await inflight.do(key, lambda: admitted_api_request(endpoint, data, timeout, tool))
+    # 先在进程内合并, 再与其他工作进程合并
+    return await inflight.do(key, lambda: shared_flight.do(
+        key, lambda: admitted_api_request(endpoint, data, timeout, tool)
+    ))
+
+
+async def cached_api_request(
+    endpoint: str,
+    data: dict[str, Any],
+    timeout: int = 300,
+    cache_mode: Optional[str] = None,
+    tool: Optional[str] = None
+) -> dict[str, Any]:
+    """带结果缓存的即梦API请求
+
+    Args:
+        endpoint: API端点
+        data: 规范化后的请求数据, 同时作为缓存键
+        timeout: 超时时间(秒)
+        cache_mode: None 正常使用缓存; "bypass" 不读不写缓存; "refresh" 跳过读取但写入新结果
+        tool: 发起请求的工具名, 用于准入控制
+
+    Returns:
+        API响应数据
+    """
+    if cache_mode in ("bypass", "refresh"):
+        # 明确要求重新生成, 不与其他请求共享结果
+        result = await admitted_api_request(endpoint, data, timeout, tool)
+        if cache_mode == "refresh" and result_cache is not None and result.get("data"):
+            await result_cache.set(request_key(endpoint, data), result)
+        return result
+
+    if result_cache is None:
+        return await coalesced_api_request(endpoint, data, timeout, tool)
+
+    key = request_key(endpoint, data)
+    cached = await result_cache.get(key)
+    if cached is not None:
+        logger.info("💾 命中结果缓存", extra={"endpoint": endpoint})
+        return cached
+
+    result = await coalesced_api_request(endpoint, data, timeout, tool)
+    if result.get("data"):
+        await result_cache.set(key, result)
+    return result
+
+
+# 缓存控制参数 (仅图像工具支持)
+CACHE_ARGUMENT_SCHEMA = {
+    "type": "string",
+    "description": "结果缓存控制(可选): bypass 不使用缓存, refresh 忽略已有缓存并重新生成",
+    "enum": ["bypass", "refresh"]
+}
+
+# text_to_image 参数定义, batch_text_to_image 的每一项复用该定义
+TEXT_TO_IMAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "prompt": {
+            "type": "string",
+            "description": "要生成图像的详细文本描述，jimeng-4.x支持多图生成（如'生成4张连续场景的图片'）"
+        },
+        "negative_prompt": {
+            "type": "string",
+            "description": "在生成的图像中要避免的内容(可选)",
+            "default": ""
+        },
+        "ratio": {
+            "type": "string",
+            "description": "图像宽高比",
+            "default": "1:1",
+            "enum": ["1:1", "4:3", "3:4", "16:9", "9:16", "3:2", "2:3", "21:9"]
+        },
+        "resolution": {
+            "type": "string",
+            "description": "图像分辨率",
+            "default": "2k",
+            "enum": ["1k", "2k", "4k"]
+        },
+        "sample_strength": {
+            "type": "number",
+            "description": "精细度(0.0-1.0),数值越高越精细",
+            "default": 0.5,
+            "minimum": 0.0,
+            "maximum": 1.0
+        },
+        "model": {
+            "type": "string",
+            "description": "用于生成的模型(jimeng-4.5推荐, jimeng-4.1, jimeng-4.0等)",
+            "default": DEFAULT_MODEL
+        },
+        "cache": CACHE_ARGUMENT_SCHEMA
+    },
+    "required": ["prompt"]
+}
+
+IMAGE_COMPOSITION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "prompt": {
+            "type": "string",
+            "description": "如何合成图像的描述"
+        },
+        "images": {
+            "type": "array",
+            "description": "要合成的图像数组(1-10张), 每项为URL、本地文件路径、file:// URI 或 base64 数据",
+            "items": {
+                "type": "string"
+            },
+            "minItems": 1,
+            "maxItems": 10
+        },
+        "ratio": {
+            "type": "string",
+            "description": "输出图像宽高比",
+            "default": "1:1",
+            "enum": ["1:1", "4:3", "3:4", "16:9", "9:16", "3:2", "2:3", "21:9"]
+        },
+        "resolution": {
+            "type": "string",
+            "description": "输出图像分辨率",
+            "default": "2k",
+            "enum": ["1k", "2k", "4k"]
+        },
+        "sample_strength": {
+            "type": "number",
+            "description": "精细度(0.0-1.0)",
+            "default": 0.5,
+            "minimum": 0.0,
+            "maximum": 1.0
+        },
+        "model": {
+            "type": "string",
+            "description": "用于合成的模型",
+            "default": DEFAULT_MODEL
+        },
+        "cache": CACHE_ARGUMENT_SCHEMA
+    },
+    "required": ["prompt", "images"]
+}
+
+TEXT_TO_VIDEO_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "prompt": {
+            "type": "string",
+            "description": "要生成视频的详细文本描述"
+        },
+        "ratio": {
+            "type": "string",
+            "description": "视频宽高比",
+            "default": "1:1",
+            "enum": ["1:1", "4:3", "3:4", "16:9", "9:16"]
+        },
+        "resolution": {
+            "type": "string",
+            "description": "视频分辨率",
+            "default": "720p",
+            "enum": ["480p", "720p", "1080p"]
+        },
+        "duration": {
+            "type": "integer",
+            "description": "视频时长(秒)",
+            "default": 5,
+            "enum": [5, 10]
+        },
+        "model": {
+            "type": "string",
+            "description": "用于视频生成的模型",
+            "default": "jimeng-video-3.0"
+        }
+    },
+    "required": ["prompt"]
+}
+
+IMAGE_TO_VIDEO_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "prompt": {
+            "type": "string",
+            "description": "如何为图像添加动画效果的描述"
+        },
+        "file_paths": {
+            "type": "array",
+            "description": "首帧/尾帧图像数组, 每项为URL、本地文件路径、file:// URI 或 base64 数据",
+            "items": {
+                "type": "string"
+            },
+            "minItems": 1
+        },
+        "ratio": {
+            "type": "string",
+            "description": "视频宽高比",
+            "default": "1:1",
+            "enum": ["1:1", "4:3", "3:4", "16:9", "9:16"]
+        },
+        "resolution": {
+            "type": "string",
+            "description": "视频分辨率",
+            "default": "720p",
+            "enum": ["480p", "720p", "1080p"]
+        },
+        "duration": {
+            "type": "integer",
+            "description": "视频时长(秒)",
+            "default": 5,
+            "enum": [5, 10]
+        },
+        "model": {
+            "type": "string",
+            "description": "用于视频生成的模型",
+            "default": "jimeng-video-3.0"
+        }
+    },
+    "required": ["prompt", "file_paths"]
+}
+
+# 批量生成的最大条目数和最大并发数
+BATCH_MAX_ITEMS = int(os.getenv("JIMENG_BATCH_MAX_ITEMS", "50"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("JIMENG_BATCH_MAX_CONCURRENCY", "8"))
+
+BATCH_TEXT_TO_IMAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "description": f"要生成的图像列表(1-{BATCH_MAX_ITEMS}项),每项参数同 text_to_image",
+            "items": TEXT_TO_IMAGE_SCHEMA,
+            "minItems": 1,
+            "maxItems": BATCH_MAX_ITEMS
+        },
+        "concurrency": {
+            "type": "integer",
+            "description": "同时进行的生成数",
+            "default": 4,
+            "minimum": 1,
+            "maximum": BATCH_MAX_CONCURRENCY
+        }
+    },
+    "required": ["items"]
+}
+
+SUBMIT_GENERATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tool": {
+            "type": "string",
+            "description": "要执行的生成工具",
+            "enum": list(GENERATION_TOOLS)
+        },
+        "arguments": {
+            "type": "object",
+            "description": "传给生成工具的参数,与直接调用该工具时相同"
+        },
+        "callback_url": {
+            "type": "string",
+            "description": "可选,任务结束后把结果 POST 到该地址"
+        },
+        "callback_secret": {
+            "type": "string",
+            "description": "可选,回调签名密钥 (X-Jimeng-Signature 为 HMAC-SHA256)"
+        }
+    },
+    "required": ["tool", "arguments"]
+}
+
+JOB_ID_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "job_id": {
+            "type": "string",
+            "description": "submit_generation 返回的任务ID"
+        }
+    },
+    "required": ["job_id"]
+}
+
+LIST_JOBS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "status": {
+            "type": "string",
+            "description": "只列出该状态的任务(可选)",
+            "enum": [status.value for status in JobStatus]
+        },
+        "limit": {
+            "type": "integer",
+            "description": "最多返回的任务数",
+            "default": 20,
+            "minimum": 1,
+            "maximum": 200
+        }
+    }
+}
+
+
+class GenerationError(Exception):
+    """上游调用成功但未返回任何生成结果"""
+
+
+async def mirror_links(urls: list[str]) -> dict[str, str]:
+    """镜像生成结果, 返回 原始链接 → 镜像链接
+
+    未启用镜像、镜像失败或在等待时间内未完成的链接不在返回值中。
+    """
+    if asset_mirror is None or not urls:
+        return {}
+    set_phase("mirroring")
+    trace_phase("mirror")
+    assets = await asset_mirror.mirror_all(urls)
+    set_phase("formatting")
+    trace_phase("format")
+    return {url: asset.url for url, asset in assets.items() if asset is not None}
+
+
+async def with_preview(
+    text: TextContent,
+    urls: list[str],
+    enabled: bool = True
+) -> list[TextContent | ImageContent]:
+    """在文本结果后附加图像预览; 未启用或生成失败时只返回文本"""
+    if preview_renderer is None or not enabled:
+        return [text]
+    set_phase("previewing")
+    trace_phase("preview")
+    image = await preview_renderer.render(urls)
+    return [text, image] if image is not None else [text]
+
+
+async def resolve_inputs(values: list[str]) -> list[str]:
+    """把本地文件和 base64 输入转换为链接; 启用预检时先检查其中的URL, 不合格时不再上传"""
+    if input_preflight is not None:
+        urls = [value.strip() for value in values if is_remote(value.strip())]
+        if urls:
+            set_phase("preflight")
+            trace_phase("preflight")
+            await input_preflight.check_all(urls)
+    return await input_resolver.resolve_all(values)
+
+
+async def text_to_image_payload(arguments: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "model": arguments.get("model", DEFAULT_MODEL),
+        "prompt": arguments["prompt"],
+        "negative_prompt": arguments.get("negative_prompt", ""),
+        "ratio": arguments.get("ratio", "1:1"),
+        "resolution": arguments.get("resolution", "2k"),
+        "sample_strength": arguments.get("sample_strength", 0.5)
+    }
+
+
+async def image_composition_payload(arguments: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "model": arguments.get("model", DEFAULT_MODEL),
+        "prompt": arguments["prompt"],
+        # 本地文件和 base64 输入转换为即梦可访问的链接
+        "images": await resolve_inputs(arguments["images"]),
+        "ratio": arguments.get("ratio", "1:1"),
+        "resolution": arguments.get("resolution", "2k"),
+        "sample_strength": arguments.get("sample_strength", 0.5)
+    }
+
+
+async def text_to_video_payload(arguments: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "model": arguments.get("model", "jimeng-video-3.0"),
+        "prompt": arguments["prompt"],
+        "ratio": arguments.get("ratio", "1:1"),
+        "resolution": arguments.get("resolution", "720p"),
+        "duration": arguments.get("duration", 5)
+    }
+
+
+async def image_to_video_payload(arguments: dict[str, Any]) -> dict[str, Any]:
+    return {
+        **await text_to_video_payload(arguments),
+        "file_paths": await resolve_inputs(arguments["file_paths"]),
+    }
+
+
+def format_image_result(
+    arguments: dict[str, Any],
+    data: dict[str, Any],
+    result: dict[str, Any],
+    urls: list[str],
+    mirrors: dict[str, str]
+) -> str:
+    lines = [f"✅ 成功生成 {len(urls)} 张图像", "", "📷 图像URL列表:", "=" * 60]
+    for i, url in enumerate(urls, 1):
+        lines += ["", f"图像 {i}:", url]
+        if url in mirrors:
+            lines.append(f"镜像: {mirrors[url]}")
+    lines += ["", "=" * 60, "", "💡 提示: 点击URL即可在浏览器中查看图像"]
+    return "\n".join(lines)
+
+
+def format_composition_result(
+    arguments: dict[str, Any],
+    data: dict[str, Any],
+    result: dict[str, Any],
+    urls: list[str],
+    mirrors: dict[str, str]
+) -> str:
+    input_count = result.get("input_images", len(arguments["images"]))
+    comp_type = result.get("composition_type", "composition")
+    lines = [
+        f"✅ 成功将 {input_count} 张图像合成为 {len(urls)} 个结果",
+        f"🎨 合成类型: {comp_type}",
+        "",
+        "📷 合成结果URL列表:",
+        "=" * 60,
+    ]
+    for i, url in enumerate(urls, 1):
+        lines += ["", f"合成图像 {i}:", url]
+        if url in mirrors:
+            lines.append(f"镜像: {mirrors[url]}")
+    lines += ["", "=" * 60, "", "💡 提示: 点击URL即可在浏览器中查看合成图像"]
+    return "\n".join(lines)
+
+
+def format_video_result(
+    arguments: dict[str, Any],
+    data: dict[str, Any],
+    result: dict[str, Any],
+    urls: list[str],
+    mirrors: dict[str, str]
+) -> str:
+    videos = result["data"]
+    if "file_paths" in data:
+        lines = [f"✅ 成功从 {len(data['file_paths'])} 张图像生成 {len(videos)} 个视频"]
+    else:
+        lines = [f"✅ 成功生成 {len(videos)} 个视频"]
+    lines += ["", "🎬 视频URL列表:", "=" * 60]
+    for i, (video, url) in enumerate(zip(videos, urls), 1):
+        lines += ["", f"视频 {i}:", f"URL: {url}"]
+        if url in mirrors:
+            lines.append(f"镜像: {mirrors[url]}")
+        lines.append(f"提示词: {video.get('revised_prompt', arguments['prompt'])}")
+    lines += ["", "=" * 60, "", "💡 提示: 点击URL即可在浏览器中查看视频"]
+    return "\n".join(lines)
+
+
+def structured_result(
+    spec: ToolSpec,
+    data: dict[str, Any],
+    result: dict[str, Any],
+    urls: list[str],
+    mirrors: dict[str, str],
+    timings: dict[str, float]
+) -> dict[str, Any]:
+    """生成结果的结构化形式, 供HTTP接口和MCP结构化输出使用
+
+    字段: tool、model、count、urls、items (每项的 url, 以及存在时的 mirror_url 和 revised_prompt)、
+    input_count (合成和图像生成视频)、composition_type (合成)、timings (各阶段耗时, 毫秒)。
+    """
+    items = []
+    for item, url in zip(result["data"], urls):
+        entry = {"url": url}
+        if url in mirrors:
+            entry["mirror_url"] = mirrors[url]
+        if "revised_prompt" in item:
+            entry["revised_prompt"] = item["revised_prompt"]
+        items.append(entry)
+    structured: dict[str, Any] = {
+        "tool": spec.name,
+        "model": data.get("model", spec.default_model),
+        "count": len(urls),
+        "urls": urls,
+        "items": items,
+    }
+    inputs = data.get("images", data.get("file_paths"))
+    if inputs is not None:
+        structured["input_count"] = result.get("input_images", len(inputs))
+    if "composition_type" in result or "images" in data:
+        structured["composition_type"] = result.get("composition_type", "composition")
+    structured["timings"] = timings
+    return structured
+
+
+def payload_summary(data: dict[str, Any]) -> dict[str, Any]:
+    """请求数据中适合写入日志的字段"""
+    summary: dict[str, Any] = {"prompt": payload(data["prompt"], 100)}
+    inputs = data.get("images", data.get("file_paths"))
+    if inputs is not None:
+        summary["images"] = len(inputs)
+    for key in ("ratio", "resolution", "duration"):
+        if key in data:
+            summary[key] = data[key]
+    return summary
+
+
+async def run_tool(
+    name: str,
+    arguments: dict[str, Any],
+    report_progress: bool = True,
+    preview: bool = True
+) -> list[TextContent | ImageContent | EmbeddedResource]:
+    """执行生成工具并返回格式化结果
+
+    与 handle_call_tool 不同, 出错时直接抛出异常, 供异步任务和HTTP路由判断成败。
+
+    Args:
+        name: 工具名
+        arguments: 工具参数
+        report_progress: 客户端提供进度令牌时是否发送进度通知;
+            异步任务和批量生成中的单项不应向发起请求的客户端发送进度
+        preview: 启用预览时是否生成预览图; 批量生成的单项只使用文本结果
+    """
+    spec = tool_registry.get(name)
+    progress = request_progress() if report_progress else None
+    model = arguments.get("model", spec.default_model or DEFAULT_MODEL)
+    label = model_label(model)
+    with request_context(tool=name, model=model), tracer.span("tool", tool=name, model=model):
+        start = time.monotonic()
+        tool_in_flight.inc(tool=name)
+        try:
+            async with progress_tracker.track(name, label, progress):
+                result = await execute_tool(spec, arguments, preview)
+        except BaseException as e:
+            elapsed = time.monotonic() - start
+            tool_duration_seconds.observe(elapsed, tool=name, model=label, outcome="error")
+            tool_errors_total.inc(tool=name, kind=error_kind(e))
+            logger.warning("工具调用失败", extra={
+                "duration_ms": round(elapsed * 1000, 1),
+                "error": str(e) or type(e).__name__
+            })
+            raise
+        finally:
+            tool_in_flight.dec(tool=name)
+        elapsed = time.monotonic() - start
+        tool_duration_seconds.observe(elapsed, tool=name, model=label, outcome="success")
+        logger.info("工具调用完成", extra={"duration_ms": round(elapsed * 1000, 1)})
+        return result
+
+
+async def execute_tool(
+    spec: ToolSpec,
+    arguments: dict[str, Any],
+    preview: bool = True
+) -> list[TextContent | ImageContent | EmbeddedResource]:
+    """按工具定义调用即梦API并格式化结果
+
+    返回 ToolResult: 文本结果 (和预览图), 以及 structured_result 得到的结构化结果。
+
+    Args:
+        spec: 生成类工具的定义
+        arguments: 工具参数
+        preview: 启用预览时是否为图像结果附加预览图
+    """
+    start = time.monotonic()
+    data = await spec.build_payload(arguments)
+    logger.info(spec.started_message, extra=payload_summary(data))
+
+    upstream_start = time.monotonic()
+    if spec.cacheable:
+        result = await cached_api_request(
+            spec.endpoint, data, timeout=spec.timeout,
+            cache_mode=arguments.get("cache"), tool=spec.name
+        )
+    else:
+        result = await coalesced_api_request(spec.endpoint, data, timeout=spec.timeout, tool=spec.name)
+    upstream_end = time.monotonic()
+    set_phase("formatting")
+    trace_phase("format")
+
+    items = result.get("data", [])
+    if not items:
+        logger.warning(f"❌ {spec.empty_message}")
+        raise GenerationError(spec.empty_message)
+
+    logger.info(spec.succeeded_message, extra={"count": len(items)})
+    urls = [item.get("url", "") for item in items]
+    mirrors = await mirror_links(urls)
+    text = TextContent(type="text", text=spec.format_result(arguments, data, result, urls, mirrors))
+    content = await with_preview(text, urls, preview) if spec.preview else [text]
+    timings = {
+        "prepare_ms": round((upstream_start - start) * 1000, 1),
+        "upstream_ms": round((upstream_end - upstream_start) * 1000, 1),
+        "total_ms": round((time.monotonic() - start) * 1000, 1),
+    }
+    return ToolResult(content, structured_result(spec, data, result, urls, mirrors, timings))
+
+
+async def run_job_tool(
+    name: str,
+    arguments: dict[str, Any]
+) -> list[TextContent | ImageContent | EmbeddedResource]:
+    """在后台任务中执行生成工具: 不发送进度通知, 开始新的 trace, 并按后台任务排队等待上游槽位
+
+    任务提交时已经被接受, 排队时不会因队列已满或排队超时失败。
+    """
+    with tracer.detached(), background():
+        return await run_tool(name, arguments, report_progress=False)
+
+
+# 后台任务管理器, 提交时按工具定义校验参数
+job_manager = JobManager(
+    run_job_tool, GENERATION_TOOLS, store=job_store,
+    validate=lambda tool, arguments: tool_registry.validate(tool, arguments),
+    on_finished=webhooks.job_finished if webhooks is not None else None
+)
+
+
+def submit_job(
+    tool: str,
+    arguments: dict[str, Any],
+    client_id: Optional[str] = None,
+    callback_url: Optional[str] = None,
+    callback_secret: Optional[str] = None
+) -> Job:
+    """提交异步任务; 指定 callback_url 时任务结束后把结果 POST 到该地址"""
+    if callback_url is not None:
+        if webhooks is None:
+            raise InvalidCallbackError("未启用 Webhook 回调, 设置 JIMENG_WEBHOOKS=1 启用", str(callback_url))
+        webhooks.check(callback_url, callback_secret)
+    job = job_manager.submit(tool, arguments, client_id=client_id)
+    if callback_url is not None:
+        webhooks.register(job.id, callback_url, callback_secret)
+    logger.info("📥 已提交异步任务", extra={
+        "job_id": job.id, "job_tool": job.tool, "callback": callback_url is not None
+    })
+    return job
+
+
+async def run_batch_text_to_image(
+    items: list[dict[str, Any]],
+    concurrency: int = 4,
+    on_result: Optional[Callable[[dict[str, Any]], Awaitable[None]]] = None
+) -> list[dict[str, Any]]:
+    """并发执行多个 text_to_image, 每完成一项回调一次
+
+    Args:
+        items: 每项为 text_to_image 的参数
+        concurrency: 同时进行的生成数, 不超过 JIMENG_BATCH_MAX_CONCURRENCY
+        on_result: 每项完成时的回调, 参数为该项的结果记录
+
+    Returns:
+        按输入顺序排列的结果记录: {"index", "success", "text"}, 成功的项还有结构化结果 "data"
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("items 必须是非空数组")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"一次最多生成 {BATCH_MAX_ITEMS} 项")
+
+    limit = max(1, min(int(concurrency), BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(limit)
+    records: list[Optional[dict[str, Any]]] = [None] * len(items)
+
+    async def generate(index: int, item: dict[str, Any]) -> None:
+        async with semaphore:
+            try:
+                content = await run_tool("text_to_image", item, report_progress=False, preview=False)
+                record = {"index": index, "success": True, "text": content[0].text, "data": content.structured}
+            except GenerationError as e:
+                record = {"index": index, "success": False, "text": str(e)}
+            except Exception as e:
+                record = {"index": index, "success": False, "text": f"执行 text_to_image 时出错: {str(e)}"}
+        records[index] = record
+        if on_result is not None:
+            await on_result(record)
+
+    logger.info("📚 开始批量生成", extra={"items": len(items), "concurrency": limit})
+    await asyncio.gather(*(generate(i, item) for i, item in enumerate(items)))
+    return [record for record in records if record is not None]
+
+
+async def handle_batch_text_to_image(
+    arguments: dict[str, Any]
+) -> list[TextContent | ImageContent | EmbeddedResource]:
+    """处理批量生成, 有进度令牌时每完成一项发送一次进度通知"""
+    items = arguments.get("items") or []
+    progress = request_progress()
+    completed = 0
+
+    async def notify(record: dict[str, Any]) -> None:
+        nonlocal completed
+        completed += 1
+        if progress is None:
+            return
+        session, token = progress
+        status = "✅" if record["success"] else "❌"
+        await session.send_progress_notification(
+            token,
+            completed,
+            total=len(items),
+            message=f"{status} 第 {record['index'] + 1} 项完成\n{record['text']}"
+        )
+
+    records = await run_batch_text_to_image(items, arguments.get("concurrency", 4), notify)
+    succeeded = sum(1 for record in records if record["success"])
+
+    parts = [f"📚 批量生成完成: 成功 {succeeded} 项, 失败 {len(records) - succeeded} 项\n"]
+    for record in records:
+        status = "✅" if record["success"] else "❌"
+        parts.append(f"\n{'=' * 60}\n{status} 第 {record['index'] + 1} 项\n{record['text']}\n")
+    return ToolResult([TextContent(type="text", text="".join(parts))], {
+        "succeeded": succeeded,
+        "failed": len(records) - succeeded,
+        "items": [
+            {"index": record["index"], "success": True, **record["data"]} if record["success"]
+            else {"index": record["index"], "success": False, "error": record["text"]}
+            for record in records
+        ],
+    })
+
+
+def request_progress() -> Optional[tuple[Any, Any]]:
+    """返回当前MCP请求的 (会话, 进度令牌), 客户端未请求进度或不在MCP请求中时返回None"""
+    try:
+        ctx = server.request_context
+    except LookupError:
+        return None
+    token = ctx.meta.progressToken if ctx.meta is not None else None
+    if token is None:
+        return None
+    return ctx.session, token
+
+
+async def submit_generation_tool(
+    arguments: dict[str, Any]
+) -> list[TextContent | ImageContent | EmbeddedResource]:
+    job = submit_job(
+        arguments["tool"], arguments.get("arguments") or {},
+        callback_url=arguments.get("callback_url"),
+        callback_secret=arguments.get("callback_secret")
+    )
+    return [TextContent(type="text", text=format_job_status(job))]
+
+
+async def get_job_status_tool(
+    arguments: dict[str, Any]
+) -> list[TextContent | ImageContent | EmbeddedResource]:
+    job = await job_manager.get(arguments["job_id"])
+    return [TextContent(type="text", text=format_job_status(job))]
+
+
+async def get_job_result_tool(
+    arguments: dict[str, Any]
+) -> list[TextContent | ImageContent | EmbeddedResource]:
+    job = await job_manager.get(arguments["job_id"])
+    if job.status is JobStatus.SUCCEEDED:
+        return list(job.result or [])
+    if job.status.finished:
+        return [TextContent(type="text", text=f"❌ 任务 {job.id} 未成功: {job.error}")]
+    return [TextContent(
+        type="text",
+        text=f"⏳ 任务 {job.id} 尚未完成, 当前状态: {job.status.value}, "
+             f"已耗时 {job.elapsed:.1f} 秒, 请稍后再查询"
+    )]
+
+
+async def list_jobs_tool(
+    arguments: dict[str, Any]
+) -> list[TextContent | ImageContent | EmbeddedResource]:
+    jobs = await job_manager.list_jobs(arguments.get("status"), arguments.get("limit", 20))
+    if not jobs:
+        return [TextContent(type="text", text="📭 当前没有任务")]
+    lines = [f"📋 共 {len(jobs)} 个任务", "=" * 60]
+    for job in jobs:
+        lines += ["", f"{job.id}  {job.tool}  {job.status.value}  {job.elapsed:.1f}秒"]
+    lines += ["", "=" * 60]
+    return [TextContent(type="text", text="\n".join(lines))]
+
+
+def format_job_status(job: Job) -> str:
+    """格式化任务状态文本"""
+    created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job.created_at))
+    lines = [
+        f"📋 任务ID: {job.id}",
+        f"🔧 工具: {job.tool}",
+        f"📊 状态: {job.status.value}",
+        f"🕐 创建时间: {created}",
+        f"⏱️  已耗时: {job.elapsed:.1f}秒",
+    ]
+    if job.error:
+        lines.append(f"❌ 错误: {job.error}")
+    if not job.status.finished:
+        lines += ["", "💡 提示: 使用 get_job_status 查询进度, 完成后使用 get_job_result 获取结果"]
+    else:
+        lines.append("")
+    return "\n".join(lines)
+
+
+# 工具注册表: 按工具名分派, 参数校验器和工具列表在此构建一次
+tool_registry = ToolRegistry([
+    ToolSpec(
+        name="text_to_image",
+        description=(
+            "使用即梦4.5根据文本提示生成图像。"
+            "基于详细的文本描述创建高质量图像。"
+            "支持多种宽高比和分辨率，jimeng-4.5/4.1/4.0支持智能多图生成。"
         ),
-        Tool(
-            name="image_composition",
-            description=(
-                "使用即梦4.5合成/融合多张图像。"
-                "接受1-10张图像,根据文本提示将它们组合在一起。"
-                "适用于图像混合、风格迁移或创建合成图像。"
-            ),
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "prompt": {
-                        "type": "string",
-                        "description": "如何合成图像的描述"
-                    },
-                    "images": {
-                        "type": "array",
-                        "description": "要合成的图像URL数组(1-10张图像)",
-                        "items": {
-                            "type": "string"
-                        },
-                        "minItems": 1,
-                        "maxItems": 10
-                    },
-                    "ratio": {
-                        "type": "string",
-                        "description": "输出图像宽高比",
-                        "default": "1:1",
-                        "enum": ["1:1", "4:3", "3:4", "16:9", "9:16", "3:2", "2:3", "21:9"]
-                    },
-                    "resolution": {
-                        "type": "string",
-                        "description": "输出图像分辨率",
-                        "default": "2k",
-                        "enum": ["1k", "2k", "4k"]
-                    },
-                    "sample_strength": {
-                        "type": "number",
-                        "description": "精细度(0.0-1.0)",
-                        "default": 0.5,
-                        "minimum": 0.0,
-                        "maximum": 1.0
-                    },
-                    "model": {
-                        "type": "string",
-                        "description": "用于合成的模型",
-                        "default": DEFAULT_MODEL
-                    }
-                },
-                "required": ["prompt", "images"]
-            }
+        input_schema=TEXT_TO_IMAGE_SCHEMA,
+        endpoint="/v1/images/generations",
+        # 服务端 generateImages 无超时限制，客户端设置15分钟保护
+        # 理由: 服务端每秒轮询一次，理论上无限循环，客户端必须设置合理超时
+        timeout=900,
+        build_payload=text_to_image_payload,
+        format_result=format_image_result,
+        default_model=DEFAULT_MODEL,
+        cacheable=True,
+        preview=True,
+        started_message="🎨 开始生成图像",
+        succeeded_message="✅ 图像生成成功",
+        empty_message="图像生成失败,未返回任何URL",
+    ),
+    ToolSpec(
+        name="image_composition",
+        description=(
+            "使用即梦4.5合成/融合多张图像。"
+            "接受1-10张图像,根据文本提示将它们组合在一起。"
+            "适用于图像混合、风格迁移或创建合成图像。"
         ),
-        Tool(
-            name="text_to_video",
-            description=(
-                "使用即梦视频3.0根据文本提示生成视频。"
-                "基于文本描述创建短视频剪辑。"
-                "支持多种宽高比、分辨率和时长设置。"
-            ),
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "prompt": {
-                        "type": "string",
-                        "description": "要生成视频的详细文本描述"
-                    },
-                    "ratio": {
-                        "type": "string",
-                        "description": "视频宽高比",
-                        "default": "1:1",
-                        "enum": ["1:1", "4:3", "3:4", "16:9", "9:16"]
-                    },
-                    "resolution": {
-                        "type": "string",
-                        "description": "视频分辨率",
-                        "default": "720p",
-                        "enum": ["480p", "720p", "1080p"]
-                    },
-                    "duration": {
-                        "type": "integer",
-                        "description": "视频时长(秒)",
-                        "default": 5,
-                        "enum": [5, 10]
-                    },
-                    "model": {
-                        "type": "string",
-                        "description": "用于视频生成的模型",
-                        "default": "jimeng-video-3.0"
-                    }
-                },
-                "required": ["prompt"]
-            }
+        input_schema=IMAGE_COMPOSITION_SCHEMA,
+        endpoint="/v1/images/compositions",
+        # 服务端 generateImageComposition 最大轮询600次(10分钟)，客户端设置11分钟
+        # 理由: 服务端每秒轮询一次，最多600秒，客户端需要略大于此值以接收完整响应
+        timeout=660,
+        build_payload=image_composition_payload,
+        format_result=format_composition_result,
+        default_model=DEFAULT_MODEL,
+        cacheable=True,
+        preview=True,
+        started_message="🎨 开始图像合成",
+        succeeded_message="✅ 图像合成成功",
+        empty_message="图像合成失败,未返回任何URL",
+    ),
+    ToolSpec(
+        name="text_to_video",
+        description=(
+            "使用即梦视频3.0根据文本提示生成视频。"
+            "基于文本描述创建短视频剪辑。"
+            "支持多种宽高比、分辨率和时长设置。"
         ),
-        Tool(
-            name="image_to_video",
-            description=(
-                "使用即梦视频3.0从图像生成视频。"
-                "接受一张或多张图像作为首帧/尾帧,根据文本提示为它们添加动画效果。"
-                "适用于从静态图像创建动画。"
-            ),
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "prompt": {
-                        "type": "string",
-                        "description": "如何为图像添加动画效果的描述"
-                    },
-                    "file_paths": {
-                        "type": "array",
-                        "description": "首帧/尾帧图像URL数组",
-                        "items": {
-                            "type": "string"
-                        },
-                        "minItems": 1
-                    },
-                    "ratio": {
-                        "type": "string",
-                        "description": "视频宽高比",
-                        "default": "1:1",
-                        "enum": ["1:1", "4:3", "3:4", "16:9", "9:16"]
-                    },
-                    "resolution": {
-                        "type": "string",
-                        "description": "视频分辨率",
-                        "default": "720p",
-                        "enum": ["480p", "720p", "1080p"]
-                    },
-                    "duration": {
-                        "type": "integer",
-                        "description": "视频时长(秒)",
-                        "default": 5,
-                        "enum": [5, 10]
-                    },
-                    "model": {
-                        "type": "string",
-                        "description": "用于视频生成的模型",
-                        "default": "jimeng-video-3.0"
-                    }
-                },
-                "required": ["prompt", "file_paths"]
-            }
-        )
-    ]
+        input_schema=TEXT_TO_VIDEO_SCHEMA,
+        endpoint="/v1/videos/generations",
+        timeout=600,
+        build_payload=text_to_video_payload,
+        format_result=format_video_result,
+        default_model="jimeng-video-3.0",
+        started_message="🎬 开始生成视频",
+        succeeded_message="✅ 视频生成成功",
+        empty_message="视频生成失败,未返回任何URL",
+    ),
+    ToolSpec(
+        name="image_to_video",
+        description=(
+            "使用即梦视频3.0从图像生成视频。"
+            "接受一张或多张图像作为首帧/尾帧,根据文本提示为它们添加动画效果。"
+            "适用于从静态图像创建动画。"
+        ),
+        input_schema=IMAGE_TO_VIDEO_SCHEMA,
+        endpoint="/v1/videos/generations",
+        timeout=600,
+        build_payload=image_to_video_payload,
+        format_result=format_video_result,
+        default_model="jimeng-video-3.0",
+        started_message="🎬 开始图像生成视频",
+        succeeded_message="✅ 视频生成成功",
+        empty_message="视频生成失败,未返回任何URL",
+    ),
+    ToolSpec(
+        name="batch_text_to_image",
+        description=(
+            "批量根据多个文本提示生成图像。"
+            "每一项的参数与 text_to_image 相同,多项并发执行,"
+            "每完成一项即通过进度通知推送结果,最后返回全部结果汇总。"
+        ),
+        input_schema=BATCH_TEXT_TO_IMAGE_SCHEMA,
+        handler=handle_batch_text_to_image,
+    ),
+    ToolSpec(
+        name="submit_generation",
+        description=(
+            "异步提交一个生成任务并立即返回任务ID。"
+            "适用于耗时较长的图像/视频生成,提交后使用 get_job_status 查询进度,"
+            "完成后使用 get_job_result 获取结果。"
+        ),
+        input_schema=SUBMIT_GENERATION_SCHEMA,
+        handler=submit_generation_tool,
+    ),
+    ToolSpec(
+        name="get_job_status",
+        description="查询异步生成任务的状态和已耗时间。",
+        input_schema=JOB_ID_SCHEMA,
+        handler=get_job_status_tool,
+    ),
+    ToolSpec(
+        name="get_job_result",
+        description="获取异步生成任务的结果。任务未完成时返回当前状态。",
+        input_schema=JOB_ID_SCHEMA,
+        handler=get_job_result_tool,
+    ),
+    ToolSpec(
+        name="list_jobs",
+        description="列出最近的异步生成任务,可按状态过滤。",
+        input_schema=LIST_JOBS_SCHEMA,
+        handler=list_jobs_tool,
+    ),
+])
+
+
+@server.list_tools()
+async def handle_list_tools() -> list[Tool]:
+    """列出可用的工具"""
+    return tool_registry.tools()
+
+
+# MCP 结构化输出: 启用时生成类工具和批量生成的结果同时以 structuredContent 返回
+STRUCTURED_OUTPUT = os.getenv("JIMENG_STRUCTURED_OUTPUT", "0").strip().lower() in ("1", "true", "yes", "on")
+if STRUCTURED_OUTPUT and "structuredContent" not in CallToolResult.model_fields:
+    raise RuntimeError(
+        "JIMENG_STRUCTURED_OUTPUT 需要支持结构化输出的MCP SDK。\n"
+        "请运行: pip install \"mcp>=1.10\""
+    )
+
+
+# 参数由注册表中预编译的校验器检查, 不再由SDK对每次调用执行 jsonschema.validate
+# (旧版本SDK没有 validate_input 参数, 本身也不校验)
+if "validate_input" in inspect.signature(server.call_tool).parameters:
+    call_tool_decorator = server.call_tool(validate_input=False)
+else:
+    call_tool_decorator = server.call_tool()
 
 
-@server.call_tool()
 async def handle_call_tool(
     name: str,
     arguments: dict[str, Any] | None
 ) -> list[TextContent | ImageContent | EmbeddedResource]:
-    """处理工具调用"""
+    """处理工具调用, 生成类工具的结果是带有结构化结果的 ToolResult"""
+    spec = tool_registry.get(name)
+    arguments = arguments or {}
+    spec.validate(arguments)
 
-    if not arguments:
-        raise ValueError("参数是必需的")
+    with tracer.span("call_tool", tool=name):
+        try:
+            if spec.handler is not None:
+                return await spec.handler(arguments)
+            return await job_manager.record(name, arguments, lambda: run_tool(name, arguments))
+
+        except StructuredToolError:
+            # 结构化错误以JSON文档形式返回给客户端 (isError=True)
+            raise
+        except GenerationError as e:
+            return [TextContent(type="text", text=str(e))]
+        except httpx.HTTPStatusError as e:
+            error_msg = f"API请求失败,状态码 {e.response.status_code}: {e.response.text}"
+            return [TextContent(type="text", text=error_msg)]
+        except Exception as e:
+            error_msg = f"执行 {name} 时出错: {str(e)}"
+            return [TextContent(type="text", text=error_msg)]
+
+
+def rate_limit_cost(name: str, arguments: Any) -> float:
+    """一次调用消耗的令牌数: 生成工具按工具计, 批量生成按条目数计, 任务查询不计"""
+    if not isinstance(arguments, dict):
+        arguments = {}
+    if name in GENERATION_TOOLS:
+        return rate_limiter.cost(name)
+    if name == "batch_text_to_image":
+        items = arguments.get("items")
+        return rate_limiter.cost("text_to_image") * (len(items) if isinstance(items, list) else 1)
+    if name == "submit_generation" and arguments.get("tool") in GENERATION_TOOLS:
+        return rate_limiter.cost(arguments["tool"])
+    return 0.0
+
+
+async def check_rate_limit(client: Optional[str], name: str, arguments: Any) -> Optional[RateLimitStatus]:
+    """扣除客户端的令牌, 不足时抛出 RateLimited; 未启用限流、无法识别客户端或不计费时返回None"""
+    if rate_limiter is None or client is None:
+        return None
+    cost = rate_limit_cost(name, arguments)
+    if cost <= 0:
+        return None
+    return await rate_limiter.check(client, name, cost)
+
+
+def request_client(request) -> Optional[str]:
+    """HTTP/SSE 请求对应的客户端标识 (已登记的 API 密钥、IP 或 SSE 会话)
+
+    其他工作进程经内部 socket 转发的请求没有客户端地址, 使用转发方确定的标识。
+    """
+    if getattr(request, "scope", {}).get(INTERNAL_SCOPE_KEY):
+        forwarded = request.headers.get(FORWARDED_CLIENT_HEADER)
+        if forwarded:
+            return forwarded
+    return client_identity(
+        request.headers,
+        session_id=request.query_params.get("session_id"),
+        address=request.client.host if request.client is not None else None,
+        trust_proxy=rate_limiter is not None and rate_limiter.trust_proxy,
+        client_keys=rate_limiter.client_keys if rate_limiter is not None else frozenset(),
+    )
 
+
+def mcp_client() -> Optional[str]:
+    """当前MCP请求的客户端标识; stdio 模式没有HTTP请求, 返回None"""
     try:
-        if name == "text_to_image":
-            # 准备请求数据
-            model = arguments.get("model", DEFAULT_MODEL)
-            prompt = arguments["prompt"]
-            ratio = arguments.get("ratio", "1:1")
-            resolution = arguments.get("resolution", "2k")
-            data = {
-                "model": model,
-                "prompt": prompt,
-                "negative_prompt": arguments.get("negative_prompt", ""),
-                "ratio": ratio,
-                "resolution": resolution,
-                "sample_strength": arguments.get("sample_strength", 0.5)
-            }
-
-            print(f"\n{'='*60}")
-            print(f"🎨 开始生成图像")
-            print(f"📝 模型: {model}")
-            print(f"💬 提示词: {prompt[:100]}{'...' if len(prompt) > 100 else ''}")
-            print(f"📐 宽高比: {ratio}, 分辨率: {resolution}")
-            print(f"{'='*60}\n")
-
-            # 发起API请求
-            # 服务端 generateImages 无超时限制，客户端设置15分钟保护
-            # 理由: 服务端每秒轮询一次，理论上无限循环，客户端必须设置合理超时
-            print(f"⏳ 正在生成图像，这可能需要1-3分钟，请耐心等待...")
-            result = await make_api_request("/v1/images/generations", data, timeout=900)
-
-            # 格式化响应
-            urls = [item["url"] for item in result.get("data", [])]
-
-            if not urls:
-                error_msg = "图像生成失败,未返回任何URL"
-                print(f"❌ {error_msg}")
-                return [TextContent(type="text", text=error_msg)]
-
-            print(f"✅ 图像生成成功! 共生成 {len(urls)} 张图像\n")
-
-            response_text = f"✅ 成功生成 {len(urls)} 张图像\n\n"
-            response_text += "📷 图像URL列表:\n"
-            response_text += "=" * 60 + "\n"
-            for i, url in enumerate(urls, 1):
-                response_text += f"\n图像 {i}:\n{url}\n"
-            response_text += "\n" + "=" * 60
-            response_text += "\n\n💡 提示: 点击URL即可在浏览器中查看图像"
-
-            return [TextContent(type="text", text=response_text)]
-
-        elif name == "image_composition":
-            # 准备请求数据
-            model = arguments.get("model", DEFAULT_MODEL)
-            prompt = arguments["prompt"]
-            ratio = arguments.get("ratio", "1:1")
-            resolution = arguments.get("resolution", "2k")
-            data = {
-                "model": model,
-                "prompt": prompt,
-                "images": arguments["images"],
-                "ratio": ratio,
-                "resolution": resolution,
-                "sample_strength": arguments.get("sample_strength", 0.5)
-            }
-
-            print(f"\n{'='*60}")
-            print(f"🎨 开始图像合成")
-            print(f"📝 模型: {model}")
-            print(f"💬 提示词: {prompt[:100]}{'...' if len(prompt) > 100 else ''}")
-            print(f"🖼️  输入图像数: {len(arguments['images'])}")
-            print(f"📐 宽高比: {ratio}, 分辨率: {resolution}")
-            print(f"{'='*60}\n")
-
-            # 发起API请求
-            # 服务端 generateImageComposition 最大轮询600次(10分钟)，客户端设置11分钟
-            # 理由: 服务端每秒轮询一次，最多600秒，客户端需要略大于此值以接收完整响应
-            print(f"⏳ 正在合成图像，这可能需要1-3分钟，请耐心等待...")
-            result = await make_api_request("/v1/images/compositions", data, timeout=660)
-
-            # 格式化响应
-            urls = [item["url"] for item in result.get("data", [])]
-            input_count = result.get("input_images", len(arguments["images"]))
-            comp_type = result.get("composition_type", "composition")
-
-            if not urls:
-                error_msg = "图像合成失败,未返回任何URL"
-                print(f"❌ {error_msg}")
-                return [TextContent(type="text", text=error_msg)]
-
-            print(f"✅ 图像合成成功! 共生成 {len(urls)} 张图像\n")
-
-            response_text = f"✅ 成功将 {input_count} 张图像合成为 {len(urls)} 个结果\n"
-            response_text += f"🎨 合成类型: {comp_type}\n\n"
-            response_text += "📷 合成结果URL列表:\n"
-            response_text += "=" * 60 + "\n"
-            for i, url in enumerate(urls, 1):
-                response_text += f"\n合成图像 {i}:\n{url}\n"
-            response_text += "\n" + "=" * 60
-            response_text += "\n\n💡 提示: 点击URL即可在浏览器中查看合成图像"
-
-            return [TextContent(type="text", text=response_text)]
-
-        elif name == "text_to_video":
-            # 准备请求数据
-            model = arguments.get("model", "jimeng-video-3.0")
-            prompt = arguments["prompt"]
-            ratio = arguments.get("ratio", "1:1")
-            resolution = arguments.get("resolution", "720p")
-            duration = arguments.get("duration", 5)
-            data = {
-                "model": model,
-                "prompt": prompt,
-                "ratio": ratio,
-                "resolution": resolution,
-                "duration": duration
-            }
-
-            print(f"\n{'='*60}")
-            print(f"🎬 开始生成视频")
-            print(f"📝 模型: {model}")
-            print(f"💬 提示词: {prompt[:100]}{'...' if len(prompt) > 100 else ''}")
-            print(f"📐 宽高比: {ratio}, 分辨率: {resolution}, 时长: {duration}秒")
-            print(f"{'='*60}\n")
-
-            # 发起API请求
-            print(f"⏳ 正在生成视频，这可能需要较长时间，请耐心等待...")
-            result = await make_api_request("/v1/videos/generations", data, timeout=600)
-
-            # 格式化响应
-            videos = result.get("data", [])
-
-            if not videos:
-                error_msg = "视频生成失败,未返回任何URL"
-                print(f"❌ {error_msg}")
-                return [TextContent(type="text", text=error_msg)]
-
-            print(f"✅ 视频生成成功! 共生成 {len(videos)} 个视频\n")
-
-            response_text = f"✅ 成功生成 {len(videos)} 个视频\n\n"
-            response_text += "🎬 视频URL列表:\n"
-            response_text += "=" * 60 + "\n"
-
-            for i, video in enumerate(videos, 1):
-                url = video.get("url", "")
-                revised_prompt = video.get("revised_prompt", arguments["prompt"])
-                response_text += f"\n视频 {i}:\n"
-                response_text += f"URL: {url}\n"
-                response_text += f"提示词: {revised_prompt}\n"
-
-            response_text += "\n" + "=" * 60
-            response_text += "\n\n💡 提示: 点击URL即可在浏览器中查看视频"
-
-            return [TextContent(type="text", text=response_text)]
-
-        elif name == "image_to_video":
-            # 准备请求数据
-            model = arguments.get("model", "jimeng-video-3.0")
-            prompt = arguments["prompt"]
-            file_paths = arguments["file_paths"]
-            ratio = arguments.get("ratio", "1:1")
-            resolution = arguments.get("resolution", "720p")
-            duration = arguments.get("duration", 5)
-            data = {
-                "model": model,
-                "prompt": prompt,
-                "file_paths": file_paths,
-                "ratio": ratio,
-                "resolution": resolution,
-                "duration": duration
-            }
-
-            print(f"\n{'='*60}")
-            print(f"🎬 开始图像生成视频")
-            print(f"📝 模型: {model}")
-            print(f"💬 提示词: {prompt[:100]}{'...' if len(prompt) > 100 else ''}")
-            print(f"🖼️  输入图像数: {len(file_paths)}")
-            print(f"📐 宽高比: {ratio}, 分辨率: {resolution}, 时长: {duration}秒")
-            print(f"{'='*60}\n")
-
-            # 发起API请求
-            print(f"⏳ 正在生成视频，这可能需要较长时间，请耐心等待...")
-            result = await make_api_request("/v1/videos/generations", data, timeout=600)
-
-            # 格式化响应
-            videos = result.get("data", [])
-
-            if not videos:
-                error_msg = "视频生成失败,未返回任何URL"
-                print(f"❌ {error_msg}")
-                return [TextContent(type="text", text=error_msg)]
-
-            print(f"✅ 视频生成成功! 共生成 {len(videos)} 个视频\n")
-
-            response_text = f"✅ 成功从 {len(file_paths)} 张图像生成 {len(videos)} 个视频\n\n"
-            response_text += "🎬 视频URL列表:\n"
-            response_text += "=" * 60 + "\n"
-
-            for i, video in enumerate(videos, 1):
-                url = video.get("url", "")
-                revised_prompt = video.get("revised_prompt", arguments["prompt"])
-                response_text += f"\n视频 {i}:\n"
-                response_text += f"URL: {url}\n"
-                response_text += f"提示词: {revised_prompt}\n"
-
-            response_text += "\n" + "=" * 60
-            response_text += "\n\n💡 提示: 点击URL即可在浏览器中查看视频"
-
-            return [TextContent(type="text", text=response_text)]
+        request = server.request_context.request
+    except LookupError:
+        return None
+    return request_client(request) if request is not None else None
 
-        else:
-            raise ValueError(f"未知工具: {name}")
 
-    except httpx.HTTPStatusError as e:
-        error_msg = f"API请求失败,状态码 {e.response.status_code}: {e.response.text}"
-        return [TextContent(type="text", text=error_msg)]
-    except Exception as e:
-        error_msg = f"执行 {name} 时出错: {str(e)}"
-        return [TextContent(type="text", text=error_msg)]
+@call_tool_decorator
+async def handle_mcp_call_tool(
+    name: str,
+    arguments: dict[str, Any] | None
+) -> list[TextContent | ImageContent | EmbeddedResource] | tuple[list, dict[str, Any]]:
+    """MCP 工具调用入口: SSE 模式下按客户端限流; 启用结构化输出时同时返回 (内容, 结构化结果)"""
+    if rate_limiter is not None:
+        await check_rate_limit(mcp_client(), name, arguments)
+    result = await handle_call_tool(name, arguments)
+    structured = getattr(result, "structured", None)
+    if STRUCTURED_OUTPUT and structured is not None:
+        return list(result), structured
+    return result
+
+
+def runtime_stats() -> dict[str, Any]:
+    """汇总运行时统计, 用于容量规划"""
+    return {
+        "admission": admission.stats(),
+        "cache": result_cache.stats() if result_cache is not None else None,
+        "singleflight": inflight.stats() if inflight is not None else None,
+        "circuit_breakers": circuit_breakers.stats(),
+        "upstreams": upstream_pool.stats(),
+        "tracing": tracer.stats(),
+        "mirror": asset_mirror.stats() if asset_mirror is not None else None,
+        "inputs": input_resolver.stats(),
+        "preflight": input_preflight.stats() if input_preflight is not None else None,
+        "preview": preview_renderer.stats() if preview_renderer is not None else None,
+        "jobs": {status.value: job_manager.count(status) for status in JobStatus},
+        "job_subscribers": job_manager.subscribers,
+        "job_store": job_store.stats() if job_store is not None else None,
+        "webhooks": webhooks.stats() if webhooks is not None else None,
+        "rate_limit": rate_limiter.stats() if rate_limiter is not None else None,
+        "shared_flight": shared_flight.stats() if shared_flight is not None else None,
+        "worker": {"pid": os.getpid(), "workers": int(os.getenv("JIMENG_WORKERS", "1"))},
+    }
+
+
+# 任务事件流的心跳间隔(秒), 防止代理因连接空闲而断开
+JOB_EVENTS_HEARTBEAT = 15.0
+
+# 其他工作进程中任务的事件流轮询任务记录的间隔(秒)
+JOB_EVENTS_POLL_INTERVAL = 1.0
+
+# SSE 会话刚建立时可能尚未登记到共享状态, 转发消息前查询的次数 (间隔50毫秒)
+SSE_SESSION_LOOKUP_RETRIES = 20
+
+# 转发 POST /messages 时携带收到请求的进程确定的客户端标识 (限流用);
+# 只有经内部 unix socket 到达的请求 (scope 中带 INTERNAL_SCOPE_KEY) 才信任这个请求头
+FORWARDED_CLIENT_HEADER = "x-jimeng-client"
+INTERNAL_SCOPE_KEY = "jimeng.internal"
+
+
+def format_job_event(event: dict[str, Any]) -> str:
+    """把任务事件格式化为一条 Server-Sent Event"""
+    data = dumps(event)
+    return f"event: {event['event']}\ndata: {data}\n\n"
+
+
+async def job_event_stream(
+    subscription: JobSubscription,
+    initial: list[dict[str, Any]],
+    stop_when_finished: bool = False,
+    heartbeat: float = JOB_EVENTS_HEARTBEAT
+):
+    """把任务事件格式化为 Server-Sent Events
+
+    Args:
+        subscription: 任务事件订阅, 流结束时取消订阅
+        initial: 订阅时先发送的当前状态事件
+        stop_when_finished: 收到任务结束事件后是否结束流 (单个任务的事件流)
+        heartbeat: 无事件时发送注释行的间隔(秒)
+    """
+    with subscription:
+        for event in initial:
+            yield format_job_event(event)
+            if stop_when_finished and JobStatus(event["event"]).finished:
+                return
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_job_event(event)
+            if stop_when_finished and JobStatus(event["event"]).finished:
+                return
+
+
+async def polled_job_event_stream(
+    job_id: str,
+    interval: float = JOB_EVENTS_POLL_INTERVAL,
+    heartbeat: float = JOB_EVENTS_HEARTBEAT
+):
+    """其他工作进程中任务的事件流: 轮询任务记录, 状态变化时发送事件, 任务结束后结束"""
+    last: Optional[JobStatus] = None
+    quiet = 0.0
+    while True:
+        job = await job_manager.get(job_id)
+        if job.status is not last:
+            last = job.status
+            quiet = 0.0
+            yield format_job_event(job_event(job))
+        elif quiet >= heartbeat:
+            quiet = 0.0
+            yield ": keep-alive\n\n"
+        if job.status.finished:
+            return
+        await asyncio.sleep(interval)
+        quiet += interval
+
+
+async def start_services() -> None:
+    """启动共享资源并恢复上次未完成的任务, 各模式启动时调用"""
+    await open_http_client()
+    if webhooks is not None:
+        # 先加载回调登记, 恢复执行的任务结束后才能回调
+        await webhooks.start()
+    await job_manager.recover()
+
+
+async def stop_services() -> None:
+    """取消后台任务并关闭共享资源, 各模式退出时调用"""
+    await job_manager.shutdown()
+    if webhooks is not None:
+        await webhooks.stop()
+    if asset_mirror is not None:
+        await asset_mirror.shutdown()
+    await close_http_client()
+    await asyncio.to_thread(tracer.shutdown)
+    if preview_renderer is not None:
+        await asyncio.to_thread(preview_renderer.shutdown)
+    if result_cache is not None:
+        result_cache.close()
+    if job_store is not None:
+        await asyncio.to_thread(job_store.close)
+    if shared_state is not None:
+        await asyncio.to_thread(shared_state.close)
 
 
 async def run_stdio_server():
     """运行stdio模式的MCP服务器"""
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="jimeng-mcp",
-                server_version="0.1.0",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
+    from mcp.server.models import InitializationOptions
+    from mcp.server.stdio import stdio_server
+
+    await start_services()
+    # 设置了 JIMENG_METRICS_FILE 时定期写入指标文件
+    metrics_dump = asyncio.create_task(dump_periodically(metrics))
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="jimeng-mcp",
+                    server_version="0.1.0",
+                    capabilities=server.get_capabilities(
+                        notification_options=NotificationOptions(),
+                        experimental_capabilities={},
+                    )
                 )
             )
-        )
+    finally:
+        metrics_dump.cancel()
+        await asyncio.gather(metrics_dump, return_exceptions=True)
+        await stop_services()
 
 
-async def run_sse_server(host: str = "0.0.0.0", port: int = 8000):
-    """运行SSE模式的MCP服务器"""
+def create_sse_app():
+    """创建SSE模式的应用
+
+    多工作进程模式下, 同一会话的 POST /messages 可能落在其他工作进程上:
+    每个工作进程另外在 unix socket 上提供同一应用, 会话不在本进程时按
+    共享状态中登记的地址转发给会话所在的进程。
+    """
     if not SSE_AVAILABLE:
         raise RuntimeError(
             "SSE模式需要安装SSE相关依赖。\n"
             "请运行: pip install starlette uvicorn sse-starlette"
         )
 
+    from uuid import UUID
+
+    from mcp.server.models import InitializationOptions
+    from mcp.server.sse import SseServerTransport
+
     from starlette.applications import Starlette
+    from starlette.requests import Request
     from starlette.routing import Route, Mount
-    from starlette.responses import Response
+    from starlette.responses import JSONResponse, Response
     from starlette.middleware.cors import CORSMiddleware
     import uvicorn
 
+    from .workers import InternalServer
+
     # 创建 SSE 传输层
     sse_transport = SseServerTransport("/messages")
 
+    # 多工作进程模式下登记本进程的会话, 用于其他进程转发消息
+    sessions: Optional[SessionRegistry] = None
+    if shared_state is not None:
+        address = os.path.join(
+            os.path.dirname(os.path.abspath(shared_state.path)), f"sse-{os.getpid()}.sock"
+        )
+        sessions = SessionRegistry(shared_state, address)
+    registered: set[str] = set()
+    forward_clients: dict[str, httpx.AsyncClient] = {}
+
+    def local_sessions() -> set[str]:
+        # 传输层没有公开会话列表, 读取其内部的会话表
+        return {session_id.hex for session_id in sse_transport._read_stream_writers}
+
+    async def sync_sessions() -> None:
+        current = local_sessions()
+        added, removed = current - registered, registered - current
+        registered.difference_update(removed)
+        registered.update(added)
+        if added:
+            await asyncio.to_thread(sessions.register, sorted(added))
+        if removed:
+            await asyncio.to_thread(sessions.unregister, sorted(removed))
+
     # 定义 SSE 处理函数
     async def handle_sse(request):
-        async with sse_transport.connect_sse(
-            request.scope, request.receive, request._send
-        ) as streams:
-            await server.run(
-                streams[0],
-                streams[1],
-                InitializationOptions(
-                    server_name="jimeng-mcp",
-                    server_version="0.1.0",
-                    capabilities=server.get_capabilities(
-                        notification_options=NotificationOptions(),
-                        experimental_capabilities={},
+        try:
+            async with sse_transport.connect_sse(
+                request.scope, request.receive, request._send
+            ) as streams:
+                if sessions is not None:
+                    await sync_sessions()
+                await server.run(
+                    streams[0],
+                    streams[1],
+                    InitializationOptions(
+                        server_name="jimeng-mcp",
+                        server_version="0.1.0",
+                        capabilities=server.get_capabilities(
+                            notification_options=NotificationOptions(),
+                            experimental_capabilities={},
+                        )
                     )
                 )
-            )
+        finally:
+            # 会话在退出 connect_sse 时才从传输层移除
+            if sessions is not None:
+                await sync_sessions()
         # 返回空响应以避免 TypeError
         return Response()
 
-    # 启动事件
-    async def startup():
-        print(f"\n🚀 即梦MCP服务器 (SSE模式) 运行在 http://{host}:{port}/sse")
-        print(f"📝 消息端点: http://{host}:{port}/messages\n")
+    async def session_address(session_id: str) -> Optional[str]:
+        """会话所在的其他工作进程地址; 会话刚建立时可能尚未登记, 短暂重试"""
+        try:
+            if UUID(hex=session_id).hex in local_sessions():
+                return None
+        except ValueError:
+            return None
+        for _ in range(SSE_SESSION_LOOKUP_RETRIES):
+            address = await asyncio.to_thread(sessions.lookup, session_id)
+            if address is not None:
+                return address if address != sessions.address else None
+            await asyncio.sleep(0.05)
+        return None
+
+    async def handle_messages(scope, receive, send):
+        """接收客户端消息, 会话在其他工作进程时转发"""
+        if sessions is not None:
+            request = Request(scope, receive)
+            address = await session_address(request.query_params.get("session_id", ""))
+            if address is not None:
+                identity = request_client(request)
+                client = forward_clients.get(address)
+                if client is None:
+                    client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=address))
+                    forward_clients[address] = client
+                try:
+                    upstream = await client.post(
+                        f"http://worker/messages/?{request.url.query}",
+                        content=await request.body(),
+                        headers={
+                            "Content-Type": request.headers.get("Content-Type", "application/json"),
+                            # 所在进程收到的请求没有客户端地址, 由这里确定限流用的客户端标识
+                            **({FORWARDED_CLIENT_HEADER: identity} if identity is not None else {}),
+                        },
+                    )
+                    response = Response(upstream.content, status_code=upstream.status_code)
+                except httpx.TransportError:
+                    response = Response("Could not find session", status_code=404)
+                sessions.forwarded += 1
+                await response(scope, receive, send)
+                return
+        await sse_transport.handle_post_message(scope, receive, send)
+
+    async def handle_stats(request):
+        """运行时统计: 排队深度、等待时间、缓存命中等"""
+        stats = runtime_stats()
+        if sessions is not None:
+            stats["sse_sessions"] = {"local": len(registered), "forwarded": sessions.forwarded}
+        return JSONResponse(stats)
+
+    async def handle_metrics(request):
+        """Prometheus 格式运行指标"""
+        return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+    async def internal_app(scope, receive, send):
+        """内部 socket 上的应用: 标记请求来自其他工作进程的转发"""
+        if scope["type"] == "http":
+            scope = {**scope, INTERNAL_SCOPE_KEY: True}
+        await app(scope, receive, send)
+
+    # 生命周期: 启动时创建共享连接池, 退出时关闭
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await start_services()
+        internal = internal_task = None
+        if sessions is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(sessions.address)
+            internal = InternalServer(uvicorn.Config(
+                internal_app, uds=sessions.address, lifespan="off", log_level="warning"
+            ))
+            internal_task = asyncio.create_task(internal.serve())
+        try:
+            yield
+        finally:
+            if internal is not None:
+                internal.should_exit = True
+                await asyncio.gather(internal_task, return_exceptions=True)
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(sessions.address)
+            for client in forward_clients.values():
+                await client.aclose()
+            await stop_services()
 
     # 创建路由
     app = Starlette(
         routes=[
             Route("/sse", endpoint=handle_sse, methods=["GET"]),
-            Mount("/messages", app=sse_transport.handle_post_message),
+            Route("/stats", endpoint=handle_stats, methods=["GET"]),
+            Route("/metrics", endpoint=handle_metrics, methods=["GET"]),
+            Mount("/messages", app=handle_messages),
         ],
-        on_startup=[startup]
+        lifespan=lifespan
     )
 
     # 添加CORS支持
@@ -605,6 +1749,32 @@ async def run_sse_server(host: str = "0.0.0.0", port: int = 8000):
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    return app
+
+
+def create_sse_worker_app():
+    """多工作进程模式下每个SSE工作进程的应用工厂"""
+    setup_logging("sse")
+    return create_sse_app()
+
+
+async def run_sse_server(host: str = "0.0.0.0", port: int = 8000, workers: int = 1):
+    """运行SSE模式的MCP服务器
+
+    Args:
+        workers: 工作进程数, 大于1时以多进程方式监听同一端口
+    """
+    app = create_sse_app() if workers <= 1 else None
+    print(f"\n🚀 即梦MCP服务器 (SSE模式) 运行在 http://{host}:{port}/sse")
+    print(f"📝 消息端点: http://{host}:{port}/messages")
+    print(f"📊 运行统计: http://{host}:{port}/stats")
+    print(f"📈 运行指标: http://{host}:{port}/metrics\n")
+    if app is None:
+        from .workers import serve_workers
+        serve_workers("jimeng_mcp.server:create_sse_worker_app", host, port, workers)
+        return
+
+    import uvicorn
 
     # 启动 uvicorn 服务器
     config = uvicorn.Config(app, host=host, port=port, log_level="info")
@@ -612,8 +1782,8 @@ async def run_sse_server(host: str = "0.0.0.0", port: int = 8000):
     await server_instance.serve()
 
 
-async def run_http_server(host: str = "0.0.0.0", port: int = 8000):
-    """运行HTTP REST API模式的MCP服务器"""
+def create_http_app():
+    """创建HTTP REST API模式的应用"""
     if not HTTP_AVAILABLE:
         raise RuntimeError(
             "HTTP模式需要安装额外依赖。\n"
@@ -622,67 +1792,136 @@ async def run_http_server(host: str = "0.0.0.0", port: int = 8000):
 
     from starlette.applications import Starlette
     from starlette.routing import Route
-    from starlette.responses import JSONResponse
+    from starlette.responses import FileResponse, Response, StreamingResponse
+    from starlette.responses import JSONResponse as StarletteJSONResponse
+    from starlette.middleware.cors import CORSMiddleware
+
+    class JSONResponse(StarletteJSONResponse):
+        """使用 encoding.dumpb 编码 (安装了 orjson 时使用 orjson)"""
+
+        def render(self, content: Any) -> bytes:
+            return dumpb(content)
+
+    async def call_tool_response(name, request):
+        """调用工具并转换为HTTP响应, 结构化错误使用对应的状态码
+
+        请求头中的 X-Request-Id 作为日志的 request_id, 未提供时自动生成, 并在响应头中返回。
+        请求头中的 traceparent 会被沿用; 响应头 Server-Timing 给出各阶段耗时。
+        请求体包含 callback_url 时改为提交异步任务, 立即返回 202 和任务信息, 结束后回调。
+        启用限流时先扣除客户端的令牌, 令牌不足返回 429。
+        """
+        with request_context(request_id=request.headers.get("X-Request-Id")) as request_id, \
+                tracer.span(
+                    f"{request.method} {request.url.path}",
+                    traceparent=request.headers.get("traceparent")
+                ) as span:
+            headers = {"X-Request-Id": request_id}
+            try:
+                data = await request.json()
+                limit = await check_rate_limit(request_client(request), name, data)
+                if limit is not None:
+                    headers.update(limit.headers())
+                if isinstance(data, dict) and "callback_url" in data:
+                    callback_url = data.pop("callback_url")
+                    job = submit_job(
+                        name, data,
+                        client_id=request.headers.get("X-Client-Id"),
+                        callback_url=callback_url,
+                        callback_secret=data.pop("callback_secret", None)
+                    )
+                    body = {
+                        "success": True,
+                        "job": job.to_dict()
+                    }
+                    status_code = 202
+                else:
+                    result = await handle_call_tool(name, data)
+                    body = {
+                        "success": True,
+                        "result": result[0].text if result else "",
+                        "data": getattr(result, "structured", None),
+                        "content": result
+                    }
+                    status_code = 200
+            except StructuredToolError as e:
+                body = {
+                    "success": False,
+                    **e.to_dict()
+                }
+                status_code = e.status_code
+                headers.update(e.headers())
+            except Exception as e:
+                body = {
+                    "success": False,
+                    "error": str(e)
+                }
+                status_code = 500
+            span.set(status=status_code)
+            headers["Server-Timing"] = span.server_timing()
+            return JSONResponse(body, status_code=status_code, headers=headers)
 
     async def handle_text_to_image(request):
         """处理文本生成图像请求"""
-        try:
-            data = await request.json()
-            result = await handle_call_tool("text_to_image", data)
-            return JSONResponse({
-                "success": True,
-                "result": result[0].text if result else ""
-            })
-        except Exception as e:
-            return JSONResponse({
-                "success": False,
-                "error": str(e)
-            }, status_code=500)
+        return await call_tool_response("text_to_image", request)
 
     async def handle_image_composition(request):
         """处理图像合成请求"""
-        try:
-            data = await request.json()
-            result = await handle_call_tool("image_composition", data)
-            return JSONResponse({
-                "success": True,
-                "result": result[0].text if result else ""
-            })
-        except Exception as e:
-            return JSONResponse({
-                "success": False,
-                "error": str(e)
-            }, status_code=500)
+        return await call_tool_response("image_composition", request)
 
     async def handle_text_to_video(request):
         """处理文本生成视频请求"""
-        try:
-            data = await request.json()
-            result = await handle_call_tool("text_to_video", data)
-            return JSONResponse({
-                "success": True,
-                "result": result[0].text if result else ""
-            })
-        except Exception as e:
-            return JSONResponse({
-                "success": False,
-                "error": str(e)
-            }, status_code=500)
+        return await call_tool_response("text_to_video", request)
 
     async def handle_image_to_video(request):
         """处理图像生成视频请求"""
+        return await call_tool_response("image_to_video", request)
+
+    async def handle_batch_text_to_image_http(request):
+        """批量生成图像, 以NDJSON流的形式逐项返回结果"""
         try:
             data = await request.json()
-            result = await handle_call_tool("image_to_video", data)
+            await check_rate_limit(request_client(request), "batch_text_to_image", data)
+            tool_registry.validate("batch_text_to_image", data)
+            items = data["items"]
+        except StructuredToolError as e:
             return JSONResponse({
-                "success": True,
-                "result": result[0].text if result else ""
-            })
+                "success": False,
+                **e.to_dict()
+            }, status_code=e.status_code, headers=e.headers())
         except Exception as e:
             return JSONResponse({
                 "success": False,
                 "error": str(e)
-            }, status_code=500)
+            }, status_code=400)
+
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                records = await run_batch_text_to_image(
+                    items, data.get("concurrency", 4), queue.put
+                )
+                succeeded = sum(1 for record in records if record["success"])
+                await queue.put({
+                    "done": True,
+                    "succeeded": succeeded,
+                    "failed": len(records) - succeeded
+                })
+            except Exception as e:
+                await queue.put({"done": True, "error": str(e)})
+
+        async def stream():
+            producer = asyncio.create_task(produce())
+            try:
+                while True:
+                    record = await queue.get()
+                    yield dumpb(record) + b"\n"
+                    if record.get("done"):
+                        break
+            finally:
+                producer.cancel()
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
 
     async def handle_health(request):
         """健康检查端点"""
@@ -693,6 +1932,24 @@ async def run_http_server(host: str = "0.0.0.0", port: int = 8000):
             "mode": "http"
         })
 
+    async def handle_stats(request):
+        """运行时统计: 排队深度、等待时间、缓存命中等"""
+        return JSONResponse(runtime_stats())
+
+    async def handle_metrics(request):
+        """Prometheus 格式运行指标"""
+        return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+    async def handle_asset(request):
+        """本地镜像文件, 内容寻址不会变化, 支持 Range 请求"""
+        path = asset_mirror.local_path(request.path_params["key"]) if asset_mirror is not None else None
+        if path is None:
+            return JSONResponse({
+                "success": False,
+                "error": "文件不存在"
+            }, status_code=404)
+        return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
     async def handle_tools(request):
         """列出可用工具"""
         tools = await handle_list_tools()
@@ -707,15 +1964,163 @@ async def run_http_server(host: str = "0.0.0.0", port: int = 8000):
             ]
         })
 
+    async def handle_submit_job(request):
+        """提交异步生成任务"""
+        try:
+            data = await request.json()
+            await check_rate_limit(request_client(request), "submit_generation", data)
+            job = submit_job(
+                data.get("tool", ""),
+                data.get("arguments") or {},
+                client_id=data.get("client_id") or request.headers.get("X-Client-Id"),
+                callback_url=data.get("callback_url"),
+                callback_secret=data.get("callback_secret")
+            )
+            return JSONResponse({
+                "success": True,
+                "job": job.to_dict()
+            }, status_code=202)
+        except StructuredToolError as e:
+            return JSONResponse({
+                "success": False,
+                **e.to_dict()
+            }, status_code=e.status_code, headers=e.headers())
+        except Exception as e:
+            return JSONResponse({
+                "success": False,
+                "error": str(e)
+            }, status_code=400)
+
+    async def handle_list_jobs(request):
+        """列出异步生成任务"""
+        try:
+            status = request.query_params.get("status")
+            limit = int(request.query_params.get("limit", "50"))
+            jobs = await job_manager.list_jobs(status, limit)
+        except ValueError as e:
+            return JSONResponse({
+                "success": False,
+                "error": str(e)
+            }, status_code=400)
+        return JSONResponse({
+            "success": True,
+            "jobs": [job.to_dict() for job in jobs]
+        })
+
+    async def handle_job_status(request):
+        """查询异步任务状态"""
+        try:
+            job = await job_manager.get(request.path_params["job_id"])
+        except JobNotFoundError as e:
+            return JSONResponse({
+                "success": False,
+                "error": str(e)
+            }, status_code=404)
+        return JSONResponse({
+            "success": True,
+            "job": job.to_dict()
+        })
+
+    async def handle_job_result(request):
+        """获取异步任务结果, 未完成时返回202"""
+        try:
+            job = await job_manager.get(request.path_params["job_id"])
+        except JobNotFoundError as e:
+            return JSONResponse({
+                "success": False,
+                "error": str(e)
+            }, status_code=404)
+
+        if not job.status.finished:
+            return JSONResponse({
+                "success": True,
+                "job": job.to_dict()
+            }, status_code=202)
+        if job.status is not JobStatus.SUCCEEDED:
+            return JSONResponse({
+                "success": False,
+                "job": job.to_dict(),
+                "error": job.error
+            })
+        return JSONResponse({
+            "success": True,
+            "job": job.to_dict(),
+            "result": job.result[0].text if job.result else "",
+            "data": getattr(job.result, "structured", None)
+        })
+
+    async def handle_job_events(request):
+        """单个任务的状态事件流 (SSE), 任务结束后关闭"""
+        try:
+            job = await job_manager.get(request.path_params["job_id"])
+        except JobNotFoundError as e:
+            return JSONResponse({
+                "success": False,
+                "error": str(e)
+            }, status_code=404)
+        if not job_manager.owns(job.id):
+            # 任务由其他工作进程执行, 本进程收不到它的状态变化
+            return StreamingResponse(
+                polled_job_event_stream(job.id),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        # 先订阅再读取当前状态, 两者之间的状态变化不会丢失
+        subscription = job_manager.subscribe(job_id=job.id)
+        return StreamingResponse(
+            job_event_stream(subscription, [job_event(job)], stop_when_finished=True),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    async def handle_client_events(request):
+        """某个客户端全部任务的状态事件流 (SSE)"""
+        client_id = request.query_params.get("client_id") or request.headers.get("X-Client-Id")
+        if not client_id:
+            return JSONResponse({
+                "success": False,
+                "error": "需要通过 client_id 参数或 X-Client-Id 请求头指定客户端"
+            }, status_code=400)
+        subscription = job_manager.subscribe(client_id=client_id)
+        pending = [
+            job_event(job) for job in reversed(await job_manager.list_jobs(limit=job_manager.max_retained))
+            if job.client_id == client_id and not job.status.finished
+        ]
+        return StreamingResponse(
+            job_event_stream(subscription, pending),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    # 生命周期: 启动时创建共享连接池, 退出时关闭
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await start_services()
+        try:
+            yield
+        finally:
+            await stop_services()
+
     app = Starlette(
         routes=[
             Route("/health", endpoint=handle_health, methods=["GET"]),
             Route("/tools", endpoint=handle_tools, methods=["GET"]),
+            Route("/stats", endpoint=handle_stats, methods=["GET"]),
+            Route("/metrics", endpoint=handle_metrics, methods=["GET"]),
+            Route("/assets/{key:path}", endpoint=handle_asset, methods=["GET", "HEAD"]),
             Route("/text-to-image", endpoint=handle_text_to_image, methods=["POST"]),
             Route("/image-composition", endpoint=handle_image_composition, methods=["POST"]),
             Route("/text-to-video", endpoint=handle_text_to_video, methods=["POST"]),
             Route("/image-to-video", endpoint=handle_image_to_video, methods=["POST"]),
-        ]
+            Route("/batch-text-to-image", endpoint=handle_batch_text_to_image_http, methods=["POST"]),
+            Route("/jobs", endpoint=handle_submit_job, methods=["POST"]),
+            Route("/jobs", endpoint=handle_list_jobs, methods=["GET"]),
+            Route("/jobs/events", endpoint=handle_client_events, methods=["GET"]),
+            Route("/jobs/{job_id}", endpoint=handle_job_status, methods=["GET"]),
+            Route("/jobs/{job_id}/events", endpoint=handle_job_events, methods=["GET"]),
+            Route("/jobs/{job_id}/result", endpoint=handle_job_result, methods=["GET"]),
+        ],
+        lifespan=lifespan
     )
 
     # 添加CORS支持
@@ -726,64 +2131,70 @@ async def run_http_server(host: str = "0.0.0.0", port: int = 8000):
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    # 较大的JSON响应按 Accept-Encoding 压缩
+    options = compression_options()
+    if options is not None:
+        app.add_middleware(CompressionMiddleware, **options)
+    return app
 
-    import uvicorn
-    config = uvicorn.Config(app, host=host, port=port, log_level="info")
-    server_instance = uvicorn.Server(config)
+
+def create_http_worker_app():
+    """多工作进程模式下每个HTTP工作进程的应用工厂"""
+    setup_logging("http")
+    return create_http_app()
+
+
+async def run_http_server(host: str = "0.0.0.0", port: int = 8000, workers: int = 1):
+    """运行HTTP REST API模式的MCP服务器
+
+    Args:
+        workers: 工作进程数, 大于1时以多进程方式监听同一端口
+    """
+    app = create_http_app() if workers <= 1 else None
 
     print(f"🚀 即梦MCP服务器 (HTTP模式) 运行在 http://{host}:{port}")
     print(f"📚 API文档:")
     print(f"   - 健康检查: GET  http://{host}:{port}/health")
     print(f"   - 工具列表: GET  http://{host}:{port}/tools")
+    print(f"   - 运行统计: GET  http://{host}:{port}/stats")
+    print(f"   - 运行指标: GET  http://{host}:{port}/metrics")
+    print(f"   - 镜像文件: GET  http://{host}:{port}/assets/{{key}}")
     print(f"   - 文本生成图像: POST http://{host}:{port}/text-to-image")
     print(f"   - 图像合成: POST http://{host}:{port}/image-composition")
     print(f"   - 文本生成视频: POST http://{host}:{port}/text-to-video")
     print(f"   - 图像生成视频: POST http://{host}:{port}/image-to-video")
-    await server_instance.serve()
-
+    print(f"   - 批量生成图像: POST http://{host}:{port}/batch-text-to-image")
+    print(f"   - 提交异步任务: POST http://{host}:{port}/jobs")
+    print(f"   - 任务列表: GET  http://{host}:{port}/jobs")
+    print(f"   - 任务状态: GET  http://{host}:{port}/jobs/{{job_id}}")
+    print(f"   - 任务结果: GET  http://{host}:{port}/jobs/{{job_id}}/result")
+    print(f"   - 任务事件流: GET  http://{host}:{port}/jobs/{{job_id}}/events")
+    print(f"   - 客户端事件流: GET  http://{host}:{port}/jobs/events?client_id=...")
+    if app is None:
+        from .workers import serve_workers
+        serve_workers("jimeng_mcp.server:create_http_worker_app", host, port, workers)
+        return
 
-def parse_args():
-    """解析命令行参数"""
-    parser = argparse.ArgumentParser(
-        description="即梦MCP服务器 - 支持stdio/sse/http三种模式"
-    )
-    parser.add_argument(
-        "--mode",
-        type=str,
-        choices=["stdio", "sse", "http"],
-        default="stdio",
-        help="服务器模式 (默认: stdio)"
-    )
-    parser.add_argument(
-        "--host",
-        type=str,
-        default="0.0.0.0",
-        help="SSE/HTTP模式的主机地址 (默认: 0.0.0.0)"
-    )
-    parser.add_argument(
-        "--port",
-        type=int,
-        default=8000,
-        help="SSE/HTTP模式的端口号 (默认: 8000)"
-    )
-    return parser.parse_args()
-
-
-async def main():
-    """服务器主入口"""
-    args = parse_args()
-
-    if args.mode == "stdio":
-        print("🚀 即梦MCP服务器启动 (stdio模式)", file=sys.stderr)
-        await run_stdio_server()
-    elif args.mode == "sse":
-        await run_sse_server(args.host, args.port)
-    elif args.mode == "http":
-        await run_http_server(args.host, args.port)
-    else:
-        print(f"❌ 未知的模式: {args.mode}", file=sys.stderr)
-        sys.exit(1)
+    import uvicorn
+    config = uvicorn.Config(app, host=host, port=port, log_level="info")
+    server_instance = uvicorn.Server(config)
+    await server_instance.serve()
 
 
-if __name__ == "__main__":
-    asyncio.run(main())
+async def serve(args) -> None:
+    """按命令行参数运行服务器 (参数见 cli.parse_args)"""
+    # stdio 模式下日志只写入 stderr, stdout 留给MCP协议
+    setup_logging(args.mode)
+    try:
+        if args.mode == "stdio":
+            print("🚀 即梦MCP服务器启动 (stdio模式)", file=sys.stderr)
+            await run_stdio_server()
+        elif args.mode == "sse":
+            await run_sse_server(args.host, args.port, args.workers)
+        elif args.mode == "http":
+            await run_http_server(args.host, args.port, args.workers)
+        else:
+            print(f"❌ 未知的模式: {args.mode}", file=sys.stderr)
+            sys.exit(1)
+    finally:
+        shutdown_logging()
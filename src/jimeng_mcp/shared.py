@@ -0,0 +1,262 @@
+"""
+多进程共享状态
+
+多工作进程模式 (--workers N) 下, 各进程通过同一个 SQLite 文件 (WAL 模式) 共享:
+- 相同请求合并: 内存中的 SingleFlight 只在进程内合并, SharedFlight 以租约的方式
+  保证所有进程中相同的请求只有一个向上游发起, 其余进程轮询等待其结果
+- SSE 会话归属: SSE 连接和随后的 POST /messages 可能落在不同进程上,
+  SessionRegistry 记录每个会话所在进程的内部地址, 用于转发消息
+- 限流令牌桶: 启用限流时各进程共用每个客户端的令牌桶 (见 ratelimit.py)
+
+租约由进程号标识持有者, 持有者进程退出后租约立即失效, 不必等待超时。
+结果缓存和任务记录本身已是 SQLite 文件 (JIMENG_CACHE_PATH、JIMENG_JOB_STORE_PATH),
+多进程模式下自动指向同一目录中的文件。
+
+环境变量:
+- JIMENG_SHARED_STATE_PATH: 共享状态 SQLite 文件路径, 为空时不跨进程共享 (默认: 空)
+- JIMENG_SHARED_FLIGHT_LEASE: 合并请求租约的最长时间(秒) (默认: 960)
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from .progress import set_phase
+
+T = TypeVar("T")
+
+# 等待其他进程结果时的初始轮询间隔(秒), 之后逐次增大到 _MAX_POLL_INTERVAL
+_POLL_INTERVAL = 0.1
+_MAX_POLL_INTERVAL = 1.0
+_POLL_BACKOFF = 1.5
+
+# 结果在共享表中保留的时间(秒), 足够所有等待者读到
+_RESULT_TTL = 5.0
+
+
+def new_owner() -> str:
+    """持有者标识: 进程号加随机后缀, 同一进程内重新创建的实例视为不同持有者"""
+    return f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+PROCESS_OWNER = new_owner()
+
+
+def owner_alive(owner: Optional[str], current: str = PROCESS_OWNER) -> bool:
+    """持有者是否仍在运行: 当前实例, 或进程号存在的其他进程"""
+    if not owner:
+        return False
+    if owner == current:
+        return True
+    pid, _, _ = owner.partition(":")
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedState:
+    """共享状态 SQLite 文件, 每个进程一个连接"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedState"]:
+        path = os.getenv("JIMENG_SHARED_STATE_PATH", "").strip()
+        return cls(path) if path else None
+
+    def read(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """不开启写事务执行只读的 fn, 在线程中调用
+
+        WAL 模式下读取不需要写锁, 不会与其他进程的写事务互相等待。
+        """
+        with self._db_lock:
+            return fn(self._connect())
+
+    def execute(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """在一个写事务中执行 fn, 在线程中调用"""
+        with self._db_lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(db)
+            except BaseException:
+                db.rollback()
+                raise
+            db.commit()
+            return result
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS flights ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL, result TEXT)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sse_sessions ("
+                "session_id TEXT PRIMARY KEY, owner TEXT NOT NULL, address TEXT NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "client TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS rate_buckets_updated ON rate_buckets (updated_at)")
+            self._db = db
+        return self._db
+
+
+class SharedFlight:
+    """跨进程的相同请求合并
+
+    与进程内的 SingleFlight 叠加使用: 每个进程中每个键最多一个调用方进入这里。
+    持有租约的进程执行调用并写入结果, 其他进程轮询读取; 调用失败或被取消时释放租约,
+    等待中的进程重新竞争租约并自行调用。
+
+    等待方只用只读查询轮询, 间隔从 poll_interval 逐次增大到 max_poll_interval;
+    只有看到结果被删除、租约过期或持有者进程退出时才开启写事务认领租约。
+    """
+
+    def __init__(
+        self,
+        state: SharedState,
+        lease: float = 960.0,
+        poll_interval: float = _POLL_INTERVAL,
+        max_poll_interval: float = _MAX_POLL_INTERVAL,
+    ):
+        self.state = state
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(poll_interval, max_poll_interval)
+        self.calls = 0
+        self.joined = 0
+
+    @classmethod
+    def from_env(cls, state: Optional[SharedState]) -> Optional["SharedFlight"]:
+        if state is None:
+            return None
+        return cls(state, lease=float(os.getenv("JIMENG_SHARED_FLIGHT_LEASE", "960")))
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[dict[str, Any]]]) -> dict[str, Any]:
+        """执行 fn, 其他进程已在执行相同键的调用时等待其结果"""
+        claimed, result = await asyncio.to_thread(self.state.execute, lambda db: self._claim(db, key))
+        if not claimed and result is None:
+            set_phase("coalesced")
+            interval = self.poll_interval
+            while not claimed and result is None:
+                await asyncio.sleep(interval)
+                interval = min(interval * _POLL_BACKOFF, self.max_poll_interval)
+                claimable, result = await asyncio.to_thread(self.state.read, lambda db: self._peek(db, key))
+                if claimable:
+                    claimed, result = await asyncio.to_thread(
+                        self.state.execute, lambda db: self._claim(db, key)
+                    )
+            if result is not None:
+                self.joined += 1
+        if result is not None:
+            return result
+
+        self.calls += 1
+        try:
+            result = await fn()
+        except BaseException:
+            await asyncio.shield(asyncio.to_thread(self.state.execute, lambda db: self._release(db, key)))
+            raise
+        encoded = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+        await asyncio.to_thread(self.state.execute, lambda db: self._publish(db, key, encoded))
+        return result
+
+    def stats(self) -> dict[str, int]:
+        return {"calls": self.calls, "joined": self.joined}
+
+    def _peek(self, db: sqlite3.Connection, key: str) -> tuple[bool, Optional[dict[str, Any]]]:
+        """返回 (租约是否可以认领, 已发布的结果)"""
+        row = db.execute("SELECT owner, expires_at, result FROM flights WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return True, None
+        owner, expires_at, result = row
+        if expires_at <= time.time():
+            return True, None
+        if result is not None:
+            return False, json.loads(result)
+        return not owner_alive(owner), None
+
+    def _claim(self, db: sqlite3.Connection, key: str) -> tuple[bool, Optional[dict[str, Any]]]:
+        """在写事务中认领租约, 返回 (是否认领成功, 已发布的结果)"""
+        claimable, result = self._peek(db, key)
+        if not claimable:
+            return False, result
+        now = time.time()
+        # 顺带清理过期的记录
+        db.execute("DELETE FROM flights WHERE expires_at <= ?", (now,))
+        db.execute(
+            "INSERT OR REPLACE INTO flights (key, owner, expires_at, result) VALUES (?, ?, ?, NULL)",
+            (key, PROCESS_OWNER, now + self.lease),
+        )
+        return True, None
+
+    def _publish(self, db: sqlite3.Connection, key: str, encoded: str) -> None:
+        db.execute(
+            "UPDATE flights SET result = ?, expires_at = ? WHERE key = ? AND owner = ?",
+            (encoded, time.time() + _RESULT_TTL, key, PROCESS_OWNER),
+        )
+
+    def _release(self, db: sqlite3.Connection, key: str) -> None:
+        db.execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, PROCESS_OWNER))
+
+
+class SessionRegistry:
+    """SSE 会话所在进程的内部地址"""
+
+    def __init__(self, state: SharedState, address: str):
+        self.state = state
+        self.address = address
+        self.forwarded = 0
+
+    def register(self, session_ids: list[str]) -> None:
+        def write(db: sqlite3.Connection) -> None:
+            db.executemany(
+                "INSERT OR REPLACE INTO sse_sessions (session_id, owner, address) VALUES (?, ?, ?)",
+                [(session_id, PROCESS_OWNER, self.address) for session_id in session_ids],
+            )
+        self.state.execute(write)
+
+    def unregister(self, session_ids: list[str]) -> None:
+        def write(db: sqlite3.Connection) -> None:
+            db.executemany(
+                "DELETE FROM sse_sessions WHERE session_id = ? AND owner = ?",
+                [(session_id, PROCESS_OWNER) for session_id in session_ids],
+            )
+        self.state.execute(write)
+
+    def lookup(self, session_id: str) -> Optional[str]:
+        """会话所在进程的地址, 会话不存在或进程已退出时返回None"""
+        row = self.state.read(lambda db: db.execute(
+            "SELECT owner, address FROM sse_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone())
+        if row is None or not owner_alive(row[0]):
+            return None
+        return row[1]
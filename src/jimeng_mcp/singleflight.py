@@ -0,0 +1,91 @@
+"""
+相同请求合并 (single-flight)
+
+多个会话同时发起完全相同的生成请求时, 只向上游发起一次调用,
+其余调用方等待这一次调用并共享结果。
+
+共享调用中的进度阶段 (progress.set_phase) 转发给所有等待者, 后加入的调用方
+同样能看到"已提交"、"等待即梦生成"等阶段。
+
+取消语义: 单个调用方被取消只会让它自己退出等待;
+只有当所有等待者都离开后, 才会取消正在进行的上游调用。
+
+环境变量:
+- JIMENG_SINGLEFLIGHT: 是否合并相同的并发请求 (默认: 1)
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from .progress import PhaseFanout, current_reporter
+
+T = TypeVar("T")
+
+
+class _Call:
+    """一次正在进行的上游调用、其等待者计数和阶段转发"""
+    __slots__ = ("task", "waiters", "phases")
+
+    def __init__(self, task: asyncio.Task, phases: PhaseFanout):
+        self.task = task
+        self.waiters = 0
+        self.phases = phases
+
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SingleFlight"]:
+        """根据环境变量创建, 禁用时返回None"""
+        if os.getenv("JIMENG_SINGLEFLIGHT", "1").strip().lower() in ("0", "false", "no", "off"):
+            return None
+        return cls()
+
+    @property
+    def in_flight(self) -> int:
+        """当前正在进行的去重后上游调用数"""
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行 fn, 如果已有相同键的调用在进行则等待其结果"""
+        reporter = current_reporter()
+        call = self._calls.get(key)
+        if call is None:
+            phases = PhaseFanout(reporter)
+            call = _Call(asyncio.ensure_future(phases.run(fn)), phases)
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+            call.phases.join(reporter)
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            call.phases.leave(reporter)
+            if call.waiters == 0 and not call.task.done():
+                # 最后一个等待者离开, 不再需要上游结果
+                self._forget(key, call)
+                call.task.cancel()
+
+    def stats(self) -> dict[str, Any]:
+        """合并统计"""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": self.in_flight,
+        }
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
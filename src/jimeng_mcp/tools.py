@@ -0,0 +1,233 @@
+"""
+工具注册表
+
+每个工具由一个 ToolSpec 描述: 参数定义 (inputSchema)、即梦API端点、超时、
+请求数据构造函数和结果格式化函数 (生成类工具), 或直接的处理函数 (任务管理、批量生成)。
+服务器按工具名查表分派, 不再为每个工具重复参数提取、格式化和错误处理。
+
+参数校验器在注册时由 inputSchema 编译为一组闭包, 只支持本服务器用到的 JSON Schema
+子集 (type、enum、minimum/maximum、minItems/maxItems、items、properties、required),
+未识别的关键字 (description、default 等) 忽略。无效调用在发往上游之前被拒绝,
+以 InvalidArgumentsError 返回 (MCP 调用 isError, HTTP 调用 400)。
+
+工具列表 (list_tools 的结果) 在注册时构建一次, 之后每次返回同一个列表。
+
+生成类工具返回 ToolResult: 它就是内容列表, 另外带有结构化结果 (链接、修订后的提示词、
+合成类型、输入数量和耗时), 供 HTTP 接口和 MCP 结构化输出使用, 不必再从文本中解析链接。
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from mcp.types import EmbeddedResource, ImageContent, TextContent, Tool
+
+from .errors import StructuredToolError
+
+Content = TextContent | ImageContent | EmbeddedResource
+
+# 参数校验函数: 参数无效时抛出 InvalidArgumentsError
+Validator = Callable[[Any], None]
+
+_TYPE_NAMES = {
+    "string": "字符串",
+    "number": "数字",
+    "integer": "整数",
+    "boolean": "布尔值",
+    "array": "数组",
+    "object": "对象",
+}
+
+
+class ToolResult(list):
+    """工具返回的内容列表, structured 为结构化结果 (没有时为None)"""
+
+    def __init__(self, content: list[Content], structured: Optional[dict[str, Any]] = None):
+        super().__init__(content)
+        self.structured = structured
+
+
+class InvalidArgumentsError(StructuredToolError):
+    """工具参数不符合 inputSchema"""
+
+    code = "invalid_arguments"
+    status_code = 400
+
+    def __init__(self, message: str, field: str = ""):
+        super().__init__(message, field=field)
+        self.field = field
+
+
+def _is_type(value: Any, expected: str) -> bool:
+    # bool 是 int 的子类, JSON 中的 true/false 不是数字
+    if expected == "string":
+        return isinstance(value, str)
+    if expected == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+    if expected == "integer":
+        if isinstance(value, bool):
+            return False
+        return isinstance(value, int) or (isinstance(value, float) and value.is_integer())
+    if expected == "boolean":
+        return isinstance(value, bool)
+    if expected == "array":
+        return isinstance(value, list)
+    if expected == "object":
+        return isinstance(value, dict)
+    return True
+
+
+def compile_validator(schema: dict[str, Any], path: str = "") -> Validator:
+    """把 JSON Schema 编译为校验函数
+
+    Args:
+        schema: 参数定义
+        path: 参数路径, 用于错误信息 (如 "items[0].ratio")
+    """
+    label = path or "参数"
+    checks: list[Validator] = []
+
+    expected = schema.get("type")
+    if expected is not None:
+        type_name = _TYPE_NAMES.get(expected, expected)
+
+        def check_type(value: Any) -> None:
+            if not _is_type(value, expected):
+                raise InvalidArgumentsError(f"{label} 必须是{type_name}", path)
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value: Any) -> None:
+            # True == 1, 布尔值只与布尔值比较
+            if not any(
+                value == option and isinstance(value, bool) == isinstance(option, bool)
+                for option in allowed
+            ):
+                raise InvalidArgumentsError(
+                    f"{label} 必须是以下值之一: {', '.join(map(str, allowed))}", path
+                )
+        checks.append(check_enum)
+
+    minimum, maximum = schema.get("minimum"), schema.get("maximum")
+    if minimum is not None or maximum is not None:
+        def check_range(value: Any) -> None:
+            if minimum is not None and value < minimum:
+                raise InvalidArgumentsError(f"{label} 不能小于 {minimum}", path)
+            if maximum is not None and value > maximum:
+                raise InvalidArgumentsError(f"{label} 不能大于 {maximum}", path)
+        checks.append(check_range)
+
+    min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+    if min_items is not None or max_items is not None:
+        def check_length(value: Any) -> None:
+            if min_items is not None and len(value) < min_items:
+                raise InvalidArgumentsError(f"{label} 至少需要 {min_items} 项", path)
+            if max_items is not None and len(value) > max_items:
+                raise InvalidArgumentsError(f"{label} 最多 {max_items} 项", path)
+        checks.append(check_length)
+
+    if "items" in schema:
+        item_schema = schema["items"]
+        # 数组项的路径包含下标, 按下标缓存编译结果
+        item_validators: dict[int, Validator] = {}
+
+        def check_items(value: Any) -> None:
+            for index, item in enumerate(value):
+                validate = item_validators.get(index)
+                if validate is None:
+                    validate = item_validators[index] = compile_validator(item_schema, f"{path}[{index}]")
+                validate(item)
+        checks.append(check_items)
+
+    required = tuple(schema.get("required", ()))
+    if required:
+        def check_required(value: Any) -> None:
+            for name in required:
+                if name not in value:
+                    raise InvalidArgumentsError(f"缺少必需参数 {_join(path, name)}", _join(path, name))
+        checks.append(check_required)
+
+    properties = {
+        name: compile_validator(property_schema, _join(path, name))
+        for name, property_schema in schema.get("properties", {}).items()
+    }
+    if properties:
+        def check_properties(value: Any) -> None:
+            for name, validate in properties.items():
+                if name in value:
+                    validate(value[name])
+        checks.append(check_properties)
+
+    # 类型检查在前: 之后的检查可以假设值的类型正确
+    def validate(value: Any) -> None:
+        for check in checks:
+            check(value)
+    return validate
+
+
+def _join(path: str, name: str) -> str:
+    return f"{path}.{name}" if path else name
+
+
+@dataclass
+class ToolSpec:
+    """一个工具的定义
+
+    生成类工具设置 endpoint、build_payload 和 format_result, 由服务器统一执行;
+    其他工具设置 handler, 直接处理参数并返回结果。
+    """
+
+    name: str
+    description: str
+    input_schema: dict[str, Any]
+    # 非生成类工具的处理函数
+    handler: Optional[Callable[[dict[str, Any]], Awaitable[list[Content]]]] = None
+    # 即梦API端点和客户端超时(秒)
+    endpoint: Optional[str] = None
+    timeout: float = 300
+    # 由工具参数构造请求数据 (可能需要上传本地输入, 因此是异步的)
+    build_payload: Optional[Callable[[dict[str, Any]], Awaitable[dict[str, Any]]]] = None
+    # (参数, 请求数据, 响应, 结果链接, 镜像链接) → 结果文本
+    format_result: Optional[Callable[..., str]] = None
+    default_model: Optional[str] = None
+    # 是否使用结果缓存 (图像工具); 否则只合并相同的并发请求
+    cacheable: bool = False
+    # 启用预览时是否附加预览图
+    preview: bool = False
+    # 开始、成功时的日志消息, 以及未返回结果时的错误信息
+    started_message: str = ""
+    succeeded_message: str = ""
+    empty_message: str = ""
+    validate: Validator = field(init=False, repr=False)
+    tool: Tool = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.validate = compile_validator(self.input_schema)
+        self.tool = Tool(name=self.name, description=self.description, inputSchema=self.input_schema)
+
+
+class ToolRegistry:
+    """按工具名查找 ToolSpec"""
+
+    def __init__(self, specs: list[ToolSpec]):
+        self._specs = {spec.name: spec for spec in specs}
+        self._tools = [spec.tool for spec in specs]
+
+    def get(self, name: str) -> ToolSpec:
+        spec = self._specs.get(name)
+        if spec is None:
+            raise ValueError(f"未知工具: {name}")
+        return spec
+
+    def validate(self, name: str, arguments: Any) -> None:
+        """校验工具参数, 无效时抛出 InvalidArgumentsError"""
+        self.get(name).validate(arguments)
+
+    def tools(self) -> list[Tool]:
+        """工具列表, 每次返回同一个列表, 调用方不应修改"""
+        return self._tools
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
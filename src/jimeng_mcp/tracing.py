@@ -0,0 +1,363 @@
+"""
+请求追踪
+
+以 span 记录一次请求在各阶段的耗时: HTTP路由、工具调用、排队、建立连接、
+上游生成和结果整理。trace id 以 W3C traceparent 请求头传给上游,
+HTTP 模式也会沿用客户端传入的 traceparent。
+
+每条 trace 在根 span 开始时决定是否采样; 未采样的 trace 仍然计时
+(用于 Server-Timing 响应头), 但不导出。采样的 span 由后台线程批量写入
+本地文件 (每行一个JSON) 或以 OTLP/HTTP JSON 格式发送到采集器。
+
+环境变量:
+- JIMENG_TRACE_SAMPLE_RATE: 采样比例, 0~1 (默认: 0.1)
+- JIMENG_TRACE_FILE: span 导出文件路径 (默认: 空)
+- JIMENG_TRACE_OTLP_ENDPOINT: OTLP/HTTP 采集器地址, 如 http://localhost:4318 (默认: 空)
+- JIMENG_TRACE_SERVICE_NAME: 导出时的服务名 (默认: jimeng-mcp)
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+# 从 traceparent 请求头解析 trace id、父 span id 和采样标志
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Server-Timing 中各阶段对应的 span 名
+SERVER_TIMING_PHASES = ("queue", "connect", "upstream", "retry_wait", "mirror", "preview", "format")
+
+# 导出线程每批最多发送的 span 数和最长等待时间(秒)
+_BATCH_SIZE = 256
+_BATCH_INTERVAL = 2.0
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class _Trace:
+    """一条 trace 中已结束的 span"""
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: list["Span"] = []
+
+
+class Span:
+    """一个计时区间"""
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace: _Trace,
+        parent_id: Optional[str],
+        attributes: dict[str, Any],
+        root: bool = False,
+    ):
+        self._tracer = tracer
+        self.name = name
+        self.trace = trace
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.events: list[tuple[str, int]] = []
+        self.error: Optional[str] = None
+        self.root = root
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._phase: Optional[Span] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    @property
+    def duration(self) -> float:
+        """耗时(秒), 未结束时为当前已耗时"""
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e9
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str) -> None:
+        self.events.append((name, time.time_ns()))
+
+    def child(self, name: str, **attributes: Any) -> "Span":
+        """创建子 span, 不改变当前 span"""
+        return Span(self._tracer, name, self.trace, self.span_id, attributes)
+
+    def phase(self, name: str) -> "Span":
+        """结束上一个阶段并开始新的阶段子 span, 本 span 结束时阶段随之结束"""
+        if self._phase is not None:
+            self._phase.end()
+        self._phase = self.child(name)
+        return self._phase
+
+    def traceparent(self) -> str:
+        """传给下游的 W3C traceparent 请求头"""
+        flags = "01" if self.trace.sampled else "00"
+        return f"00-{self.trace_id}-{self.span_id}-{flags}"
+
+    def end(self) -> None:
+        """结束 span, 重复调用无效"""
+        if self.end_ns is not None:
+            return
+        if self._phase is not None:
+            self._phase.end()
+        self.end_ns = time.time_ns()
+        self.trace.spans.append(self)
+        if self.root:
+            self._tracer._finish(self)
+
+    def server_timing(self) -> str:
+        """按阶段汇总该 trace 中的耗时, 生成 Server-Timing 响应头"""
+        totals: dict[str, float] = {}
+        for span in self.trace.spans:
+            if span.name in SERVER_TIMING_PHASES:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        parts = [
+            f"{phase};dur={totals[phase] * 1000:.1f}"
+            for phase in SERVER_TIMING_PHASES if phase in totals
+        ]
+        parts.append(f"total;dur={self.duration * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_otlp(self) -> dict[str, Any]:
+        """OTLP JSON 格式的 span"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "events": [
+                {"name": name, "timeUnixNano": str(ts)} for name, ts in self.events
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "jimeng_span", default=None
+)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def trace_phase(name: str) -> None:
+    """在当前 span 下开始一个阶段 (如 format), 没有当前 span 时不做任何事"""
+    span = _current.get()
+    if span is not None:
+        span.phase(name)
+
+
+def connection_trace(parent: Span):
+    """返回 httpx 的 trace 扩展回调, 把新建连接 (TCP + TLS) 记录为 connect 子 span
+
+    复用连接池中的连接时不会产生 connect span。
+    """
+    connecting: list[Span] = []
+
+    async def trace(event_name: str, info: dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.started":
+            connecting.append(parent.child("connect"))
+        elif connecting and (
+            not event_name.startswith("connection.") or event_name.endswith(".failed")
+        ):
+            connecting.pop().end()
+
+    return trace
+
+
+class FileExporter:
+    """每个 span 写一行 OTLP JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: list[Span], service_name: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                record = span.to_otlp()
+                record["service"] = service_name
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class OtlpHttpExporter:
+    """以 OTLP/HTTP JSON 格式发送到采集器"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    def export(self, spans: list[Span], service_name: str) -> None:
+        import httpx
+
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "jimeng_mcp"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        httpx.post(self.url, json=body, timeout=self.timeout)
+
+
+class Tracer:
+    """创建 span, 并在后台线程中批量导出采样的 trace"""
+
+    def __init__(
+        self,
+        sample_rate: float = 0.1,
+        exporters: Optional[list[Any]] = None,
+        service_name: str = "jimeng-mcp",
+    ):
+        self.sample_rate = sample_rate
+        self.exporters = list(exporters or [])
+        self.service_name = service_name
+        self.exported = 0
+        self.export_errors = 0
+        self._queue: "queue.SimpleQueue[Optional[list[Span]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        exporters: list[Any] = []
+        if os.getenv("JIMENG_TRACE_FILE"):
+            exporters.append(FileExporter(os.environ["JIMENG_TRACE_FILE"]))
+        if os.getenv("JIMENG_TRACE_OTLP_ENDPOINT"):
+            exporters.append(OtlpHttpExporter(os.environ["JIMENG_TRACE_OTLP_ENDPOINT"]))
+        return cls(
+            sample_rate=float(os.getenv("JIMENG_TRACE_SAMPLE_RATE", "0.1")),
+            exporters=exporters,
+            service_name=os.getenv("JIMENG_TRACE_SERVICE_NAME", "jimeng-mcp"),
+        )
+
+    def start_span(self, name: str, traceparent: Optional[str] = None, **attributes: Any) -> Span:
+        """创建 span 但不设为当前 span
+
+        Args:
+            name: span 名
+            traceparent: 上游调用方传入的 traceparent, 仅在没有当前 span 时使用
+            attributes: span 属性
+        """
+        parent = _current.get()
+        if parent is not None:
+            return Span(self, name, parent.trace, parent.span_id, attributes)
+
+        match = _TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+        if match:
+            # 沿用调用方的 trace 和采样决定
+            trace = _Trace(match.group(1), match.group(3) == "01" and bool(self.exporters))
+            return Span(self, name, trace, match.group(2), attributes, root=True)
+        sampled = bool(self.exporters) and random.random() < self.sample_rate
+        return Span(self, name, _Trace(_new_id(128), sampled), None, attributes, root=True)
+
+    @contextlib.contextmanager
+    def span(self, name: str, traceparent: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+        """创建 span 并在代码块内设为当前 span, 异常会记录到 span 上"""
+        span = self.start_span(name, traceparent, **attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = str(e) or type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+
+    @contextlib.contextmanager
+    def detached(self) -> Iterator[None]:
+        """在代码块内清除当前 span, 使后台任务开始新的 trace"""
+        token = _current.set(None)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "exporters": [type(exporter).__name__ for exporter in self.exporters],
+            "exported": self.exported,
+            "export_errors": self.export_errors,
+        }
+
+    def shutdown(self) -> None:
+        """导出剩余的 span 并停止后台线程"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=10)
+
+    def _finish(self, root: Span) -> None:
+        if not root.trace.sampled or not self.exporters:
+            return
+        self._queue.put(list(root.trace.spans))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._export_loop, name="jimeng-trace-exporter", daemon=True
+                )
+                self._thread.start()
+
+    def _export_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: list[Span] = []
+            deadline = time.monotonic() + _BATCH_INTERVAL
+            while len(batch) < _BATCH_SIZE:
+                try:
+                    spans = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if spans is None:
+                    stopping = True
+                    break
+                batch.extend(spans)
+            if batch:
+                self._export(batch)
+
+    def _export(self, batch: list[Span]) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(batch, self.service_name)
+                self.exported += len(batch)
+            except Exception:
+                # 导出失败不影响请求处理
+                self.export_errors += 1
@@ -0,0 +1,204 @@
+"""
+上游服务与API密钥池
+
+JIMENG_API_URL 和 JIMENG_API_KEY 都可以用逗号分隔填写多个值,
+每个服务地址与每个密钥组合成一个上游目标; 也可以通过 JIMENG_UPSTREAMS_FILE
+指定JSON配置文件:
+
+    [
+        {"url": "http://10.0.0.1:8000", "keys": ["sessionid-a", "sessionid-b"]},
+        {"url": "http://10.0.0.2:8000", "key": "sessionid-c"}
+    ]
+
+每次请求选择 (进行中请求数 + 1) × 平均延迟 最小的目标。
+返回认证错误 (401/403) 或额度错误 (402/429) 的目标会被暂时摘除
+(只配置了一个目标时不摘除)。
+
+环境变量:
+- JIMENG_UPSTREAMS_FILE: 上游配置文件路径, 设置后忽略 JIMENG_API_URL/JIMENG_API_KEY
+- JIMENG_KEY_EJECT_AUTH: 认证失败后摘除时间(秒) (默认: 600)
+- JIMENG_KEY_EJECT_QUOTA: 额度/限流错误后摘除时间(秒), 响应带 Retry-After 时以其为准 (默认: 60)
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import time
+from typing import Any, Callable, Optional
+
+from .errors import StructuredToolError
+
+logger = logging.getLogger(__name__)
+
+# 认证失败和额度不足对应的HTTP状态码
+AUTH_ERROR_STATUS = frozenset({401, 403})
+QUOTA_ERROR_STATUS = frozenset({402, 429})
+
+# 延迟指数滑动平均的权重
+_LATENCY_ALPHA = 0.2
+
+
+def split_list(value: Optional[str]) -> list[str]:
+    """解析逗号分隔的配置值"""
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+class UpstreamTarget:
+    """一个 (服务地址, API密钥) 组合"""
+
+    def __init__(self, base_url: str, api_key: str):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.outstanding = 0
+        self.latency: Optional[float] = None
+        self.ejected_until = 0.0
+        self.eject_reason: Optional[str] = None
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def name(self) -> str:
+        """用于日志和统计的名称, 不包含完整密钥"""
+        return f"{self.base_url}#{self.api_key[:6]}…"
+
+    def ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+
+    def stats(self, now: float) -> dict[str, Any]:
+        return {
+            "outstanding": self.outstanding,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejected_for": round(self.ejected_until - now, 1) if self.ejected(now) else 0,
+            "eject_reason": self.eject_reason if self.ejected(now) else None,
+        }
+
+
+class NoUpstreamAvailable(StructuredToolError):
+    """所有上游目标都被暂时摘除"""
+
+    code = "no_upstream_available"
+    status_code = 503
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            f"所有即梦API密钥暂时不可用(认证或额度错误), 请 {math.ceil(retry_after)} 秒后重试",
+            retry_after=retry_after,
+        )
+        self.retry_after = retry_after
+
+    def headers(self) -> dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class UpstreamPool:
+    """按最少进行中请求数 (按延迟加权) 选择上游目标"""
+
+    def __init__(
+        self,
+        targets: list[UpstreamTarget],
+        auth_eject: float = 600.0,
+        quota_eject: float = 60.0,
+    ):
+        self.targets = targets
+        self.auth_eject = auth_eject
+        self.quota_eject = quota_eject
+
+    @classmethod
+    def from_env(cls) -> "UpstreamPool":
+        """根据环境变量或配置文件创建"""
+        path = os.getenv("JIMENG_UPSTREAMS_FILE")
+        if path:
+            targets = load_targets_file(path)
+        else:
+            urls = split_list(os.getenv("JIMENG_API_URL")) or ["https://jimeng.duckcloud.fun"]
+            keys = split_list(os.getenv("JIMENG_API_KEY"))
+            targets = [UpstreamTarget(url, key) for url in urls for key in keys]
+        return cls(
+            targets,
+            auth_eject=float(os.getenv("JIMENG_KEY_EJECT_AUTH", "600")),
+            quota_eject=float(os.getenv("JIMENG_KEY_EJECT_QUOTA", "60")),
+        )
+
+    def acquire(self, healthy: Optional[Callable[[UpstreamTarget], bool]] = None) -> UpstreamTarget:
+        """选择一个目标并计入进行中请求
+
+        Args:
+            healthy: 额外的可用性判断(如熔断器状态), 全部不可用时忽略该判断
+        """
+        # 未配置密钥时也允许创建 (服务器模块导入不因缺少配置失败), 调用时报错
+        if not self.targets:
+            raise ValueError("至少需要配置一个即梦API地址和密钥")
+        now = time.time()
+        candidates = [target for target in self.targets if not target.ejected(now)]
+        if not candidates:
+            retry_after = min(target.ejected_until for target in self.targets) - now
+            raise NoUpstreamAvailable(retry_after)
+        if healthy is not None:
+            candidates = [target for target in candidates if healthy(target)] or candidates
+
+        known = [target.latency for target in candidates if target.latency is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+
+        def score(target: UpstreamTarget) -> float:
+            latency = target.latency if target.latency is not None else default_latency
+            return (target.outstanding + 1) * latency
+
+        best = min(score(target) for target in candidates)
+        target = random.choice([t for t in candidates if score(t) == best])
+        target.outstanding += 1
+        target.requests += 1
+        return target
+
+    def release(
+        self,
+        target: UpstreamTarget,
+        latency: Optional[float] = None,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """请求结束后归还目标, 更新延迟并按错误类型摘除"""
+        target.outstanding -= 1
+        if latency is not None and (status is None or status < 400):
+            if target.latency is None:
+                target.latency = latency
+            else:
+                target.latency += _LATENCY_ALPHA * (latency - target.latency)
+
+        if status is None or status < 400:
+            return
+        target.errors += 1
+        if status in AUTH_ERROR_STATUS:
+            self._eject(target, self.auth_eject, f"认证失败(HTTP {status})")
+        elif status in QUOTA_ERROR_STATUS:
+            self._eject(target, retry_after or self.quota_eject, f"额度或限流(HTTP {status})")
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        now = time.time()
+        return {target.name: target.stats(now) for target in self.targets}
+
+    def _eject(self, target: UpstreamTarget, seconds: float, reason: str) -> None:
+        if len(self.targets) == 1:
+            # 只有一个目标时摘除没有意义, 交给重试策略和熔断器处理
+            return
+        target.ejected_until = time.time() + seconds
+        target.eject_reason = reason
+        logger.warning("🚫 暂时摘除上游", extra={"upstream": target.name, "reason": reason, "seconds": seconds})
+
+
+def load_targets_file(path: str) -> list[UpstreamTarget]:
+    """从JSON配置文件加载上游目标"""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = entries.get("upstreams", [])
+
+    targets = []
+    for entry in entries:
+        keys = entry.get("keys") or ([entry["key"]] if entry.get("key") else [])
+        for key in keys:
+            targets.append(UpstreamTarget(entry["url"], key))
+    return targets
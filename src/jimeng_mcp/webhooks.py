@@ -0,0 +1,442 @@
+"""
+Webhook 回调
+
+提交异步任务时 (POST /jobs、带 callback_url 的生成端点或 submit_generation 工具)
+可以指定 callback_url 和可选的 callback_secret, 请求立即返回任务ID。
+任务结束 (成功、失败或取消) 后, 服务器把结果 POST 到 callback_url:
+- 请求体为 JSON: {"event", "delivery_id", "job", "urls", "data", "error"},
+  data 为结构化结果 (见 tools.ToolResult), 没有时为 null
+- 请求头 X-Jimeng-Event、X-Jimeng-Delivery、X-Jimeng-Timestamp;
+  设置了密钥时附带 X-Jimeng-Signature: sha256=<hex>,
+  即 HMAC-SHA256(密钥, "{X-Jimeng-Timestamp}.{请求体}")
+- 2xx 视为成功; 超时、连接错误和 408/425/429/5xx 按指数退避 (full jitter) 重试,
+  响应带 Retry-After 时按其等待; 其他状态码不重试
+- 重试耗尽或不可重试的投递进入死信: 记录保留在数据库中 (status=dead),
+  并写入死信日志 (配置了 JIMENG_WEBHOOK_DEAD_LETTER 时)
+
+回调默认关闭 (JIMENG_WEBHOOKS=1 启用): 服务器会向客户端给出的任意地址发起请求。
+为防止借回调访问内网 (SSRF), 未配置 JIMENG_WEBHOOK_ALLOWED_HOSTS 时只允许公网地址:
+提交时拒绝 localhost 和内网/本机/链路本地/保留的IP地址, 每次投递前再解析主机名,
+解析到这类地址时不投递, 直接进入死信; 不跟随重定向。
+配置了 JIMENG_WEBHOOK_ALLOWED_HOSTS 时只允许列出的主机, 这些主机可以是内网地址。
+
+回调登记和待投递记录保存在 SQLite 文件中 (默认与任务记录同一个文件, 表名不同),
+启动时认领持有进程已退出的待投递记录并继续投递; 恢复执行的任务结束后同样回调。
+投递至少一次: 进程在投递过程中退出时, 重启后会再次投递, 接收方应按 X-Jimeng-Delivery 去重。
+未配置文件路径时只保存在内存中。
+
+固定数量的投递协程 (JIMENG_WEBHOOK_WORKERS) 从队列中取投递, 共用 HTTP 连接池;
+数据库读写在单独的线程中按顺序执行。任务结束时只把投递放入队列,
+接收方响应慢不会占用生成任务。
+
+环境变量:
+- JIMENG_WEBHOOKS: 是否允许回调 (默认: 0)
+- JIMENG_WEBHOOK_STORE_PATH: SQLite 文件路径 (默认: 同 JIMENG_JOB_STORE_PATH, 为空时只在内存中)
+- JIMENG_WEBHOOK_WORKERS: 同时进行的投递数 (默认: 4)
+- JIMENG_WEBHOOK_TIMEOUT: 单次投递的超时(秒) (默认: 10)
+- JIMENG_WEBHOOK_MAX_ATTEMPTS: 最多投递次数 (默认: 8)
+- JIMENG_WEBHOOK_BACKOFF: 首次重试的最长等待(秒), 之后每次翻倍 (默认: 2)
+- JIMENG_WEBHOOK_MAX_BACKOFF: 重试等待上限(秒) (默认: 600)
+- JIMENG_WEBHOOK_DEAD_LETTER: 死信日志文件 (JSON Lines), 为空时只记录在数据库和日志中 (默认: 空)
+- JIMENG_WEBHOOK_ALLOWED_HOSTS: 允许回调的主机名, 逗号分隔, 可以是内网地址;
+  为空时允许任意公网地址 (默认: 空)
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import hmac
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from .encoding import dumps
+from .errors import StructuredToolError
+from .http_client import get_http_client, internal_host, internal_target, request_timeout
+from .jobs import Job
+from .resilience import RetryPolicy, parse_retry_after
+from .shared import new_owner, owner_alive
+
+logger = logging.getLogger(__name__)
+
+# 可以重试的响应状态码 (另外所有 5xx 都重试)
+_RETRYABLE_STATUS = frozenset({408, 425, 429})
+
+_DELIVERY_COLUMNS = (
+    "id", "job_id", "event", "url", "secret", "body", "status",
+    "attempts", "next_attempt_at", "last_error", "created_at", "owner",
+)
+
+
+class InvalidCallbackError(StructuredToolError):
+    """callback_url 不可用"""
+
+    code = "invalid_callback"
+    status_code = 400
+
+    def __init__(self, message: str, url: str = ""):
+        super().__init__(message, url=url)
+        self.url = url
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    """回调签名: HMAC-SHA256(密钥, "{timestamp}.{body}") 的十六进制形式"""
+    message = timestamp.encode("ascii") + b"." + body
+    return hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+@dataclass
+class Delivery:
+    """一次回调投递"""
+    id: str
+    job_id: str
+    event: str
+    url: str
+    secret: Optional[str]
+    body: str
+    status: str = "pending"
+    attempts: int = 0
+    next_attempt_at: float = 0.0
+    last_error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+
+
+class WebhookDispatcher:
+    """登记任务回调, 任务结束后从持久化队列中投递"""
+
+    def __init__(
+        self,
+        store_path: str = ":memory:",
+        workers: int = 4,
+        timeout: float = 10.0,
+        max_attempts: int = 8,
+        backoff: float = 2.0,
+        max_backoff: float = 600.0,
+        dead_letter_path: Optional[str] = None,
+        allowed_hosts: tuple[str, ...] = (),
+    ):
+        self.store_path = store_path
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.retry_policy = RetryPolicy(max_attempts=self.max_attempts, base_delay=backoff, max_delay=max_backoff)
+        self.dead_letter_path = dead_letter_path
+        self.allowed_hosts = frozenset(host.lower() for host in allowed_hosts)
+        self.owner = new_owner()
+        self._db: Optional[sqlite3.Connection] = None
+        # 数据库操作在一个线程中按提交顺序执行: 登记总在同一任务的认领之前
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="jimeng-webhooks")
+        self._queue: asyncio.Queue[Delivery] = asyncio.Queue()
+        self._timers: set[asyncio.TimerHandle] = set()
+        self._tasks: list[asyncio.Task] = []
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["WebhookDispatcher"]:
+        """根据环境变量创建, 未启用时返回None"""
+        if os.getenv("JIMENG_WEBHOOKS", "0").strip().lower() not in ("1", "true", "yes", "on"):
+            return None
+        store_path = os.getenv("JIMENG_WEBHOOK_STORE_PATH", os.getenv("JIMENG_JOB_STORE_PATH", "")).strip()
+        allowed_hosts = os.getenv("JIMENG_WEBHOOK_ALLOWED_HOSTS", "")
+        return cls(
+            store_path=store_path or ":memory:",
+            workers=int(os.getenv("JIMENG_WEBHOOK_WORKERS", "4")),
+            timeout=float(os.getenv("JIMENG_WEBHOOK_TIMEOUT", "10")),
+            max_attempts=int(os.getenv("JIMENG_WEBHOOK_MAX_ATTEMPTS", "8")),
+            backoff=float(os.getenv("JIMENG_WEBHOOK_BACKOFF", "2")),
+            max_backoff=float(os.getenv("JIMENG_WEBHOOK_MAX_BACKOFF", "600")),
+            dead_letter_path=os.getenv("JIMENG_WEBHOOK_DEAD_LETTER", "").strip() or None,
+            allowed_hosts=tuple(host.strip() for host in allowed_hosts.split(",") if host.strip()),
+        )
+
+    def check(self, url: Any, secret: Any = None) -> None:
+        """检查回调地址和密钥, 不可用时抛出 InvalidCallbackError"""
+        if not isinstance(url, str) or not url:
+            raise InvalidCallbackError("callback_url 必须是非空字符串")
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise InvalidCallbackError("callback_url 必须是 http 或 https 地址", url)
+        host = parts.hostname.lower()
+        if self.allowed_hosts:
+            if host not in self.allowed_hosts:
+                raise InvalidCallbackError(f"不允许回调主机 {parts.hostname}", url)
+        elif internal_host(host):
+            raise InvalidCallbackError(f"不允许回调内网或本机地址 {parts.hostname}", url)
+        if secret is not None and not isinstance(secret, str):
+            raise InvalidCallbackError("callback_secret 必须是字符串", url)
+
+    def register(self, job_id: str, url: str, secret: Optional[str] = None) -> None:
+        """登记任务结束后的回调, 不等待写入完成"""
+        self._submit(self._insert_callback, job_id, url, secret or None)
+
+    def job_finished(self, job: Job) -> None:
+        """任务结束时由 JobManager 调用: 登记了回调的任务生成一次投递并放入队列"""
+        delivery_id = uuid.uuid4().hex
+        body = dumps({
+            "event": job.status.value,
+            "delivery_id": delivery_id,
+            "job": job.to_dict(),
+            "urls": job.urls,
+            "data": getattr(job.result, "structured", None),
+            "error": job.error,
+        })
+        loop = asyncio.get_running_loop()
+
+        def claim() -> None:
+            delivery = self._claim_callback(job.id, delivery_id, job.status.value, body)
+            if delivery is not None:
+                loop.call_soon_threadsafe(self._queue.put_nowait, delivery)
+
+        self._submit(claim)
+
+    async def start(self) -> None:
+        """启动投递协程, 并继续投递持有进程已退出的待投递记录"""
+        # 队列绑定到当前事件循环, 启动前放入的投递转入新队列
+        queued, self._queue = self._queue, asyncio.Queue()
+        while not queued.empty():
+            self._queue.put_nowait(queued.get_nowait())
+        deliveries = await self._run(self._claim_pending)
+        for delivery in deliveries:
+            self._schedule(delivery, delivery.next_attempt_at - time.time())
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"jimeng-webhook-{i}") for i in range(self.workers)
+        ]
+        if deliveries:
+            logger.info("♻️ 继续投递未完成的回调", extra={"deliveries": len(deliveries)})
+
+    async def stop(self) -> None:
+        """停止投递; 未完成的投递保留在数据库中, 下次启动时继续"""
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "scheduled": len(self._timers),
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead": self.dead,
+        }
+
+    async def _work(self) -> None:
+        while True:
+            delivery = await self._queue.get()
+            try:
+                await self._attempt(delivery)
+            except Exception:
+                logger.exception("❌ 回调投递出错", extra={"delivery_id": delivery.id})
+
+    async def _attempt(self, delivery: Delivery) -> None:
+        delivery.attempts += 1
+        body = delivery.body.encode("utf-8")
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "jimeng-mcp-webhook",
+            "X-Jimeng-Event": delivery.event,
+            "X-Jimeng-Delivery": delivery.id,
+            "X-Jimeng-Timestamp": timestamp,
+        }
+        if delivery.secret:
+            headers["X-Jimeng-Signature"] = f"sha256={sign(delivery.secret, timestamp, body)}"
+
+        retry_after = None
+        response = None
+        error = await self._internal_target(delivery.url)
+        retryable = False
+        if error is None:
+            try:
+                response = await get_http_client().post(
+                    delivery.url, content=body, headers=headers, timeout=request_timeout(self.timeout)
+                )
+            except httpx.HTTPError as e:
+                error, retryable = (f"{type(e).__name__}: {e}" if str(e) else type(e).__name__), True
+        if response is not None:
+            if 200 <= response.status_code < 300:
+                self.delivered += 1
+                logger.info("📨 回调已送达", extra={
+                    "delivery_id": delivery.id, "job_id": delivery.job_id, "attempts": delivery.attempts
+                })
+                await self._run(self._delete_delivery, delivery.id)
+                return
+            error = f"状态码 {response.status_code}"
+            retryable = response.status_code in _RETRYABLE_STATUS or response.status_code >= 500
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+        delivery.last_error = error
+        if retryable and delivery.attempts < self.max_attempts:
+            if retry_after is not None:
+                delay = min(retry_after, self.retry_policy.max_delay)
+            else:
+                delay = self.retry_policy.backoff(delivery.attempts)
+            delivery.next_attempt_at = time.time() + delay
+            self.retried += 1
+            logger.info("🔁 回调投递失败, 稍后重试", extra={
+                "delivery_id": delivery.id, "attempts": delivery.attempts,
+                "error": error, "retry_in": round(delay, 1),
+            })
+            await self._run(self._save_delivery, delivery)
+            self._schedule(delivery, delay)
+            return
+
+        delivery.status = "dead"
+        self.dead += 1
+        logger.warning("☠️ 回调投递放弃, 已写入死信", extra={
+            "delivery_id": delivery.id, "job_id": delivery.job_id, "url": delivery.url,
+            "attempts": delivery.attempts, "error": error,
+        })
+        await self._run(self._dead_letter, delivery)
+
+    async def _internal_target(self, url: str) -> Optional[str]:
+        """投递前解析回调主机, 解析到非公网地址时返回原因; 允许列表中的主机不检查"""
+        reason = await internal_target(url, self.allowed_hosts)
+        return None if reason is None else f"回调{reason}"
+
+    def _schedule(self, delivery: Delivery, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        if delay <= 0:
+            self._queue.put_nowait(delivery)
+            return
+
+        def enqueue() -> None:
+            self._timers.discard(timer)
+            self._queue.put_nowait(delivery)
+
+        timer = loop.call_later(delay, enqueue)
+        self._timers.add(timer)
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _submit(self, function: Callable[..., Any], *args: Any) -> None:
+        def report(future: concurrent.futures.Future) -> None:
+            if future.exception() is not None:
+                logger.warning("⚠️ 回调记录写入失败", extra={"error": str(future.exception())})
+
+        self._executor.submit(function, *args).add_done_callback(report)
+
+    # 以下方法在数据库线程中执行
+
+    def _insert_callback(self, job_id: str, url: str, secret: Optional[str]) -> None:
+        db = self._connect()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO webhook_callbacks (job_id, url, secret, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, url, secret, time.time()),
+            )
+
+    def _claim_callback(self, job_id: str, delivery_id: str, event: str, body: str) -> Optional[Delivery]:
+        """取出任务的回调登记并生成投递记录, 未登记时返回None"""
+        db = self._connect()
+        with db:
+            row = db.execute("SELECT url, secret FROM webhook_callbacks WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            db.execute("DELETE FROM webhook_callbacks WHERE job_id = ?", (job_id,))
+            delivery = Delivery(
+                id=delivery_id, job_id=job_id, event=event, url=row[0], secret=row[1], body=body,
+                next_attempt_at=time.time(),
+            )
+            self._write_delivery(db, delivery)
+        return delivery
+
+    def _save_delivery(self, delivery: Delivery) -> None:
+        db = self._connect()
+        with db:
+            self._write_delivery(db, delivery)
+
+    def _delete_delivery(self, delivery_id: str) -> None:
+        db = self._connect()
+        with db:
+            db.execute("DELETE FROM webhook_deliveries WHERE id = ?", (delivery_id,))
+
+    def _dead_letter(self, delivery: Delivery) -> None:
+        self._save_delivery(delivery)
+        if self.dead_letter_path is None:
+            return
+        record = dumps({
+            "delivery_id": delivery.id,
+            "job_id": delivery.job_id,
+            "event": delivery.event,
+            "url": delivery.url,
+            "attempts": delivery.attempts,
+            "error": delivery.last_error,
+            "created_at": delivery.created_at,
+            "failed_at": time.time(),
+            "body": delivery.body,
+        })
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(record + "\n")
+
+    def _write_delivery(self, db: sqlite3.Connection, delivery: Delivery) -> None:
+        db.execute(
+            f"INSERT OR REPLACE INTO webhook_deliveries ({', '.join(_DELIVERY_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in _DELIVERY_COLUMNS)})",
+            (
+                delivery.id, delivery.job_id, delivery.event, delivery.url, delivery.secret, delivery.body,
+                delivery.status, delivery.attempts, delivery.next_attempt_at, delivery.last_error,
+                delivery.created_at, self.owner,
+            ),
+        )
+
+    def _claim_pending(self) -> list[Delivery]:
+        """认领持有进程已退出的待投递记录"""
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                f"SELECT {', '.join(_DELIVERY_COLUMNS)} FROM webhook_deliveries "
+                "WHERE status = 'pending' ORDER BY next_attempt_at"
+            ).fetchall()
+            rows = [row for row in rows if not owner_alive(row[-1], self.owner)]
+            db.executemany(
+                "UPDATE webhook_deliveries SET owner = ? WHERE id = ?", [(self.owner, row[0]) for row in rows]
+            )
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        return [Delivery(*row[:-1]) for row in rows]
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            if self.store_path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.store_path)), exist_ok=True)
+            db = sqlite3.connect(self.store_path, check_same_thread=False, timeout=30)
+            if self.store_path != ":memory:":
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS webhook_callbacks ("
+                "job_id TEXT PRIMARY KEY, url TEXT NOT NULL, secret TEXT, created_at REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS webhook_deliveries ("
+                "id TEXT PRIMARY KEY, job_id TEXT NOT NULL, event TEXT NOT NULL, url TEXT NOT NULL, "
+                "secret TEXT, body TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "next_attempt_at REAL NOT NULL, last_error TEXT, created_at REAL NOT NULL, owner TEXT)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS webhook_deliveries_status ON webhook_deliveries (status)")
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,65 @@
+"""
+多工作进程部署
+
+--workers N (N > 1) 时由 uvicorn 的多进程管理器在同一端口上启动 N 个工作进程
+(父进程绑定监听端口, 工作进程继承同一 socket, 由内核分配连接),
+工作进程异常退出时自动重启。每个工作进程通过应用工厂重新导入服务器模块,
+因此各自拥有独立的事件循环、连接池和内存缓存。
+
+跨进程共享的状态都放在同一目录下的 SQLite 文件中 (WAL 模式), 启动工作进程前
+由父进程设置环境变量, 已显式配置的变量不会被覆盖:
+- JIMENG_CACHE_PATH: 结果缓存持久层, 一个进程生成的结果其他进程也能命中
+- JIMENG_JOB_STORE_PATH: 任务记录, 任一进程都能查询任务状态和结果
+- JIMENG_SHARED_STATE_PATH: 跨进程请求合并、SSE会话归属和限流令牌桶 (见 shared.py)
+- JIMENG_WORKERS: 工作进程数, 准入控制按此把并发上限平分给各进程 (见 admission.py)
+
+环境变量:
+- JIMENG_STATE_DIR: 共享状态文件所在目录 (默认: 系统临时目录下的 jimeng-mcp-<端口>)
+"""
+
+import contextlib
+import os
+import tempfile
+from typing import Iterator
+
+import uvicorn
+
+# 多进程模式下任务记录的批量写入间隔(秒), 缩短其他进程读到新任务的延迟
+_WORKER_FLUSH_INTERVAL = "0.02"
+
+
+def prepare_shared_state(port: int, workers: int) -> str:
+    """设置工作进程共享状态的环境变量, 返回状态目录"""
+    state_dir = os.getenv("JIMENG_STATE_DIR") or os.path.join(
+        tempfile.gettempdir(), f"jimeng-mcp-{port}"
+    )
+    os.makedirs(state_dir, exist_ok=True)
+    os.environ["JIMENG_WORKERS"] = str(workers)
+    os.environ.setdefault("JIMENG_CACHE_PATH", os.path.join(state_dir, "cache.db"))
+    os.environ.setdefault("JIMENG_JOB_STORE_PATH", os.path.join(state_dir, "jobs.db"))
+    os.environ.setdefault("JIMENG_JOB_STORE_FLUSH_INTERVAL", _WORKER_FLUSH_INTERVAL)
+    os.environ.setdefault("JIMENG_SHARED_STATE_PATH", os.path.join(state_dir, "shared.db"))
+    return state_dir
+
+
+def serve_workers(factory: str, host: str, port: int, workers: int) -> None:
+    """以多个工作进程运行应用, 阻塞直到收到退出信号
+
+    Args:
+        factory: 应用工厂的导入路径, 如 "jimeng_mcp.server:create_http_worker_app"
+    """
+    state_dir = prepare_shared_state(port, workers)
+    print(f"👥 {workers} 个工作进程, 共享状态目录: {state_dir}")
+    uvicorn.run(factory, factory=True, host=host, port=port, workers=workers, log_level="info")
+
+
+class InternalServer(uvicorn.Server):
+    """与主服务运行在同一事件循环中的内部服务, 不接管进程信号"""
+
+    def install_signal_handlers(self) -> None:
+        # uvicorn < 0.29
+        pass
+
+    @contextlib.contextmanager
+    def capture_signals(self) -> Iterator[None]:
+        yield
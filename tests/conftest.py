@@ -0,0 +1,17 @@
+"""
+测试公共配置
+
+服务器模块在首次导入时读取 JIMENG_API_KEY 构建上游配置, 未设置时调用工具会直接报错。
+测试中的上游请求都是模拟的, 未配置密钥时使用测试密钥, 使测试不依赖本地环境。
+"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    """未设置 JIMENG_API_KEY 时使用测试密钥"""
+    if not os.getenv("JIMENG_API_KEY"):
+        monkeypatch.setenv("JIMENG_API_KEY", "test-key")
@@ -0,0 +1,177 @@
+"""
+准入控制测试
+
+运行测试:
+    pytest tests/test_admission.py
+"""
+
+import asyncio
+import json
+
+import pytest
+from unittest.mock import patch
+
+from jimeng_mcp.admission import AdmissionController, AdmissionRejected
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded_and_queue_drains_in_order():
+    """测试并发数受限, 排队请求按顺序获得槽位"""
+    controller = AdmissionController(limit=2, max_queue=10, max_queue_time=5)
+    running = 0
+    peak = 0
+    order = []
+
+    async def work(i):
+        nonlocal running, peak
+        async with controller.slot("text_to_image"):
+            running += 1
+            peak = max(peak, running)
+            order.append(i)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*[work(i) for i in range(6)])
+
+    assert peak == 2
+    assert order == list(range(6))
+    stats = controller.stats()["text_to_image"]
+    assert stats["admitted"] == 6
+    assert stats["active"] == 0
+    assert stats["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_with_retry_after():
+    """测试队列已满时立即拒绝并给出重试时间"""
+    controller = AdmissionController(limit=1, max_queue=1, max_queue_time=5)
+    release = asyncio.Event()
+
+    async def hold():
+        async with controller.slot("text_to_video"):
+            await release.wait()
+
+    holders = [asyncio.create_task(hold()) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejected) as info:
+        async with controller.slot("text_to_video"):
+            pass
+    assert info.value.status_code == 429
+    assert int(info.value.headers()["Retry-After"]) >= 1
+    assert json.loads(str(info.value))["error"]["queue_depth"] == 1
+
+    release.set()
+    await asyncio.gather(*holders)
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_returns_503():
+    """测试排队超时返回503"""
+    controller = AdmissionController(limit=1, max_queue=5, max_queue_time=0.02)
+    release = asyncio.Event()
+
+    async def hold():
+        async with controller.slot("image_to_video"):
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected) as info:
+        async with controller.slot("image_to_video"):
+            pass
+    assert info.value.status_code == 503
+    assert controller.stats()["image_to_video"]["queue_depth"] == 0
+
+    release.set()
+    await holder
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot():
+    """测试排队中被取消的请求不会占用槽位"""
+    controller = AdmissionController(limit=1, max_queue=5, max_queue_time=5)
+    release = asyncio.Event()
+
+    async def hold():
+        async with controller.slot("t"):
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    release.set()
+    await asyncio.gather(holder, waiter, return_exceptions=True)
+
+    assert controller.gate("t").active == 0
+
+
+def test_per_tool_limits_from_env(monkeypatch):
+    """测试单个工具的并发上限可通过环境变量覆盖"""
+    monkeypatch.setenv("JIMENG_MAX_CONCURRENCY", "8")
+    monkeypatch.setenv("JIMENG_MAX_CONCURRENCY_TEXT_TO_VIDEO", "2")
+    controller = AdmissionController.from_env()
+
+    assert controller.gate("text_to_video").limit == 2
+    assert controller.gate("text_to_image").limit == 8
+
+
+@pytest.mark.asyncio
+async def test_rejection_reaches_mcp_caller_as_structured_error():
+    """测试MCP调用被拒绝时得到结构化错误"""
+    from jimeng_mcp import server
+
+    controller = AdmissionController(limit=1, max_queue=0, max_queue_time=1)
+    gate = controller.gate("text_to_video")
+    await gate.acquire()
+    with patch("jimeng_mcp.server.admission", controller):
+        with pytest.raises(AdmissionRejected) as info:
+            await server.handle_call_tool("text_to_video", {"prompt": "admission"})
+    gate.release()
+
+    assert json.loads(str(info.value))["error"]["code"] == "queue_full"
+
+
+
+@pytest.mark.asyncio
+async def test_background_jobs_wait_without_rejection():
+    """测试后台任务不受队列长度和排队时间限制, 槽位优先移交给交互请求"""
+    from unittest.mock import AsyncMock
+
+    from jimeng_mcp import server
+
+    controller = AdmissionController(limit=1, max_queue=1, max_queue_time=0.01)
+    gate = controller.gate("text_to_video")
+    await gate.acquire()
+    order = []
+
+    async def upstream(*args, **kwargs):
+        order.append("job")
+        return {"data": [{"url": "https://stub.local/queued.mp4"}]}
+
+    async def interactive():
+        async with controller.slot("text_to_video"):
+            order.append("interactive")
+
+    with patch("jimeng_mcp.server.admission", controller), \
+            patch("jimeng_mcp.server.make_api_request", AsyncMock(side_effect=upstream)):
+        jobs = [server.job_manager.submit("text_to_video", {"prompt": f"queued {i}"}) for i in range(3)]
+        # 超过排队时间、排队数超过 max_queue 后仍在等待
+        await asyncio.sleep(0.05)
+        assert gate.stats()["background_depth"] == 3
+        assert not any(job.status.finished for job in jobs)
+
+        gate.max_queue_time = 5
+        waiter = asyncio.create_task(interactive())
+        await asyncio.sleep(0)
+        gate.release()
+        await waiter
+        while not all(job.status.finished for job in jobs):
+            await asyncio.sleep(0.01)
+
+    assert order == ["interactive", "job", "job", "job"]
+    assert [job.status.value for job in jobs] == ["succeeded"] * 3
+    assert gate.stats()["rejected"] == 0 and gate.stats()["timed_out"] == 0
+    assert gate.active == 0
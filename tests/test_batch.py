@@ -0,0 +1,74 @@
+"""
+批量生成测试
+
+运行测试:
+    pytest tests/test_batch.py
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+
+@pytest.mark.asyncio
+async def test_batch_respects_concurrency_and_reports_each_item():
+    """测试批量生成受并发上限约束, 并逐项回调结果"""
+    from jimeng_mcp import server
+
+    running = 0
+    peak = 0
+
+    async def fake_request(endpoint, data, timeout=300):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if data["prompt"] == "bad":
+            return {"data": []}
+        return {"data": [{"url": f"https://stub.local/{data['prompt']}.png"}]}
+
+    reported = []
+
+    async def on_result(record):
+        reported.append(record["index"])
+
+    items = [{"prompt": f"batch-{i}", "cache": "bypass"} for i in range(5)] + [{"prompt": "bad", "cache": "bypass"}]
+    with patch("jimeng_mcp.server.make_api_request", fake_request):
+        records = await server.run_batch_text_to_image(items, concurrency=2, on_result=on_result)
+
+    assert peak == 2
+    assert sorted(reported) == list(range(6))
+    assert [record["index"] for record in records] == list(range(6))
+    assert records[0]["success"] and "batch-0.png" in records[0]["text"]
+    assert not records[5]["success"]
+
+
+@pytest.mark.asyncio
+async def test_batch_tool_sends_progress_notifications():
+    """测试MCP批量工具在客户端提供进度令牌时逐项推送进度"""
+    from jimeng_mcp import server
+
+    session = AsyncMock()
+    result = {"data": [{"url": "https://stub.local/p.png"}]}
+    with patch("jimeng_mcp.server.make_api_request", AsyncMock(return_value=result)), \
+            patch("jimeng_mcp.server.request_progress", return_value=(session, "tok")):
+        output = await server.handle_call_tool("batch_text_to_image", {
+            "items": [{"prompt": "progress-a"}, {"prompt": "progress-b"}],
+            "concurrency": 2
+        })
+
+    assert session.send_progress_notification.await_count == 2
+    totals = [call.kwargs["total"] for call in session.send_progress_notification.await_args_list]
+    assert totals == [2, 2]
+    assert "成功 2 项" in output[0].text
+
+
+@pytest.mark.asyncio
+async def test_batch_rejects_too_many_items():
+    """测试超过最大条目数时拒绝"""
+    from jimeng_mcp import server
+
+    with pytest.raises(ValueError):
+        await server.run_batch_text_to_image([{"prompt": "x"}] * (server.BATCH_MAX_ITEMS + 1))
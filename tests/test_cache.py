@@ -0,0 +1,93 @@
+"""
+生成结果缓存测试
+
+运行测试:
+    pytest tests/test_cache.py
+"""
+
+import time
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from jimeng_mcp.cache import ResultCache, request_key, result_expiry
+
+
+RESULT = {"data": [{"url": "https://example.com/a.png"}]}
+
+
+def test_request_key_is_canonical():
+    """测试键与字段顺序和数值写法无关"""
+    a = request_key("/v1/images/generations", {"prompt": "cat", "sample_strength": 1.0, "ratio": "1:1"})
+    b = request_key("/v1/images/generations", {"ratio": "1:1", "sample_strength": 1, "prompt": "cat"})
+    c = request_key("/v1/images/compositions", {"ratio": "1:1", "sample_strength": 1, "prompt": "cat"})
+
+    assert a == b
+    assert a != c
+
+
+def test_expiry_follows_cdn_url_lifetime():
+    """测试过期时间不超过CDN链接自身的过期时间"""
+    now = 1_000_000.0
+    signed = {"data": [{"url": f"https://cdn.example.com/a.png?x-expires={int(now) + 600}&x-signature=s"}]}
+
+    assert result_expiry(RESULT, ttl=3600, now=now) == now + 3600
+    assert result_expiry(signed, ttl=3600, now=now) < now + 600
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_oldest_entry():
+    """测试超过条目预算时淘汰最久未使用的条目"""
+    cache = ResultCache(max_entries=2)
+    await cache.set("a", RESULT)
+    await cache.set("b", RESULT)
+    assert await cache.get("a") is not None
+    await cache.set("c", RESULT)
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_not_returned():
+    """测试过期条目不会被返回"""
+    cache = ResultCache(ttl=0.01)
+    await cache.set("a", RESULT)
+    time.sleep(0.02)
+
+    assert await cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_persistent_tier_survives_restart(tmp_path):
+    """测试SQLite持久层在重新创建缓存后仍然命中"""
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(path=path)
+    await cache.set("a", RESULT)
+    cache.close()
+
+    restarted = ResultCache(path=path)
+    assert await restarted.get("a") == RESULT
+    assert restarted.stats()["disk_hits"] == 1
+    restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_text_to_image_uses_cache_and_honors_modes():
+    """测试相同请求命中缓存, bypass和refresh会重新请求上游"""
+    from jimeng_mcp import server
+
+    mock_request = AsyncMock(return_value=RESULT)
+    arguments = {"prompt": "cache test cat", "ratio": "16:9"}
+    with patch("jimeng_mcp.server.make_api_request", mock_request), \
+            patch("jimeng_mcp.server.result_cache", ResultCache()):
+        await server.handle_call_tool("text_to_image", dict(arguments))
+        await server.handle_call_tool("text_to_image", dict(arguments))
+        assert mock_request.await_count == 1
+
+        await server.handle_call_tool("text_to_image", {**arguments, "cache": "bypass"})
+        await server.handle_call_tool("text_to_image", {**arguments, "cache": "refresh"})
+        assert mock_request.await_count == 3
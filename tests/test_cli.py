@@ -0,0 +1,52 @@
+"""
+命令行入口测试
+
+运行测试:
+    pytest tests/test_cli.py
+"""
+
+import os
+import subprocess
+import sys
+
+from jimeng_mcp.cli import parse_args
+
+
+def run_python(code: str) -> subprocess.CompletedProcess:
+    """在不带 JIMENG_* 环境变量的子进程中运行代码"""
+    env = {key: value for key, value in os.environ.items() if not key.startswith("JIMENG_")}
+    return subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=60)
+
+
+def test_missing_key_fails_before_importing_sdk():
+    """测试缺少密钥时在导入MCP SDK之前以错误信息退出"""
+    result = run_python(
+        "import sys\n"
+        "from jimeng_mcp import cli\n"
+        "try:\n"
+        "    cli.main(['--mode', 'stdio'])\n"
+        "finally:\n"
+        "    print(sorted(name for name in ('mcp', 'starlette', 'uvicorn') if name in sys.modules))\n"
+    )
+    assert result.returncode == 1
+    assert "JIMENG_API_KEY" in result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_server_imports_without_key():
+    """测试缺少密钥时服务器模块仍可导入, 调用工具时才报错"""
+    result = run_python(
+        "import asyncio\n"
+        "import jimeng_mcp.server as server\n"
+        "result = asyncio.run(server.handle_call_tool('text_to_image', {'prompt': 'x'}))\n"
+        "print(repr(server.API_KEY), result[0].text.splitlines()[-1])\n"
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.startswith("'' ")
+    assert "至少需要配置一个即梦API地址和密钥" in result.stdout
+
+
+def test_workers_default_is_resolved_after_config():
+    """测试 --workers 未指定时留待加载 .env 后从 JIMENG_WORKERS 读取"""
+    assert parse_args(["--mode", "http"]).workers is None
+    assert parse_args(["--mode", "http", "--workers", "3"]).workers == 3
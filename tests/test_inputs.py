@@ -0,0 +1,106 @@
+"""
+本地文件与 base64 图像输入测试
+
+运行测试:
+    pytest tests/test_inputs.py
+"""
+
+import base64
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 2048
+
+
+def _resolver(tmp_path, allowed=True):
+    from jimeng_mcp.inputs import InputResolver
+    from jimeng_mcp.mirror import AssetMirror, LocalStorage
+
+    mirror = AssetMirror(LocalStorage(str(tmp_path / "assets")), url_prefix="https://mcp.example.com/assets")
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    return InputResolver(mirror, allowed_dirs=[str(inputs)] if allowed else []), inputs
+
+
+@pytest.mark.asyncio
+async def test_local_file_and_base64_share_content_address(tmp_path):
+    """测试本地文件、file:// 与 base64 输入按内容存储一次, 重复引用复用链接"""
+    resolver, inputs = _resolver(tmp_path)
+    path = inputs / "ref.png"
+    path.write_bytes(PNG)
+    encoded = "data:image/png;base64," + base64.b64encode(PNG).decode()
+
+    urls = await resolver.resolve_all([
+        str(path),
+        path.as_uri(),
+        encoded,
+        "https://cdn.example.com/remote.png",
+    ])
+
+    assert urls[0] == urls[1] == urls[2]
+    assert urls[0].startswith("https://mcp.example.com/assets/") and urls[0].endswith(".png")
+    assert urls[3] == "https://cdn.example.com/remote.png"
+    assert resolver.mirror.stats()["deduplicated"] >= 1
+
+    await resolver.resolve(str(path))
+    assert resolver.stats()["reused"] >= 1
+    stored = [p for p in (tmp_path / "assets").rglob("*.png")]
+    assert len(stored) == 1 and stored[0].read_bytes() == PNG
+
+
+@pytest.mark.asyncio
+async def test_rejected_inputs(tmp_path):
+    """测试目录限制、非图像内容和未配置可访问镜像时的错误"""
+    from jimeng_mcp.inputs import InputResolver
+
+    resolver, inputs = _resolver(tmp_path)
+    outside = tmp_path / "secret.png"
+    outside.write_bytes(PNG)
+    with pytest.raises(ValueError, match="不在允许的目录"):
+        await resolver.resolve(str(outside))
+    with pytest.raises(ValueError, match="不在允许的目录"):
+        await resolver.resolve(str(inputs / ".." / "secret.png"))
+
+    text = inputs / "notes.txt"
+    text.write_bytes(b"not an image" * 100)
+    with pytest.raises(ValueError, match="不是支持的图像格式"):
+        await resolver.resolve(str(text))
+    assert not (tmp_path / "assets").exists()
+
+    with pytest.raises(ValueError, match="JIMENG_MIRROR"):
+        await InputResolver(None).resolve(base64.b64encode(PNG).decode())
+
+    closed = InputResolver(resolver.mirror)
+    with pytest.raises(ValueError, match="JIMENG_INPUT_ALLOWED_DIRS"):
+        await closed.resolve(str(outside))
+
+
+@pytest.mark.asyncio
+async def test_image_composition_sends_resolved_urls(tmp_path):
+    """测试 image_composition 把本地路径转换为链接后再请求上游"""
+    from jimeng_mcp import server
+
+    resolver, inputs = _resolver(tmp_path)
+    path = inputs / "a.png"
+    path.write_bytes(PNG)
+
+    response = MagicMock()
+    response.json.return_value = {"data": [{"url": "https://cdn.example.com/out.png"}]}
+    response.raise_for_status = MagicMock()
+    response.status_code = 200
+    response.headers = {}
+    client = AsyncMock()
+    client.post.return_value = response
+
+    with patch("jimeng_mcp.server.get_http_client", return_value=client), \
+            patch.object(server, "input_resolver", resolver):
+        await server.handle_call_tool("image_composition", {
+            "prompt": "merge",
+            "images": [str(path), "https://cdn.example.com/b.png"],
+            "cache": "bypass",
+        })
+
+    sent = client.post.call_args.kwargs["json"]["images"]
+    assert sent[0].startswith("https://mcp.example.com/assets/")
+    assert sent[1] == "https://cdn.example.com/b.png"
@@ -0,0 +1,172 @@
+"""
+任务持久化测试
+
+运行测试:
+    pytest tests/test_job_store.py
+"""
+
+import asyncio
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from mcp.types import TextContent
+
+from jimeng_mcp.job_store import JobStore
+from jimeng_mcp.jobs import Job, JobManager, JobStatus
+
+
+def test_changes_are_batched_and_round_trip(tmp_path):
+    """测试同一任务的多次变化合并为一行写入, 读回后结果内容类型不变"""
+    store = JobStore(str(tmp_path / "jobs.db"), flush_interval=60)
+    job = Job(id="a", tool="text_to_image", arguments={"prompt": "cat"})
+    store.save(job)
+    job.status = JobStatus.RUNNING
+    store.save(job)
+    job.status = JobStatus.SUCCEEDED
+    job.result = [TextContent(type="text", text="URL: https://cdn.example.com/a.png")]
+    store.save(job)
+
+    # 尚未写入磁盘时也能读到最新状态
+    assert store.load("a").status is JobStatus.SUCCEEDED
+    assert store.flush() == 1
+    assert store.stats() == {"pending": 0, "writes": 1, "flushes": 1}
+    store.close()
+
+    reopened = JobStore(str(tmp_path / "jobs.db"))
+    loaded = reopened.load("a")
+    reopened.close()
+    assert loaded.status is JobStatus.SUCCEEDED
+    assert loaded.arguments == {"prompt": "cat"}
+    assert isinstance(loaded.result[0], TextContent)
+    assert loaded.urls == ["https://cdn.example.com/a.png"]
+
+
+
+def test_structured_result_survives_restart(tmp_path):
+    """测试结构化结果随任务持久化, 结果链接取自结构化结果; 较早版本的文件自动补充列"""
+    import sqlite3
+
+    from jimeng_mcp.tools import ToolResult
+
+    path = str(tmp_path / "jobs.db")
+    # 较早版本创建的表没有 structured 列
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, tool TEXT NOT NULL, arguments TEXT NOT NULL, "
+        "status TEXT NOT NULL, created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+        "result TEXT, urls TEXT, error TEXT, client_id TEXT, background INTEGER NOT NULL DEFAULT 1, "
+        "attempts INTEGER NOT NULL DEFAULT 0, owner TEXT)"
+    )
+    db.close()
+
+    urls = ["https://cdn.example.com/s1.png?sig=a)", "https://cdn.example.com/s2.png"]
+    store = JobStore(path)
+    job = Job(id="s", tool="text_to_image", arguments={"prompt": "cat"}, status=JobStatus.SUCCEEDED)
+    job.result = ToolResult([TextContent(type="text", text="✅ 成功生成 2 张图像")], {"urls": urls, "count": 2})
+    assert job.urls == urls
+    store.save(job)
+    store.close()
+
+    reopened = JobStore(path)
+    loaded = reopened.load("s")
+    reopened.close()
+    assert loaded.result.structured == {"urls": urls, "count": 2}
+    assert isinstance(loaded.result[0], TextContent)
+    assert loaded.urls == urls
+
+
+def test_store_without_owner_column_is_migrated(tmp_path):
+    """测试多进程模式之前创建的文件自动补充 owner 列, 未完成任务在启动时被认领"""
+    import sqlite3
+
+    path = str(tmp_path / "jobs.db")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, tool TEXT NOT NULL, arguments TEXT NOT NULL, "
+        "status TEXT NOT NULL, created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+        "result TEXT, urls TEXT, error TEXT, client_id TEXT, background INTEGER NOT NULL DEFAULT 1, "
+        "attempts INTEGER NOT NULL DEFAULT 0)"
+    )
+    db.execute(
+        "INSERT INTO jobs (id, tool, arguments, status, created_at) VALUES (?, ?, ?, ?, ?)",
+        ("old", "text_to_image", '{"prompt": "cat"}', "running", time.time()),
+    )
+    db.commit()
+    db.close()
+
+    store = JobStore(path)
+    assert [job.id for job in store.list_jobs()] == ["old"]
+    assert [job.id for job in store.claim_unfinished()] == ["old"]
+    assert store.claim_unfinished() == []
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_interrupted_job_resumes_after_restart(tmp_path):
+    """测试退出时中断的任务在重启后重新执行, 已完成任务的结果仍可查询"""
+    path = str(tmp_path / "jobs.db")
+    release = asyncio.Event()
+
+    async def slow(tool, arguments):
+        if arguments["prompt"] == "slow":
+            await release.wait()
+        return [TextContent(type="text", text=f"done:{arguments['prompt']}")]
+
+    store = JobStore(path, flush_interval=0.01)
+    manager = JobManager(slow, ["text_to_video"], store=store)
+    finished = manager.submit("text_to_video", {"prompt": "fast"})
+    interrupted = manager.submit("text_to_video", {"prompt": "slow"})
+    await asyncio.sleep(0.01)
+    await manager.shutdown()
+    store.close()
+
+    runner = AsyncMock(return_value=[TextContent(type="text", text="resumed")])
+    store = JobStore(path)
+    restarted = JobManager(runner, ["text_to_video"], store=store)
+    assert await restarted.recover() == 1
+    await asyncio.sleep(0.01)
+
+    runner.assert_awaited_once_with("text_to_video", {"prompt": "slow"})
+    job = await restarted.get(interrupted.id)
+    assert job.status is JobStatus.SUCCEEDED and job.attempts == 2
+    assert (await restarted.get(finished.id)).result[0].text == "done:fast"
+    assert {job.id for job in await restarted.list_jobs()} == {finished.id, interrupted.id}
+
+    # 达到最大执行次数的任务不再恢复
+    previous = JobStore(path)
+    previous.save(Job(id="stuck", tool="text_to_video", arguments={"prompt": "x"},
+                      status=JobStatus.RUNNING, attempts=1))
+    previous.close()
+    failing = JobManager(runner, ["text_to_video"], store=JobStore(path), max_attempts=1)
+    assert await failing.recover() == 0
+    assert (await failing.get("stuck")).status is JobStatus.FAILED
+    failing.store.close()
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_direct_tool_call_is_recorded(tmp_path):
+    """测试直接的工具调用也记录状态、参数和结果链接"""
+    from jimeng_mcp import server
+
+    response = MagicMock()
+    response.json.return_value = {"data": [{"url": "https://cdn.example.com/rec.png"}]}
+    response.raise_for_status = MagicMock()
+    response.status_code = 200
+    response.headers = {}
+    client = AsyncMock()
+    client.post.return_value = response
+
+    store = JobStore(str(tmp_path / "jobs.db"))
+    with patch("jimeng_mcp.server.get_http_client", return_value=client), \
+            patch.object(server.job_manager, "store", store):
+        await server.handle_call_tool("text_to_image", {"prompt": "record", "cache": "bypass"})
+        jobs = await server.job_manager.list_jobs()
+    store.close()
+
+    recorded = [job for job in jobs if not job.background]
+    assert len(recorded) == 1
+    assert recorded[0].status is JobStatus.SUCCEEDED
+    assert recorded[0].arguments["prompt"] == "record"
+    assert "https://cdn.example.com/rec.png" in recorded[0].urls
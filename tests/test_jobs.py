@@ -0,0 +1,171 @@
+"""
+异步任务管理测试
+
+运行测试:
+    pytest tests/test_jobs.py
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from mcp.types import TextContent
+
+from jimeng_mcp.jobs import JobManager, JobNotFoundError, JobStatus
+
+
+@pytest.mark.asyncio
+async def test_submit_returns_immediately_and_completes():
+    """测试提交任务立即返回, 后台执行完成后可获取结果"""
+    release = asyncio.Event()
+
+    async def runner(tool, arguments):
+        await release.wait()
+        return [TextContent(type="text", text=f"{tool}:{arguments['prompt']}")]
+
+    manager = JobManager(runner, ["text_to_image"])
+    job = manager.submit("text_to_image", {"prompt": "cat"})
+    await asyncio.sleep(0)
+    assert job.status is JobStatus.RUNNING
+
+    release.set()
+    await asyncio.sleep(0.01)
+    assert job.status is JobStatus.SUCCEEDED
+    assert job.result[0].text == "text_to_image:cat"
+    assert job.to_dict(include_result=True)["result"][0]["text"] == "text_to_image:cat"
+
+
+@pytest.mark.asyncio
+async def test_failed_job_records_error():
+    """测试执行异常时任务标记为失败"""
+    async def runner(tool, arguments):
+        raise RuntimeError("upstream down")
+
+    manager = JobManager(runner, ["text_to_video"])
+    job = manager.submit("text_to_video", {"prompt": "horse"})
+    await asyncio.sleep(0.01)
+
+    assert job.status is JobStatus.FAILED
+    assert job.error == "upstream down"
+    assert await manager.list_jobs(status="failed") == [job]
+
+
+@pytest.mark.asyncio
+async def test_submit_rejects_unknown_tool_and_unknown_job():
+    """测试不支持的工具和不存在的任务ID"""
+    manager = JobManager(AsyncMock(), ["text_to_image"])
+
+    with pytest.raises(ValueError):
+        manager.submit("list_jobs", {"prompt": "x"})
+    with pytest.raises(JobNotFoundError):
+        await manager.get("missing")
+
+
+@pytest.mark.asyncio
+async def test_shutdown_cancels_running_jobs():
+    """测试关闭时取消未完成的任务"""
+    async def runner(tool, arguments):
+        await asyncio.sleep(60)
+
+    manager = JobManager(runner, ["image_to_video"])
+    job = manager.submit("image_to_video", {"prompt": "x", "file_paths": ["u"]})
+    await asyncio.sleep(0)
+    await manager.shutdown()
+
+    assert job.status is JobStatus.CANCELLED
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_are_pruned_beyond_retention():
+    """测试超出保留数量的已结束任务被清理"""
+    manager = JobManager(AsyncMock(return_value=[]), ["text_to_image"], max_retained=2)
+    for i in range(4):
+        manager.submit("text_to_image", {"prompt": str(i)})
+        await asyncio.sleep(0.01)
+    manager.submit("text_to_image", {"prompt": "last"})
+
+    assert len(await manager.list_jobs()) == 3
+
+
+@pytest.mark.asyncio
+async def test_job_tools_through_handle_call_tool():
+    """测试通过MCP工具提交任务并获取结果"""
+    from jimeng_mcp import server
+
+    result = {"data": [{"url": "https://example.com/a.png"}]}
+    with patch("jimeng_mcp.server.make_api_request", AsyncMock(return_value=result)):
+        submitted = await server.handle_call_tool(
+            "submit_generation",
+            {"tool": "text_to_image", "arguments": {"prompt": "cat"}}
+        )
+        job_id = submitted[0].text.split("任务ID: ")[1].split("\n")[0]
+        await asyncio.sleep(0.01)
+
+        status = await server.handle_call_tool("get_job_status", {"job_id": job_id})
+        assert "succeeded" in status[0].text
+
+        output = await server.handle_call_tool("get_job_result", {"job_id": job_id})
+        assert "https://example.com/a.png" in output[0].text
+
+        listing = await server.handle_call_tool("list_jobs", None)
+        assert job_id in listing[0].text
+
+
+@pytest.mark.asyncio
+async def test_subscribers_share_one_event_per_transition():
+    """测试同一任务的多个订阅者收到同一份事件, 客户端订阅只收到自己的任务"""
+    release = asyncio.Event()
+
+    async def runner(tool, arguments):
+        await release.wait()
+        return [TextContent(type="text", text="图像 1:\nhttps://cdn.local/a.png\n")]
+
+    manager = JobManager(runner, ["text_to_image"])
+    client_sub = manager.subscribe(client_id="alice")
+    job = manager.submit("text_to_image", {"prompt": "cat"}, client_id="alice")
+    manager.submit("text_to_image", {"prompt": "dog"}, client_id="bob")
+    subs = [manager.subscribe(job_id=job.id) for _ in range(3)]
+    assert manager.subscribers == 4
+
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.sleep(0.01)
+
+    events = [[sub.queue.get_nowait() for _ in range(sub.queue.qsize())] for sub in subs]
+    assert [event["event"] for event in events[0]] == ["running", "succeeded"]
+    assert all(other[1] is events[0][1] for other in events[1:])
+    assert events[0][1]["urls"] == ["https://cdn.local/a.png"]
+
+    client_events = [client_sub.queue.get_nowait() for _ in range(client_sub.queue.qsize())]
+    assert [event["event"] for event in client_events] == ["pending", "running", "succeeded"]
+    assert all(event["job"]["job_id"] == job.id for event in client_events)
+
+    for sub in subs + [client_sub]:
+        sub.close()
+    assert manager.subscribers == 0
+
+
+@pytest.mark.asyncio
+async def test_job_event_stream_ends_after_final_event():
+    """测试单个任务的SSE事件流在任务结束后关闭"""
+    from jimeng_mcp import server
+    from jimeng_mcp.jobs import job_event
+
+    async def runner(tool, arguments):
+        await asyncio.sleep(0.01)
+        return [TextContent(type="text", text="https://cdn.local/v.mp4")]
+
+    manager = JobManager(runner, ["text_to_video"])
+    job = manager.submit("text_to_video", {"prompt": "wave"})
+    subscription = manager.subscribe(job_id=job.id)
+    chunks = [
+        chunk async for chunk in server.job_event_stream(
+            subscription, [job_event(job)], stop_when_finished=True, heartbeat=0.005
+        )
+    ]
+
+    events = [chunk.split("\n")[0] for chunk in chunks if chunk.startswith("event:")]
+    assert events[0] == "event: pending"
+    assert events[-1] == "event: succeeded"
+    assert "https://cdn.local/v.mp4" in chunks[-1]
+    assert manager.subscribers == 0
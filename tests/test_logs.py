@@ -0,0 +1,90 @@
+"""
+结构化日志测试
+
+运行测试:
+    pytest tests/test_logs.py
+"""
+
+import json
+import logging
+
+import pytest
+
+
+@pytest.fixture
+def json_logs(capsys, monkeypatch):
+    """以stdio模式配置日志, 返回读取stderr中JSON日志的函数"""
+    from jimeng_mcp import logs
+
+    monkeypatch.setenv("JIMENG_LOG_LEVEL", "DEBUG")
+    monkeypatch.setenv("JIMENG_LOG_FORMAT", "json")
+    monkeypatch.delenv("JIMENG_LOG_FILE", raising=False)
+    logs.setup_logging("stdio")
+
+    def read():
+        logs.shutdown_logging()
+        captured = capsys.readouterr()
+        assert captured.out == ""
+        return [json.loads(line) for line in captured.err.splitlines() if line.startswith("{")]
+
+    yield read
+    logs.shutdown_logging()
+    logs.logger.handlers.clear()
+    logs.logger.propagate = True
+
+
+def test_records_carry_request_context(json_logs):
+    """测试日志为JSON格式并带有 request_id、tool、model 和结构化字段"""
+    from jimeng_mcp.logs import request_context
+
+    log = logging.getLogger("jimeng_mcp.server")
+    with request_context(tool="text_to_image", model="jimeng-4.5", request_id="req-1"):
+        log.info("工具调用完成", extra={"duration_ms": 12.5})
+    log.info("无上下文")
+
+    entries = json_logs()
+    assert entries[0]["msg"] == "工具调用完成"
+    assert entries[0]["request_id"] == "req-1"
+    assert entries[0]["tool"] == "text_to_image"
+    assert entries[0]["model"] == "jimeng-4.5"
+    assert entries[0]["duration_ms"] == 12.5
+    assert "request_id" not in entries[1]
+
+
+def test_payloads_are_truncated(json_logs):
+    """测试大段数据内容被截断"""
+    from jimeng_mcp.logs import log_payload, payload
+
+    assert payload("x" * 10, limit=4) == "xxxx…(+6)"
+    log_payload("📦 返回数据", {"data": ["y" * 2000]})
+
+    entries = json_logs()
+    assert len(entries[0]["payload"]) < 600
+    assert entries[0]["payload"].endswith(")")
+
+
+@pytest.mark.asyncio
+async def test_api_request_logs_without_stdout(json_logs):
+    """测试请求路径只通过日志输出, stdio模式下不写入stdout"""
+    from unittest.mock import AsyncMock, MagicMock, patch
+    from jimeng_mcp import server
+
+    response = MagicMock()
+    response.json.return_value = {"data": [{"url": "https://stub.local/log.png"}]}
+    response.raise_for_status = MagicMock()
+    response.status_code = 200
+    response.headers = {}
+    client = AsyncMock()
+    client.post.return_value = response
+
+    with patch("jimeng_mcp.server.get_http_client", return_value=client):
+        await server.run_tool("text_to_image", {"prompt": "logging", "cache": "bypass"})
+
+    entries = json_logs()
+    messages = [entry["msg"] for entry in entries]
+    assert "✅ API请求成功" in messages
+    assert "工具调用完成" in messages
+    request_ids = {entry.get("request_id") for entry in entries}
+    assert len(request_ids) == 1 and None not in request_ids
+    done = next(entry for entry in entries if entry["msg"] == "工具调用完成")
+    assert done["tool"] == "text_to_image" and "duration_ms" in done
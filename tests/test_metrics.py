@@ -0,0 +1,125 @@
+"""
+运行指标测试
+
+运行测试:
+    pytest tests/test_metrics.py
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+def test_histogram_renders_cumulative_buckets():
+    """测试直方图按 Prometheus 文本格式导出累计分桶"""
+    from jimeng_mcp.metrics import MetricsRegistry
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "示例", ("tool",), buckets=(1, 5))
+    for value in (0.5, 2, 10):
+        histogram.observe(value, tool="text_to_image")
+
+    text = registry.render()
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{tool="text_to_image",le="1"} 1' in text
+    assert 'demo_seconds_bucket{tool="text_to_image",le="5"} 2' in text
+    assert 'demo_seconds_bucket{tool="text_to_image",le="+Inf"} 3' in text
+    assert 'demo_seconds_sum{tool="text_to_image"} 12.5' in text
+    assert 'demo_seconds_count{tool="text_to_image"} 3' in text
+
+
+def test_counter_gauge_and_callback():
+    """测试计数器、仪表和回调仪表的导出"""
+    from jimeng_mcp.metrics import MetricsRegistry
+
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "示例", ("kind",))
+    gauge = registry.gauge("demo_in_flight", "示例")
+    registry.callback_gauge("demo_depth", "示例", ("tool",), lambda: {("a",): 3})
+
+    counter.inc(kind='http_"500"')
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+
+    text = registry.render()
+    assert 'demo_total{kind="http_\\"500\\""} 1' in text
+    assert "demo_in_flight 1" in text
+    assert 'demo_depth{tool="a"} 3' in text
+    with pytest.raises(ValueError):
+        registry.counter("demo_total", "重复")
+
+
+def test_write_file_is_atomic(tmp_path):
+    """测试指标文件写入"""
+    from jimeng_mcp.metrics import MetricsRegistry
+
+    registry = MetricsRegistry()
+    registry.counter("demo_total", "示例").inc()
+    path = tmp_path / "jimeng.prom"
+    registry.write_file(str(path))
+    assert "demo_total 1" in path.read_text(encoding="utf-8")
+    assert not (tmp_path / "jimeng.prom.tmp").exists()
+
+
+@pytest.mark.asyncio
+async def test_tool_calls_record_latency_and_error_classes():
+    """测试工具调用记录耗时直方图和按类别的错误计数"""
+    from jimeng_mcp import server
+
+    ok = MagicMock()
+    ok.json.return_value = {"data": [{"url": "https://stub.local/metrics.mp4"}]}
+    ok.raise_for_status = MagicMock()
+    ok.status_code = 200
+    ok.headers = {}
+    empty = MagicMock()
+    empty.json.return_value = {"data": []}
+    empty.raise_for_status = MagicMock()
+    empty.status_code = 200
+    empty.headers = {}
+    client = AsyncMock()
+    client.post.side_effect = [ok, empty, httpx.ReadTimeout("slow")] + [ok] * 3
+
+    labels = {"tool": "text_to_video", "model": "metrics-model"}
+    other = {"tool": "text_to_video", "model": "other", "outcome": "success"}
+    others_before = server.tool_duration_seconds.count(**other)
+    with patch("jimeng_mcp.server.get_http_client", return_value=client), \
+            patch("jimeng_mcp.server.KNOWN_MODELS", frozenset({"metrics-model"})):
+        await server.handle_call_tool("text_to_video", {"prompt": "m1", "model": "metrics-model"})
+        await server.handle_call_tool("text_to_video", {"prompt": "m2", "model": "metrics-model"})
+        await server.handle_call_tool("text_to_video", {"prompt": "m3", "model": "metrics-model"})
+        # 客户端任意填写的模型名不会产生新的标签
+        for i in range(3):
+            await server.handle_call_tool("text_to_video", {"prompt": "m4", "model": f"made-up-{i}"})
+
+    assert server.tool_duration_seconds.count(outcome="success", **labels) == 1
+    assert server.tool_duration_seconds.count(outcome="error", **labels) == 2
+    assert server.tool_errors_total.value(tool="text_to_video", kind="empty_data") >= 1
+    assert server.tool_errors_total.value(tool="text_to_video", kind="timeout") >= 1
+    assert server.upstream_errors_total.value(endpoint="/v1/videos/generations", kind="timeout") >= 1
+    assert server.upstream_in_flight.value(endpoint="/v1/videos/generations") == 0
+    assert server.tool_in_flight.value(tool="text_to_video") == 0
+    assert server.tool_duration_seconds.count(**other) == others_before + 3
+
+    text = server.metrics.render()
+    assert 'jimeng_tool_duration_seconds_count{tool="text_to_video",model="metrics-model",outcome="success"} 1' in text
+    assert "# TYPE jimeng_admission_queue_depth gauge" in text
+    assert "made-up" not in text
+
+
+@pytest.mark.asyncio
+async def test_dump_periodically_writes_on_cancel(tmp_path):
+    """测试stdio模式定期写入指标文件, 取消时再写一次"""
+    from jimeng_mcp.metrics import MetricsRegistry, dump_periodically
+
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "示例")
+    path = tmp_path / "metrics.prom"
+    task = asyncio.create_task(dump_periodically(registry, str(path), interval=10))
+    await asyncio.sleep(0.05)
+    counter.inc(5)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert "demo_total 5" in path.read_text(encoding="utf-8")
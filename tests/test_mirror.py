@@ -0,0 +1,122 @@
+"""
+生成结果镜像测试
+
+运行测试:
+    pytest tests/test_mirror.py
+"""
+
+import base64
+import hashlib
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"x" * 4096
+
+
+def _cdn(content: bytes = PNG, headers: dict = None):
+    """模拟CDN, 所有链接返回相同内容"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(str(request.url))
+        return httpx.Response(200, content=content, headers={"Content-Type": "image/png", **(headers or {})})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), requests
+
+
+@pytest.mark.asyncio
+async def test_local_mirror_is_content_addressed(tmp_path):
+    """测试按内容哈希存储, 相同内容只存一份, 链接使用配置的前缀"""
+    from jimeng_mcp.mirror import AssetMirror, LocalStorage
+
+    client, requests = _cdn()
+    mirror = AssetMirror(LocalStorage(str(tmp_path)), url_prefix="https://mcp.example.com/assets")
+    urls = ["https://cdn.example.com/a.png?sig=1", "https://cdn.example.com/b.png?sig=2"]
+    with patch("jimeng_mcp.mirror.get_http_client", return_value=client):
+        first = await mirror.mirror_all(urls[:1])
+        first.update(await mirror.mirror_all(urls))
+        again = await mirror.mirror_all(urls[:1])
+
+    digest = hashlib.sha256(PNG).hexdigest()
+    key = f"{digest[:2]}/{digest}.png"
+    assert first[urls[0]].key == key and first[urls[1]].key == key
+    assert first[urls[0]].url == f"https://mcp.example.com/assets/{key}"
+    assert (tmp_path / digest[:2] / f"{digest}.png").read_bytes() == PNG
+    assert again[urls[0]] is first[urls[0]]
+    assert len(requests) == 2
+    assert mirror.stats()["deduplicated"] == 1
+    assert mirror.local_path(key) is not None
+    assert mirror.local_path("../../etc/passwd") is None
+    assert list((tmp_path / ".tmp").iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_checksum_mismatch_is_not_mirrored(tmp_path):
+    """测试 Content-MD5 不一致时放弃镜像并删除临时文件"""
+    from jimeng_mcp.mirror import AssetMirror, LocalStorage
+
+    wrong_md5 = base64.b64encode(hashlib.md5(b"other").digest()).decode()
+    client, _ = _cdn(headers={"Content-MD5": wrong_md5})
+    mirror = AssetMirror(LocalStorage(str(tmp_path)))
+    with patch("jimeng_mcp.mirror.get_http_client", return_value=client):
+        result = await mirror.mirror_all(["https://cdn.example.com/bad.png"])
+
+    assert result == {"https://cdn.example.com/bad.png": None}
+    assert mirror.stats()["failed"] == 1
+    assert list((tmp_path / ".tmp").iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_cdn_redirects_are_followed_to_public_hosts_only(tmp_path):
+    """测试跟随CDN的重定向下载, 重定向到内网地址时不请求并放弃镜像"""
+    from jimeng_mcp.mirror import AssetMirror, LocalStorage
+
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(str(request.url))
+        if request.url.path == "/signed.png":
+            return httpx.Response(302, headers={"Location": "https://edge.example.com/a.png"})
+        if request.url.path == "/internal.png":
+            return httpx.Response(302, headers={"Location": "http://10.1.2.3/a.png"})
+        return httpx.Response(200, content=PNG, headers={"Content-Type": "image/png"})
+
+    mirror = AssetMirror(LocalStorage(str(tmp_path)))
+    urls = ["https://cdn.example.com/signed.png", "https://cdn.example.com/internal.png"]
+    with patch("jimeng_mcp.mirror.get_http_client",
+               return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))), \
+            patch("jimeng_mcp.http_client.resolve_host", AsyncMock(return_value=["93.184.216.34"])):
+        result = await mirror.mirror_all(urls)
+
+    assert result[urls[0]].sha256 == hashlib.sha256(PNG).hexdigest()
+    assert result[urls[1]] is None
+    assert "http://10.1.2.3/a.png" not in requests
+    assert mirror.stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_tool_response_includes_mirror_link(tmp_path):
+    """测试工具结果在原始链接旁附上镜像链接"""
+    from jimeng_mcp import server
+    from jimeng_mcp.mirror import AssetMirror, LocalStorage
+
+    response = MagicMock()
+    response.json.return_value = {"data": [{"url": "https://cdn.example.com/gen.png"}]}
+    response.raise_for_status = MagicMock()
+    response.status_code = 200
+    response.headers = {}
+    upstream = AsyncMock()
+    upstream.post.return_value = response
+    cdn, _ = _cdn()
+
+    mirror = AssetMirror(LocalStorage(str(tmp_path)))
+    with patch("jimeng_mcp.server.get_http_client", return_value=upstream), \
+            patch("jimeng_mcp.mirror.get_http_client", return_value=cdn), \
+            patch.object(server, "asset_mirror", mirror):
+        result = await server.handle_call_tool("text_to_image", {"prompt": "mirror", "cache": "bypass"})
+
+    text = result[0].text
+    assert "https://cdn.example.com/gen.png" in text
+    assert "镜像: file://" in text
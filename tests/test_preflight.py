@@ -0,0 +1,138 @@
+"""
+输入图像预检测试
+
+运行测试:
+    pytest tests/test_preflight.py
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from jimeng_mcp.preflight import InputPreflight, InputPreflightError
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def _cdn(requests: list[str]) -> httpx.AsyncClient:
+    """模拟CDN: 不同路径返回正常图像、404、过大的文件、HTML页面或长时间无响应"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        assert request.headers["Range"] == "bytes=0-15"
+        path = request.url.path
+        if path.startswith("/ok"):
+            return httpx.Response(206, content=PNG[:16], headers={
+                "Content-Type": "image/png", "Content-Range": f"bytes 0-15/{len(PNG)}",
+            })
+        if path == "/missing.png":
+            return httpx.Response(404)
+        if path == "/huge.png":
+            return httpx.Response(206, content=PNG[:16], headers={"Content-Range": "bytes 0-15/999999999"})
+        if path == "/page.png":
+            return httpx.Response(200, content=b"<html>", headers={"Content-Type": "text/html"})
+        if path == "/fake.png":
+            return httpx.Response(200, content=b"not an image at all", headers={"Content-Type": "image/png"})
+        await asyncio.sleep(5)
+        return httpx.Response(206, content=PNG[:16])
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_bad_urls_are_rejected_quickly():
+    """测试不可访问、过大、不是图像的URL被拒绝, 无响应的URL在截止时间后失败"""
+    requests: list[str] = []
+    preflight = InputPreflight(deadline=0.3, max_bytes=1024)
+    with patch("jimeng_mcp.preflight.get_http_client", return_value=_cdn(requests)):
+        await preflight.check_all(["https://cdn.example.com/ok1.png", "https://cdn.example.com/ok2.png"])
+
+        reasons = {}
+        for path in ("missing.png", "huge.png", "page.png", "fake.png"):
+            with pytest.raises(InputPreflightError) as exc:
+                await preflight.check_all([
+                    "https://cdn.example.com/ok1.png", f"https://cdn.example.com/{path}",
+                ])
+            reasons[path] = exc.value.reason
+        # 无法解析的URL同样是不合格的输入, 而不是内部错误
+        with pytest.raises(InputPreflightError) as exc:
+            await preflight.check_all(["https://cdn.example.com/ok1.png", "http://[::1/bad.png"])
+        reasons["invalid"] = exc.value.reason
+
+        start = time.monotonic()
+        with pytest.raises(InputPreflightError) as exc:
+            await preflight.check_all(["https://cdn.example.com/ok1.png", "https://cdn.example.com/slow.png"])
+        assert time.monotonic() - start < 1.0
+        assert exc.value.url.endswith("/slow.png")
+
+    assert "404" in reasons["missing.png"]
+    assert "过大" in reasons["huge.png"]
+    assert "text/html" in reasons["page.png"]
+    assert "图像格式" in reasons["fake.png"]
+    assert reasons["invalid"].startswith("URL无效")
+    # 合格的URL只检查一次, 之后命中缓存
+    assert requests.count("/ok1.png") == 1
+    assert preflight.stats()["cache_hits"] == 6
+
+
+@pytest.mark.asyncio
+async def test_internal_addresses_are_refused_before_request():
+    """测试指向内网或本机的URL和重定向不发出请求, 重定向到公网地址时正常跟随"""
+    requests: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(str(request.url))
+        if request.url.path == "/to-metadata.png":
+            return httpx.Response(302, headers={"Location": "http://169.254.169.254/latest/meta-data"})
+        if request.url.path == "/to-internal.png":
+            return httpx.Response(302, headers={"Location": "https://intranet.example.com/a.png"})
+        if request.url.path == "/moved.png":
+            return httpx.Response(301, headers={"Location": "/ok.png"})
+        return httpx.Response(206, content=PNG[:16], headers={"Content-Type": "image/png"})
+
+    resolved = {"cdn.example.com": ["93.184.216.34"], "intranet.example.com": ["10.0.0.5"]}
+    preflight = InputPreflight(deadline=1.0)
+    with patch("jimeng_mcp.preflight.get_http_client",
+               return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))), \
+            patch("jimeng_mcp.http_client.resolve_host", AsyncMock(side_effect=lambda host, port: resolved[host])):
+        for url in (
+            "http://127.0.0.1:8080/a.png", "http://localhost/a.png", "http://[::1]/a.png",
+            "http://192.168.1.1/a.png", "https://intranet.example.com/a.png",
+            "https://cdn.example.com/to-metadata.png", "https://cdn.example.com/to-internal.png",
+        ):
+            with pytest.raises(InputPreflightError) as exc:
+                await preflight.check_all([url])
+            assert exc.value.reason.startswith("不允许访问")
+        await preflight.check_all(["https://cdn.example.com/moved.png"])
+
+    # 内网地址从未被请求, 只有公网的初始地址和公网重定向目标
+    assert requests == [
+        "https://cdn.example.com/to-metadata.png", "https://cdn.example.com/to-internal.png",
+        "https://cdn.example.com/moved.png", "https://cdn.example.com/ok.png",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_composition_fails_before_upstream(monkeypatch):
+    """测试启用预检时, 输入URL不合格的合成请求不发往上游"""
+    from jimeng_mcp import server
+
+    upstream = AsyncMock()
+    preflight = InputPreflight(deadline=1.0)
+    monkeypatch.setattr(server, "input_preflight", preflight)
+    with patch("jimeng_mcp.preflight.get_http_client", return_value=_cdn([])), \
+            patch("jimeng_mcp.server.get_http_client", return_value=upstream):
+        with pytest.raises(InputPreflightError) as exc:
+            await server.handle_call_tool("image_composition", {
+                "prompt": "merge",
+                "images": ["https://cdn.example.com/ok.png", "https://cdn.example.com/missing.png"],
+                "cache": "bypass",
+            })
+    upstream.post.assert_not_awaited()
+    error = json.loads(str(exc.value))["error"]
+    assert error["code"] == "invalid_input_image"
+    assert error["url"] == "https://cdn.example.com/missing.png"
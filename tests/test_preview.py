@@ -0,0 +1,93 @@
+"""
+结果预览图测试
+
+运行测试:
+    pytest tests/test_preview.py
+"""
+
+import base64
+import io
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _png(size=(1600, 900), color=(200, 80, 40)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _cdn():
+    """模拟CDN, 记录请求次数"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(str(request.url))
+        return httpx.Response(200, content=_png(), headers={"Content-Type": "image/png"})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), requests
+
+
+def test_build_preview_bounds_size_and_bytes():
+    """测试单图预览按最长边缩放, 多图拼成联系表, 字节数受限"""
+    from jimeng_mcp.preview import build_preview
+
+    single = Image.open(io.BytesIO(build_preview([_png()], 256, "webp", 90, 64 * 1024)))
+    assert single.format == "WEBP"
+    assert max(single.size) == 256
+
+    data = build_preview([_png(), _png(color=(0, 0, 255)), _png()], 300, "jpeg", 95, 8 * 1024)
+    sheet = Image.open(io.BytesIO(data))
+    assert sheet.format == "JPEG"
+    assert max(sheet.size) <= 300
+    assert len(data) <= 8 * 1024
+
+
+@pytest.mark.asyncio
+async def test_renderer_uses_process_pool_and_caches_by_url():
+    """测试在进程池中生成预览, 相同链接再次请求时命中缓存"""
+    from jimeng_mcp.preview import PreviewRenderer
+
+    client, requests = _cdn()
+    renderer = PreviewRenderer(max_size=128, workers=1)
+    urls = ["https://cdn.example.com/1.png", "https://cdn.example.com/2.png"]
+    try:
+        with patch("jimeng_mcp.preview.get_http_client", return_value=client):
+            first = await renderer.render(urls)
+            second = await renderer.render(urls)
+    finally:
+        renderer.shutdown()
+
+    assert first is second
+    assert first.type == "image" and first.mimeType == "image/webp"
+    assert Image.open(io.BytesIO(base64.b64decode(first.data))).format == "WEBP"
+    assert len(requests) == 2
+    assert renderer.stats()["cache_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_text_to_image_returns_image_content():
+    """测试启用预览后工具结果包含 ImageContent, 文本结果仍在第一项"""
+    from jimeng_mcp import server
+    from jimeng_mcp.preview import PreviewRenderer
+
+    response = MagicMock()
+    response.json.return_value = {"data": [{"url": "https://cdn.example.com/p.png"}]}
+    response.raise_for_status = MagicMock()
+    response.status_code = 200
+    response.headers = {}
+    upstream = AsyncMock()
+    upstream.post.return_value = response
+    cdn, _ = _cdn()
+
+    with patch("jimeng_mcp.server.get_http_client", return_value=upstream), \
+            patch("jimeng_mcp.preview.get_http_client", return_value=cdn), \
+            patch.object(server, "preview_renderer", PreviewRenderer(max_size=64, workers=0)):
+        result = await server.handle_call_tool("text_to_image", {"prompt": "preview", "cache": "bypass"})
+
+    assert result[0].type == "text" and "https://cdn.example.com/p.png" in result[0].text
+    assert result[1].type == "image"
@@ -0,0 +1,90 @@
+"""
+生成进度通知测试
+
+运行测试:
+    pytest tests/test_progress.py
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+def test_estimator_uses_median_of_recent_completions():
+    """测试耗时估算: 无历史时使用默认值, 有历史时使用中位数"""
+    from jimeng_mcp.progress import DurationEstimator
+
+    estimator = DurationEstimator({"text_to_image": 90.0})
+    assert estimator.estimate("text_to_image", "jimeng-4.5") == 90.0
+
+    for duration in (10.0, 30.0, 20.0):
+        estimator.record("text_to_image", "jimeng-4.5", duration)
+    assert estimator.estimate("text_to_image", "jimeng-4.5") == 20.0
+    # 不同模型分开统计
+    assert estimator.estimate("text_to_image", "jimeng-4.0") == 90.0
+
+
+@pytest.mark.asyncio
+async def test_tracker_reports_phases_and_elapsed_time():
+    """测试进度通知包含阶段、已耗时和预计耗时, 且进度单调递增"""
+    from jimeng_mcp.progress import ProgressTracker, set_phase
+
+    session = AsyncMock()
+    tracker = ProgressTracker(interval=0.02)
+    async with tracker.track("text_to_video", "jimeng-video-3.0", (session, "tok")):
+        set_phase("submitted")
+        await asyncio.sleep(0.05)
+        set_phase("formatting")
+
+    calls = session.send_progress_notification.call_args_list
+    messages = [call.kwargs["message"] for call in calls]
+    progresses = [call.args[1] for call in calls]
+
+    assert all(call.args[0] == "tok" for call in calls)
+    assert messages[0].startswith("排队中")
+    assert any(message.startswith("已提交") for message in messages)
+    assert any(message.startswith("等待即梦生成") for message in messages)
+    assert messages[-1].startswith("整理结果")
+    assert "预计 300秒" in messages[0]
+    assert progresses == sorted(progresses)
+    assert all(call.kwargs["total"] >= call.args[1] for call in calls)
+
+    # 完成后记录耗时, 下次估算使用实际耗时
+    assert tracker.estimator.estimate("text_to_video", "jimeng-video-3.0") < 1
+
+
+@pytest.mark.asyncio
+async def test_tracker_skips_estimate_when_upstream_not_called():
+    """测试命中缓存等未请求上游的调用不影响耗时估算"""
+    from jimeng_mcp.progress import ProgressTracker
+
+    tracker = ProgressTracker(interval=1)
+    async with tracker.track("text_to_image", "jimeng-4.5"):
+        pass
+    assert tracker.estimator.estimate("text_to_image", "jimeng-4.5") == 90.0
+
+
+@pytest.mark.asyncio
+async def test_run_tool_sends_progress_when_token_present():
+    """测试生成工具在客户端提供进度令牌时发送进度通知"""
+    from jimeng_mcp import server
+
+    response = MagicMock()
+    response.json.return_value = {"data": [{"url": "https://stub.local/progress.mp4"}]}
+    response.raise_for_status = MagicMock()
+    response.status_code = 200
+    response.headers = {}
+    client = AsyncMock()
+    client.post.return_value = response
+
+    session = AsyncMock()
+    with patch("jimeng_mcp.server.get_http_client", return_value=client), \
+            patch("jimeng_mcp.server.request_progress", return_value=(session, 7)):
+        result = await server.handle_call_tool("text_to_video", {"prompt": "progress video"})
+
+    assert "progress.mp4" in result[0].text
+    messages = [call.kwargs["message"] for call in session.send_progress_notification.call_args_list]
+    assert messages[0].startswith("排队中")
+    assert any(message.startswith("已提交") for message in messages)
+    assert messages[-1].startswith("整理结果")
@@ -0,0 +1,166 @@
+"""
+按客户端限流测试
+
+运行测试:
+    pytest tests/test_ratelimit.py
+"""
+
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from jimeng_mcp.ratelimit import RateLimited, RateLimiter, client_identity, key_digest
+
+
+def test_token_bucket_costs_refill_and_eviction():
+    """测试按工具扣除令牌、随时间补充, 以及空闲和超量令牌桶的清理"""
+    now = [1000.0]
+    limiter = RateLimiter(rate=1.0, burst=10, costs={"text_to_video": 10}, max_buckets=3)
+    with patch("jimeng_mcp.ratelimit.time.monotonic", side_effect=lambda: now[0]):
+        status = limiter.acquire("a", "text_to_video", limiter.cost("text_to_video"))
+        assert status.remaining == 0
+        with pytest.raises(RateLimited) as exc:
+            limiter.acquire("a", "text_to_image", limiter.cost("text_to_image"))
+        assert exc.value.retry_after == pytest.approx(1.0)
+        assert exc.value.headers()["X-RateLimit-Reset"] == "10"
+        # 其他客户端不受影响
+        limiter.acquire("b", "text_to_image", 1)
+
+        now[0] += 5
+        assert limiter.acquire("a", "text_to_image", 1).remaining == pytest.approx(4)
+        # 单次消耗超过容量时按容量计
+        assert limiter.acquire("c", "batch_text_to_image", 50).remaining == 0
+
+        # 空闲到足以补满的令牌桶在之后的检查中被清理
+        now[0] += 11
+        limiter.acquire("d", "text_to_image", 1)
+        assert limiter.stats()["clients"] == 1
+
+        for client in ("e", "f", "g"):
+            limiter.acquire(client, "text_to_image", 1)
+        assert limiter.stats()["clients"] == 3
+        assert limiter.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_workers_share_token_buckets(tmp_path):
+    """测试多工作进程共用同一个共享状态文件时, 一个客户端在所有进程中只有一份配额"""
+    from jimeng_mcp.shared import SharedState
+
+    path = str(tmp_path / "shared.db")
+    first = RateLimiter(rate=0.1, burst=10, state=SharedState(path))
+    second = RateLimiter(rate=0.1, burst=10, state=SharedState(path))
+
+    assert (await first.check("ip:1.2.3.4", "text_to_video", 10)).remaining == 0
+    with pytest.raises(RateLimited):
+        await second.check("ip:1.2.3.4", "text_to_image", 1)
+    assert (await second.check("ip:5.6.7.8", "text_to_image", 1)).remaining == 9
+    assert first.stats()["allowed"] == 1 and second.stats()["rejected"] == 1
+
+
+def test_forwarded_identity_is_trusted_only_on_internal_socket(monkeypatch):
+    """测试转发请求携带的客户端标识只在内部 socket 上的请求中生效"""
+    from jimeng_mcp import server
+
+    monkeypatch.setattr(server, "rate_limiter", RateLimiter(rate=1.0))
+    headers = {server.FORWARDED_CLIENT_HEADER: "ip:9.9.9.9"}
+    forwarded = SimpleNamespace(
+        scope={server.INTERNAL_SCOPE_KEY: True}, headers=headers, query_params={"session_id": "s"}, client=None,
+    )
+    assert server.request_client(forwarded) == "ip:9.9.9.9"
+    # 直接发到公开端口的同名请求头被忽略
+    spoofed = SimpleNamespace(
+        scope={}, headers=headers, query_params={"session_id": "s"}, client=SimpleNamespace(host="1.2.3.4"),
+    )
+    assert server.request_client(spoofed) == "ip:1.2.3.4"
+
+
+def test_client_identity():
+    """测试客户端标识的优先顺序: 已登记的 API 密钥、IP、SSE 会话"""
+    keys = frozenset({key_digest("k1")})
+    by_key = client_identity({"x-api-key": "k1"}, session_id="s", address="1.2.3.4", client_keys=keys)
+    assert by_key.startswith("key:") and "k1" not in by_key
+    assert client_identity({"authorization": "Bearer k1"}, client_keys=keys) == by_key
+    # 未登记的密钥不作为标识
+    assert client_identity({"x-api-key": "k2"}, address="1.2.3.4", client_keys=keys) == "ip:1.2.3.4"
+    assert client_identity({"x-api-key": "k1"}, address="1.2.3.4") == "ip:1.2.3.4"
+    assert client_identity({}, session_id="s", address="1.2.3.4") == "ip:1.2.3.4"
+    assert client_identity({}, session_id="s") == "session:s"
+    assert client_identity({"x-forwarded-for": "9.9.9.9, 10.0.0.1"}, address="1.2.3.4") == "ip:1.2.3.4"
+    assert client_identity({"x-forwarded-for": "9.9.9.9, 10.0.0.1"}, address="1.2.3.4", trust_proxy=True) == "ip:9.9.9.9"
+    assert client_identity({}) is None
+
+
+@pytest.mark.asyncio
+async def test_rotating_unregistered_keys_does_not_bypass_limit(monkeypatch):
+    """测试每次更换未登记的 API 密钥仍按同一IP计数"""
+    from jimeng_mcp import server
+
+    monkeypatch.setattr(server, "rate_limiter", RateLimiter(rate=0.1, burst=10, client_keys=("registered",)))
+    result = {"data": [{"url": "https://stub.local/rotated.mp4"}]}
+    transport = httpx.ASGITransport(app=server.create_http_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        with patch("jimeng_mcp.server.make_api_request", AsyncMock(return_value=result)):
+            responses = [
+                await client.post("/text-to-video", json={"prompt": "rotated"}, headers={"X-API-Key": f"key-{i}"})
+                for i in range(3)
+            ]
+            bearer = await client.post(
+                "/text-to-video", json={"prompt": "rotated"}, headers={"Authorization": "Bearer another"}
+            )
+            registered = await client.post(
+                "/text-to-video", json={"prompt": "rotated"}, headers={"X-API-Key": "registered"}
+            )
+
+    assert [response.status_code for response in responses] == [200, 429, 429]
+    assert bearer.status_code == 429
+    # 登记的密钥单独计数
+    assert registered.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_http_and_mcp_clients_over_limit_are_rejected(monkeypatch):
+    """测试超出配额的HTTP客户端收到429和 X-RateLimit-* 响应头, SSE客户端收到结构化错误"""
+    from mcp.server.lowlevel.server import request_ctx
+    from mcp.shared.context import RequestContext
+
+    from jimeng_mcp import server
+
+    monkeypatch.setattr(server, "rate_limiter", RateLimiter(rate=0.1, burst=10, client_keys=("alpha", "beta")))
+    result = {"data": [{"url": "https://stub.local/limited.mp4"}]}
+    app = server.create_http_app()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        with patch("jimeng_mcp.server.make_api_request", AsyncMock(return_value=result)):
+            first = await client.post("/text-to-video", json={"prompt": "limited"}, headers={"X-API-Key": "alpha"})
+            second = await client.post("/text-to-video", json={"prompt": "limited"}, headers={"X-API-Key": "alpha"})
+            other = await client.post("/text-to-video", json={"prompt": "limited"}, headers={"X-API-Key": "beta"})
+            status = await client.get("/jobs", headers={"X-API-Key": "alpha"})
+
+    assert first.status_code == 200
+    assert first.headers["X-RateLimit-Limit"] == "10"
+    assert first.headers["X-RateLimit-Remaining"] == "0"
+    assert second.status_code == 429
+    assert second.json()["error"]["code"] == "rate_limited"
+    assert int(second.headers["Retry-After"]) >= 1
+    assert second.headers["X-RateLimit-Remaining"] == "0"
+    assert other.status_code == 200
+    assert status.status_code == 200
+
+    request = SimpleNamespace(headers={}, query_params={"session_id": "sse-1"}, client=None)
+    token = request_ctx.set(RequestContext(
+        request_id=1, meta=None, session=AsyncMock(), lifespan_context=None, request=request,
+    ))
+    try:
+        with patch("jimeng_mcp.server.make_api_request", AsyncMock(return_value=result)):
+            await server.handle_mcp_call_tool("text_to_video", {"prompt": "sse limited"})
+            with pytest.raises(RateLimited) as exc:
+                await server.handle_mcp_call_tool("text_to_video", {"prompt": "sse limited"})
+            # 任务查询不消耗令牌
+            await server.handle_mcp_call_tool("list_jobs", {})
+    finally:
+        request_ctx.reset(token)
+    assert json.loads(str(exc.value))["error"]["code"] == "rate_limited"
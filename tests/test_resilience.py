@@ -0,0 +1,132 @@
+"""
+重试与熔断测试
+
+运行测试:
+    pytest tests/test_resilience.py
+"""
+
+import httpx
+import pytest
+from unittest.mock import patch
+
+from jimeng_mcp.resilience import (
+    CircuitBreaker,
+    CircuitBreakerRegistry,
+    CircuitOpenError,
+    RetryPolicy,
+    parse_retry_after,
+)
+
+
+def status_error(status: int, headers: dict | None = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://upstream.local/v1/images/generations")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+def test_retry_after_parsing():
+    """测试 Retry-After 的秒数和HTTP日期两种格式"""
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
+    assert parse_retry_after("soon") is None
+
+
+def test_requests_only_retry_safe_failures():
+    """测试生成请求只在请求确定未被处理时重试"""
+    policy = RetryPolicy(max_attempts=3, base_delay=0.01)
+    connect = httpx.ConnectError("refused")
+
+    assert policy.retry_delay(connect, 1) is not None
+    assert policy.retry_delay(status_error(503), 1) is not None
+    assert policy.retry_delay(status_error(502), 1) is None
+    assert policy.retry_delay(httpx.ReadTimeout("slow"), 1) is None
+    assert policy.retry_delay(status_error(400), 1) is None
+
+
+def test_retry_budget_and_retry_after_are_honored():
+    """测试重试次数上限以及429的 Retry-After"""
+    policy = RetryPolicy(max_attempts=2, max_delay=5)
+
+    assert policy.retry_delay(status_error(429, {"Retry-After": "2"}), 1) == 2.0
+    assert policy.retry_delay(status_error(429, {"Retry-After": "60"}), 1) == 5
+    assert policy.retry_delay(status_error(429), 2) is None
+    assert RetryPolicy(max_attempts=1).retry_delay(status_error(429), 1) is None
+
+
+def test_breaker_opens_then_half_open_probe_closes_it():
+    """测试熔断器打开、半开探测和恢复"""
+    breaker = CircuitBreaker("u", failure_threshold=2, reset_timeout=0.0, half_open_max=1)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # 冷却结束后只放行一个探测请求
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_fails_fast():
+    """测试熔断打开期间直接拒绝"""
+    breaker = CircuitBreaker("u", failure_threshold=1, reset_timeout=60)
+    breaker.before_call()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError) as info:
+        breaker.before_call()
+    assert info.value.status_code == 503
+    assert int(info.value.headers()["Retry-After"]) > 0
+
+
+@pytest.mark.asyncio
+async def test_make_api_request_retries_transient_upstream_failure():
+    """测试上游返回503后重试成功"""
+    from jimeng_mcp import server
+
+    statuses = [503, 200]
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        status = statuses.pop(0)
+        if status != 200:
+            return httpx.Response(status, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"data": [{"url": "https://stub.local/a.png"}]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    with patch("jimeng_mcp.server.get_http_client", return_value=client), \
+            patch("jimeng_mcp.server.circuit_breakers", CircuitBreakerRegistry()):
+        result = await server.make_api_request("/v1/images/generations", {"prompt": "retry"})
+    await client.aclose()
+
+    assert result["data"][0]["url"] == "https://stub.local/a.png"
+    assert statuses == []
+
+
+@pytest.mark.asyncio
+async def test_make_api_request_fails_fast_while_circuit_open():
+    """测试熔断打开后不再请求上游"""
+    from jimeng_mcp import server
+
+    calls = []
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(500)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    registry = CircuitBreakerRegistry(failure_threshold=2, reset_timeout=60)
+    with patch("jimeng_mcp.server.get_http_client", return_value=client), \
+            patch("jimeng_mcp.server.circuit_breakers", registry):
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await server.make_api_request("/v1/videos/generations", {"prompt": "cb"})
+        with pytest.raises(CircuitOpenError):
+            await server.make_api_request("/v1/videos/generations", {"prompt": "cb"})
+    await client.aclose()
+
+    assert len(calls) == 2
@@ -7,13 +7,14 @@
 
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
-from jimeng_mcp.server import make_api_request
 
 
 @pytest.mark.asyncio
 async def test_make_api_request_success():
     """测试成功的API请求"""
-    with patch("jimeng_mcp.server.httpx.AsyncClient") as mock_client:
+    from jimeng_mcp.server import make_api_request
+
+    with patch("jimeng_mcp.server.get_http_client") as mock_get_client:
         # 模拟响应
         mock_response = MagicMock()
         mock_response.json.return_value = {
@@ -21,11 +22,13 @@ async def test_make_api_request_success():
             "data": [{"url": "https://example.com/image.png"}]
         }
         mock_response.raise_for_status = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {}
 
-        # 模拟客户端上下文管理器
+        # 模拟共享连接池客户端
         mock_client_instance = AsyncMock()
         mock_client_instance.post.return_value = mock_response
-        mock_client.return_value.__aenter__.return_value = mock_client_instance
+        mock_get_client.return_value = mock_client_instance
 
         # 测试请求
         result = await make_api_request(
@@ -41,14 +44,18 @@ async def test_make_api_request_success():
 @pytest.mark.asyncio
 async def test_make_api_request_with_custom_timeout():
     """测试带自定义超时的API请求"""
-    with patch("jimeng_mcp.server.httpx.AsyncClient") as mock_client:
+    from jimeng_mcp.server import make_api_request
+
+    with patch("jimeng_mcp.server.get_http_client") as mock_get_client:
         mock_response = MagicMock()
         mock_response.json.return_value = {"data": []}
         mock_response.raise_for_status = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {}
 
         mock_client_instance = AsyncMock()
         mock_client_instance.post.return_value = mock_response
-        mock_client.return_value.__aenter__.return_value = mock_client_instance
+        mock_get_client.return_value = mock_client_instance
 
         # 使用自定义超时进行测试
         await make_api_request(
@@ -57,8 +64,63 @@ async def test_make_api_request_with_custom_timeout():
             timeout=600
         )
 
-        # 验证超时参数是否传递给客户端
-        mock_client.assert_called_once_with(timeout=600)
+        # 验证超时参数是否随请求传递给共享客户端
+        timeout = mock_client_instance.post.call_args.kwargs["timeout"]
+        assert timeout.read == 600
+        assert timeout.connect == 10.0
+
+
+@pytest.mark.asyncio
+async def test_configured_connect_timeout_reaches_request(monkeypatch):
+    """测试单次请求覆盖总超时时, JIMENG_HTTP_CONNECT_TIMEOUT 仍作用于连接建立阶段"""
+    import httpx
+    from jimeng_mcp.http_client import create_http_client
+    from jimeng_mcp.server import make_api_request
+
+    monkeypatch.setenv("JIMENG_HTTP_CONNECT_TIMEOUT", "2.5")
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.extensions["timeout"])
+        return httpx.Response(200, json={"data": [{"url": "https://example.com/t.png"}]})
+
+    client = create_http_client(transport=httpx.MockTransport(handler))
+    with patch("jimeng_mcp.server.get_http_client", return_value=client):
+        await make_api_request("/v1/videos/generations", {"prompt": "test"}, timeout=600)
+    await client.aclose()
+
+    assert seen[0]["connect"] == 2.5
+    assert seen[0]["read"] == 600
+
+
+@pytest.mark.asyncio
+async def test_shared_http_client_is_reused():
+    """测试共享连接池在多次调用间复用, 关闭后重新创建"""
+    from jimeng_mcp.http_client import get_http_client, close_http_client
+
+    first = get_http_client()
+    assert get_http_client() is first
+
+    await close_http_client()
+    assert first.is_closed
+
+    second = get_http_client()
+    assert second is not first
+    await close_http_client()
+
+
+def test_http_pool_limits_from_env(monkeypatch):
+    """测试连接池限制可通过环境变量配置"""
+    from jimeng_mcp.http_client import build_limits
+
+    monkeypatch.setenv("JIMENG_HTTP_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("JIMENG_HTTP_MAX_KEEPALIVE", "3")
+    monkeypatch.setenv("JIMENG_HTTP_KEEPALIVE_EXPIRY", "12.5")
+    limits = build_limits()
+
+    assert limits.max_connections == 7
+    assert limits.max_keepalive_connections == 3
+    assert limits.keepalive_expiry == 12.5
 
 
 def test_environment_variables():
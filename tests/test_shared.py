@@ -0,0 +1,116 @@
+"""
+多进程共享状态测试
+
+运行测试:
+    pytest tests/test_shared.py
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from jimeng_mcp.shared import PROCESS_OWNER, SessionRegistry, SharedFlight, SharedState, owner_alive
+
+
+@pytest.mark.asyncio
+async def test_identical_calls_share_one_upstream_call(tmp_path):
+    """测试两个实例 (模拟两个工作进程) 的相同请求只调用一次, 另一方读取共享结果"""
+    path = str(tmp_path / "shared.db")
+    first = SharedFlight(SharedState(path), poll_interval=0.01)
+    second = SharedFlight(SharedState(path), poll_interval=0.01)
+    release = asyncio.Event()
+
+    async def upstream():
+        await release.wait()
+        return {"data": [{"url": "https://cdn.example.com/x.png"}]}
+
+    duplicate = AsyncMock()
+    leader = asyncio.create_task(first.do("k", upstream))
+    await asyncio.sleep(0.05)
+    follower = asyncio.create_task(second.do("k", duplicate))
+    await asyncio.sleep(0.05)
+    release.set()
+
+    assert await leader == await follower
+    duplicate.assert_not_awaited()
+    assert first.stats() == {"calls": 1, "joined": 0}
+    assert second.stats() == {"calls": 0, "joined": 1}
+
+
+@pytest.mark.asyncio
+async def test_failed_call_releases_lease(tmp_path):
+    """测试持有租约的调用失败后释放租约, 等待方自行调用"""
+    path = str(tmp_path / "shared.db")
+    first = SharedFlight(SharedState(path), poll_interval=0.01)
+    second = SharedFlight(SharedState(path), poll_interval=0.01)
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise RuntimeError("upstream down")
+
+    fallback = AsyncMock(return_value={"data": []})
+    leader = asyncio.create_task(first.do("k", failing))
+    await asyncio.sleep(0.05)
+    follower = asyncio.create_task(second.do("k", fallback))
+    release.set()
+
+    with pytest.raises(RuntimeError):
+        await leader
+    assert await follower == {"data": []}
+    fallback.assert_awaited_once()
+
+
+
+@pytest.mark.asyncio
+async def test_waiters_poll_without_write_lock(tmp_path):
+    """测试等待方用只读查询轮询并逐次增大间隔, 持有者存活时不再开启写事务"""
+    path = str(tmp_path / "shared.db")
+    first = SharedFlight(SharedState(path), poll_interval=0.01)
+    state = SharedState(path)
+    second = SharedFlight(state, poll_interval=0.01, max_poll_interval=0.04)
+    release = asyncio.Event()
+
+    async def upstream():
+        await release.wait()
+        return {"data": []}
+
+    writes, reads = [], []
+    execute, read = state.execute, state.read
+    state.execute = lambda fn: writes.append(fn) or execute(fn)
+    state.read = lambda fn: reads.append(fn) or read(fn)
+
+    leader = asyncio.create_task(first.do("k", upstream))
+    await asyncio.sleep(0.05)
+    follower = asyncio.create_task(second.do("k", AsyncMock()))
+    await asyncio.sleep(0.3)
+    release.set()
+    await asyncio.gather(leader, follower)
+
+    # 只有进入时的一次认领是写事务
+    assert len(writes) == 1
+    # 间隔增大到上限 0.04 秒, 0.3 秒内的轮询次数远少于固定 0.01 秒间隔的 30 次
+    assert 3 <= len(reads) <= 15
+
+
+def test_sessions_of_exited_workers_are_ignored(tmp_path, monkeypatch):
+    """测试会话登记与查询, 所在进程已退出时不再转发; 准入上限按工作进程数平分"""
+    registry = SessionRegistry(SharedState(str(tmp_path / "shared.db")), "/tmp/sse-1.sock")
+    registry.register(["abc"])
+    assert registry.lookup("abc") == "/tmp/sse-1.sock"
+    registry.unregister(["abc"])
+    assert registry.lookup("abc") is None
+
+    assert owner_alive(PROCESS_OWNER)
+    with patch("jimeng_mcp.shared.os.kill", side_effect=ProcessLookupError):
+        assert not owner_alive("999999:deadbeef")
+
+    from jimeng_mcp.admission import AdmissionController
+
+    monkeypatch.setenv("JIMENG_WORKERS", "4")
+    monkeypatch.setenv("JIMENG_MAX_CONCURRENCY", "10")
+    monkeypatch.setenv("JIMENG_MAX_CONCURRENCY_TEXT_TO_VIDEO", "2")
+    admission = AdmissionController.from_env()
+    assert admission.limit == 3
+    assert admission.limits["text_to_video"] == 1
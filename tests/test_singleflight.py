@@ -0,0 +1,153 @@
+"""
+相同并发请求合并测试
+
+运行测试:
+    pytest tests/test_singleflight.py
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from unittest.mock import patch
+
+from jimeng_mcp.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_calls_reach_upstream_once():
+    """测试N个相同的并发调用只向桩上游发起一次请求"""
+    from jimeng_mcp import server
+
+    received = []
+
+    async def stub_upstream(request: httpx.Request) -> httpx.Response:
+        received.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"data": [{"url": "https://stub.local/v.mp4"}]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(stub_upstream))
+    arguments = {"prompt": "singleflight horse", "duration": 5}
+    with patch("jimeng_mcp.server.get_http_client", return_value=client), \
+            patch("jimeng_mcp.server.inflight", SingleFlight()):
+        results = await asyncio.gather(*[
+            server.handle_call_tool("text_to_video", dict(arguments)) for _ in range(20)
+        ])
+    await client.aclose()
+
+    assert received == ["/v1/videos/generations"]
+    assert all("https://stub.local/v.mp4" in result[0].text for result in results)
+
+
+@pytest.mark.asyncio
+async def test_cancelling_one_waiter_keeps_shared_call_running():
+    """测试部分等待者取消时上游调用继续进行"""
+    flight = SingleFlight()
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def upstream():
+        started.set()
+        await release.wait()
+        return "done"
+
+    first = asyncio.create_task(flight.do("k", upstream))
+    second = asyncio.create_task(flight.do("k", upstream))
+    await started.wait()
+
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert flight.stats()["calls"] == 1
+    assert flight.stats()["coalesced"] == 1
+
+
+@pytest.mark.asyncio
+async def test_upstream_cancelled_when_all_waiters_leave():
+    """测试所有等待者离开后取消上游调用"""
+    flight = SingleFlight()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def upstream():
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiters = [asyncio.create_task(flight.do("k", upstream)) for _ in range(3)]
+    await started.wait()
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert cancelled.is_set()
+    assert flight.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_key_is_released():
+    """测试上游异常传递给所有等待者, 之后可以重新发起调用"""
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(
+        flight.do("k", failing), flight.do("k", failing), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.in_flight == 0
+
+    async def ok():
+        return 1
+
+    assert await flight.do("k", ok) == 1
+
+
+@pytest.mark.asyncio
+async def test_joiners_receive_phases_of_shared_call():
+    """测试后加入的等待者也收到共享调用的阶段, 但不计入耗时估算"""
+    from unittest.mock import AsyncMock
+
+    from jimeng_mcp.progress import ProgressTracker, set_phase
+
+    flight = SingleFlight()
+    tracker = ProgressTracker(interval=60)
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def upstream():
+        set_phase("submitted")
+        started.set()
+        await release.wait()
+        set_phase("formatting")
+        return "done"
+
+    async def caller(session):
+        async with tracker.track("text_to_video", "m", (session, "tok")) as reporter:
+            await flight.do("k", upstream)
+        return reporter
+
+    owner_session, joiner_session = AsyncMock(), AsyncMock()
+    owner = asyncio.create_task(caller(owner_session))
+    await started.wait()
+    joiner = asyncio.create_task(caller(joiner_session))
+    await asyncio.sleep(0.01)
+    release.set()
+    owner_reporter, joiner_reporter = await asyncio.gather(owner, joiner)
+
+    messages = [call.kwargs["message"] for call in joiner_session.send_progress_notification.call_args_list]
+    assert messages[0].startswith("排队中")
+    assert any(message.startswith("已提交") for message in messages)
+    assert messages[-1].startswith("整理结果")
+    assert owner_reporter.submitted and not joiner_reporter.submitted
+    assert len(tracker.estimator._history[("text_to_video", "m")]) == 1
@@ -0,0 +1,87 @@
+"""
+结构化结果和HTTP响应压缩测试
+
+运行测试:
+    pytest tests/test_structured.py
+"""
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from jimeng_mcp.compression import accepted_encoding
+from jimeng_mcp.encoding import dumpb, loads
+
+
+@pytest.mark.asyncio
+async def test_generation_returns_structured_result(monkeypatch):
+    """测试生成结果带有结构化字段, 启用结构化输出时MCP入口同时返回 structuredContent"""
+    from jimeng_mcp import server
+
+    composition = {
+        "data": [{"url": "https://stub.local/c1.png"}, {"url": "https://stub.local/c2.png"}],
+        "composition_type": "fusion",
+        "input_images": 2,
+    }
+    video = {"data": [{"url": "https://stub.local/v.mp4", "revised_prompt": "a calm cat"}]}
+    arguments = {"prompt": "merge", "images": ["https://a.local/1.png", "https://a.local/2.png"], "cache": "bypass"}
+    with patch("jimeng_mcp.server.make_api_request", AsyncMock(side_effect=[composition, video, composition])):
+        result = await server.handle_call_tool("image_composition", dict(arguments))
+        video_result = await server.handle_call_tool("text_to_video", {"prompt": "structured cat"})
+        monkeypatch.setattr(server, "STRUCTURED_OUTPUT", True)
+        content, structured = await server.handle_mcp_call_tool("image_composition", dict(arguments))
+
+    data = result.structured
+    assert data["tool"] == "image_composition"
+    assert data["urls"] == ["https://stub.local/c1.png", "https://stub.local/c2.png"]
+    assert data["composition_type"] == "fusion"
+    assert data["input_count"] == 2
+    assert set(data["timings"]) == {"prepare_ms", "upstream_ms", "total_ms"}
+    assert "https://stub.local/c2.png" in result[0].text
+    assert video_result.structured["items"] == [{"url": "https://stub.local/v.mp4", "revised_prompt": "a calm cat"}]
+    assert "composition_type" not in video_result.structured
+    assert structured["urls"] == data["urls"]
+    assert content[0].text.startswith("✅ 成功将 2 张图像合成为 2 个结果")
+
+
+@pytest.mark.asyncio
+async def test_http_returns_typed_json_and_compresses_large_responses():
+    """测试HTTP接口返回结构化结果和全部内容, 较大的响应按 Accept-Encoding 压缩"""
+    from jimeng_mcp import server
+
+    urls = [f"https://stub.local/http-{i}.png" for i in range(40)]
+    result = {"data": [{"url": url} for url in urls]}
+    app = server.create_http_app()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        with patch("jimeng_mcp.server.make_api_request", AsyncMock(return_value=result)):
+            response = await client.post(
+                "/text-to-image",
+                json={"prompt": "http structured", "cache": "bypass"},
+                headers={"Accept-Encoding": "gzip"},
+            )
+        health = await client.get("/health", headers={"Accept-Encoding": "gzip"})
+        identity = await client.get("/tools", headers={"Accept-Encoding": "identity"})
+
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    body = response.json()
+    assert body["data"]["urls"] == urls
+    assert body["content"][0]["type"] == "text"
+    assert body["result"] == body["content"][0]["text"]
+    assert "Content-Encoding" not in health.headers
+    assert "Content-Encoding" not in identity.headers
+
+
+def test_encoding_helpers():
+    """测试 Accept-Encoding 协商和JSON编码"""
+    assert accepted_encoding("gzip, deflate, br", ("br", "gzip")) == "br"
+    assert accepted_encoding("br;q=0, gzip;q=0.5", ("br", "gzip")) == "gzip"
+    assert accepted_encoding("*", ("gzip",)) == "gzip"
+    assert accepted_encoding("identity", ("br", "gzip")) is None
+    assert accepted_encoding("*, gzip;q=0", ("gzip",)) is None
+
+    encoded = dumpb({"prompt": "猫", "values": [1, 2.5, None]})
+    assert encoded == '{"prompt":"猫","values":[1,2.5,null]}'.encode("utf-8")
+    assert loads(encoded) == {"prompt": "猫", "values": [1, 2.5, None]}
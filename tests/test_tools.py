@@ -0,0 +1,83 @@
+"""
+工具注册表测试
+
+运行测试:
+    pytest tests/test_tools.py
+"""
+
+import json
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from jimeng_mcp.tools import InvalidArgumentsError, compile_validator
+
+
+def test_compiled_validator_rejects_invalid_arguments():
+    """测试编译后的校验器: 类型、枚举、范围、数组长度、必需参数和嵌套路径"""
+    validate = compile_validator({
+        "type": "object",
+        "properties": {
+            "prompt": {"type": "string"},
+            "ratio": {"type": "string", "enum": ["1:1", "16:9"]},
+            "strength": {"type": "number", "minimum": 0.0, "maximum": 1.0},
+            "duration": {"type": "integer", "enum": [5, 10]},
+            "items": {
+                "type": "array",
+                "maxItems": 2,
+                "items": {"type": "object", "properties": {"prompt": {"type": "string"}}, "required": ["prompt"]},
+            },
+        },
+        "required": ["prompt"],
+    })
+    validate({"prompt": "cat", "ratio": "16:9", "strength": 1, "duration": 5.0, "extra": object()})
+
+    cases = {
+        "prompt": {"ratio": "1:1"},
+        "ratio": {"prompt": "cat", "ratio": "5:1"},
+        "strength": {"prompt": "cat", "strength": 1.5},
+        "duration": {"prompt": "cat", "duration": True},
+        "items": {"prompt": "cat", "items": [{"prompt": "a"}] * 3},
+        "items[1].prompt": {"prompt": "cat", "items": [{"prompt": "a"}, {}]},
+    }
+    for field, arguments in cases.items():
+        with pytest.raises(InvalidArgumentsError) as exc:
+            validate(arguments)
+        assert exc.value.field == field
+    with pytest.raises(InvalidArgumentsError):
+        validate(["not", "an", "object"])
+
+
+@pytest.mark.asyncio
+async def test_invalid_call_is_rejected_before_upstream():
+    """测试无效参数在发往上游之前被拒绝, 以结构化错误返回"""
+    from jimeng_mcp import server
+
+    client = AsyncMock()
+    with patch("jimeng_mcp.server.get_http_client", return_value=client):
+        with pytest.raises(InvalidArgumentsError) as exc:
+            await server.handle_call_tool("text_to_image", {"prompt": "cat", "sample_strength": 2})
+        with pytest.raises(InvalidArgumentsError):
+            await server.handle_call_tool("text_to_video", None)
+        with pytest.raises(InvalidArgumentsError):
+            server.job_manager.submit("text_to_video", {"prompt": "cat", "duration": 7})
+    client.post.assert_not_awaited()
+
+    error = json.loads(str(exc.value))["error"]
+    assert error["code"] == "invalid_arguments"
+    assert error["field"] == "sample_strength"
+
+
+@pytest.mark.asyncio
+async def test_tool_list_is_built_once():
+    """测试工具列表每次返回同一个对象, 并与注册表一致"""
+    from jimeng_mcp import server
+
+    first = await server.handle_list_tools()
+    assert await server.handle_list_tools() is first
+    assert [tool.name for tool in first] == [
+        "text_to_image", "image_composition", "text_to_video", "image_to_video",
+        "batch_text_to_image", "submit_generation", "get_job_status", "get_job_result", "list_jobs",
+    ]
+    with pytest.raises(ValueError):
+        server.tool_registry.get("unknown")
@@ -0,0 +1,115 @@
+"""
+请求追踪测试
+
+运行测试:
+    pytest tests/test_tracing.py
+"""
+
+import json
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+class _Collector:
+    """记录导出的 span"""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans, service_name):
+        self.spans.extend(spans)
+
+
+def test_spans_nest_and_export_when_sampled():
+    """测试 span 父子关系, 采样的 trace 在根 span 结束后导出"""
+    from jimeng_mcp.tracing import Tracer
+
+    collector = _Collector()
+    tracer = Tracer(sample_rate=1.0, exporters=[collector])
+    with tracer.span("root") as root:
+        with tracer.span("child") as child:
+            child.phase("format")
+    tracer.shutdown()
+
+    names = {span.name: span for span in collector.spans}
+    assert set(names) == {"root", "child", "format"}
+    assert names["child"].parent_id == root.span_id
+    assert names["format"].parent_id == child.span_id
+    assert len({span.trace_id for span in collector.spans}) == 1
+    assert tracer.exported == 3
+
+
+def test_unsampled_traces_are_timed_but_not_exported():
+    """测试未采样的 trace 仍然提供 Server-Timing, 但不导出"""
+    from jimeng_mcp.tracing import Tracer
+
+    collector = _Collector()
+    tracer = Tracer(sample_rate=0.0, exporters=[collector])
+    with tracer.span("root") as root:
+        tracer.start_span("queue").end()
+        with tracer.span("upstream"):
+            pass
+    tracer.shutdown()
+
+    assert collector.spans == []
+    timing = root.server_timing()
+    assert timing.startswith("queue;dur=")
+    assert "upstream;dur=" in timing
+    assert "total;dur=" in timing
+    assert root.traceparent().endswith("-00")
+
+
+def test_incoming_traceparent_is_continued():
+    """测试沿用调用方传入的 traceparent"""
+    from jimeng_mcp.tracing import Tracer
+
+    tracer = Tracer(sample_rate=0.0, exporters=[_Collector()])
+    parent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    with tracer.span("POST /text-to-image", traceparent=parent) as span:
+        assert span.trace_id == "0af7651916cd43dd8448eb211c80319c"
+        assert span.parent_id == "b7ad6b7169203331"
+        assert span.trace.sampled
+    tracer.shutdown()
+
+
+def test_file_exporter_writes_otlp_json(tmp_path):
+    """测试文件导出为每行一个 OTLP JSON span"""
+    from jimeng_mcp.tracing import FileExporter, Tracer
+
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(sample_rate=1.0, exporters=[FileExporter(str(path))])
+    with tracer.span("root", tool="text_to_image"):
+        pass
+    tracer.shutdown()
+
+    record = json.loads(path.read_text(encoding="utf-8").splitlines()[0])
+    assert record["name"] == "root"
+    assert len(record["traceId"]) == 32 and len(record["spanId"]) == 16
+    assert {"key": "tool", "value": {"stringValue": "text_to_image"}} in record["attributes"]
+
+
+@pytest.mark.asyncio
+async def test_traceparent_propagated_to_upstream():
+    """测试上游请求带有 traceparent 请求头, 且与工具调用在同一 trace"""
+    from jimeng_mcp import server
+
+    response = MagicMock()
+    response.json.return_value = {"data": [{"url": "https://stub.local/trace.png"}]}
+    response.raise_for_status = MagicMock()
+    response.status_code = 200
+    response.headers = {}
+    client = AsyncMock()
+    client.post.return_value = response
+
+    with patch("jimeng_mcp.server.get_http_client", return_value=client):
+        with server.tracer.span("test-root") as root:
+            await server.handle_call_tool("text_to_image", {"prompt": "trace", "cache": "bypass"})
+
+    traceparent = client.post.call_args.kwargs["headers"]["traceparent"]
+    assert traceparent.split("-")[1] == root.trace_id
+    names = [span.name for span in root.trace.spans]
+    for name in ("queue", "upstream", "jimeng_api", "format", "tool", "call_tool"):
+        assert name in names
+    timing = root.server_timing()
+    assert "queue;dur=" in timing and "upstream;dur=" in timing and "format;dur=" in timing
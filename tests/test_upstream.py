@@ -0,0 +1,98 @@
+"""
+上游服务与密钥池测试
+
+运行测试:
+    pytest tests/test_upstream.py
+"""
+
+import json
+
+import httpx
+import pytest
+from unittest.mock import patch
+
+from jimeng_mcp.resilience import CircuitBreakerRegistry
+from jimeng_mcp.upstream import NoUpstreamAvailable, UpstreamPool, UpstreamTarget
+
+
+def test_env_lists_expand_to_url_key_pairs(monkeypatch):
+    """测试逗号分隔的地址和密钥组合成目标"""
+    monkeypatch.delenv("JIMENG_UPSTREAMS_FILE", raising=False)
+    monkeypatch.setenv("JIMENG_API_URL", "http://a:8000/, http://b:8000")
+    monkeypatch.setenv("JIMENG_API_KEY", "k1,k2")
+    pool = UpstreamPool.from_env()
+
+    pairs = {(t.base_url, t.api_key) for t in pool.targets}
+    assert pairs == {
+        ("http://a:8000", "k1"), ("http://a:8000", "k2"),
+        ("http://b:8000", "k1"), ("http://b:8000", "k2"),
+    }
+
+
+def test_config_file(tmp_path, monkeypatch):
+    """测试从JSON配置文件加载"""
+    path = tmp_path / "upstreams.json"
+    path.write_text(json.dumps([
+        {"url": "http://a:8000", "keys": ["k1", "k2"]},
+        {"url": "http://b:8000", "key": "k3"},
+    ]))
+    monkeypatch.setenv("JIMENG_UPSTREAMS_FILE", str(path))
+
+    assert len(UpstreamPool.from_env().targets) == 3
+
+
+def test_least_outstanding_weighted_by_latency():
+    """测试优先选择进行中请求少且延迟低的目标"""
+    fast, slow = UpstreamTarget("http://fast", "k"), UpstreamTarget("http://slow", "k")
+    fast.latency, slow.latency = 1.0, 10.0
+    pool = UpstreamPool([fast, slow])
+
+    chosen = [pool.acquire() for _ in range(5)]
+    # 快的目标承担 (n+1)*1 <= 10 之前的全部请求
+    assert chosen.count(fast) == 5
+
+    for target in chosen:
+        pool.release(target, latency=1.0, status=200)
+    assert fast.outstanding == 0
+
+
+def test_auth_and_quota_errors_eject_target():
+    """测试认证和额度错误会暂时摘除目标"""
+    a, b = UpstreamTarget("http://u", "a"), UpstreamTarget("http://u", "b")
+    pool = UpstreamPool([a, b], auth_eject=60, quota_eject=60)
+
+    pool.release(pool.acquire(), status=401)
+    remaining = pool.acquire()
+    pool.release(remaining, status=429, retry_after=5)
+
+    with pytest.raises(NoUpstreamAvailable) as info:
+        pool.acquire()
+    assert 0 < info.value.retry_after <= 5
+
+
+@pytest.mark.asyncio
+async def test_quota_error_fails_over_to_another_key():
+    """测试某个密钥返回429后重试改用其他密钥"""
+    from jimeng_mcp import server
+
+    seen = []
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        key = request.headers["Authorization"]
+        seen.append(key)
+        if key == "Bearer exhausted":
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"data": [{"url": "https://stub.local/a.png"}]})
+
+    exhausted, healthy = UpstreamTarget("http://u", "exhausted"), UpstreamTarget("http://u", "healthy")
+    exhausted.latency, healthy.latency = 0.1, 5.0
+    pool = UpstreamPool([exhausted, healthy])
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    with patch("jimeng_mcp.server.get_http_client", return_value=client), \
+            patch("jimeng_mcp.server.upstream_pool", pool), \
+            patch("jimeng_mcp.server.circuit_breakers", CircuitBreakerRegistry()):
+        result = await server.make_api_request("/v1/images/generations", {"prompt": "pool"})
+    await client.aclose()
+
+    assert seen == ["Bearer exhausted", "Bearer healthy"]
+    assert result["data"][0]["url"] == "https://stub.local/a.png"
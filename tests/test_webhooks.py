@@ -0,0 +1,180 @@
+"""
+Webhook 回调测试
+
+运行测试:
+    pytest tests/test_webhooks.py
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from jimeng_mcp.jobs import JobManager
+from jimeng_mcp.tools import ToolResult
+from jimeng_mcp.webhooks import InvalidCallbackError, WebhookDispatcher, sign
+
+
+def _receiver(requests: list[httpx.Request]) -> httpx.AsyncClient:
+    """模拟回调接收方: /flaky 第一次返回503, /gone 返回404, /down 总是返回500"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        path = request.url.path
+        if path == "/flaky" and sum(1 for r in requests if r.url.path == "/flaky") == 1:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        if path == "/gone":
+            return httpx.Response(404)
+        if path == "/down":
+            return httpx.Response(500)
+        return httpx.Response(204)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "等待超时"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_callbacks_are_signed_retried_and_dead_lettered(tmp_path):
+    """测试回调带签名、可重试的失败会重试、不可重试或重试耗尽的进入死信"""
+    dead_letter = tmp_path / "dead.jsonl"
+    dispatcher = WebhookDispatcher(
+        store_path=str(tmp_path / "webhooks.db"), workers=2, max_attempts=3,
+        backoff=0.01, dead_letter_path=str(dead_letter), allowed_hosts=("hooks.local",),
+    )
+
+    async def runner(tool, arguments):
+        return ToolResult([], {"urls": [f"https://stub.local/{arguments['prompt']}.png"]})
+
+    manager = JobManager(runner, ["text_to_image"], on_finished=dispatcher.job_finished)
+    requests: list[httpx.Request] = []
+    with patch("jimeng_mcp.webhooks.get_http_client", return_value=_receiver(requests)):
+        await dispatcher.start()
+        for path in ("flaky", "gone", "down"):
+            job = manager.submit("text_to_image", {"prompt": path})
+            dispatcher.register(job.id, f"https://hooks.local/{path}", "s3cret")
+        # 未登记回调的任务不投递
+        manager.submit("text_to_image", {"prompt": "silent"})
+        await _wait_for(lambda: dispatcher.delivered == 1 and dispatcher.dead == 2)
+        await dispatcher.stop()
+
+    paths = [request.url.path for request in requests]
+    assert paths.count("/flaky") == 2
+    assert paths.count("/gone") == 1
+    assert paths.count("/down") == 3
+
+    delivered = requests[[i for i, p in enumerate(paths) if p == "/flaky"][-1]]
+    body = json.loads(delivered.content)
+    assert body["event"] == "succeeded"
+    assert body["data"] == {"urls": ["https://stub.local/flaky.png"]}
+    assert delivered.headers["X-Jimeng-Delivery"] == body["delivery_id"]
+    expected = sign("s3cret", delivered.headers["X-Jimeng-Timestamp"], delivered.content)
+    assert delivered.headers["X-Jimeng-Signature"] == f"sha256={expected}"
+
+    letters = [json.loads(line) for line in dead_letter.read_text().splitlines()]
+    assert sorted(letter["url"] for letter in letters) == ["https://hooks.local/down", "https://hooks.local/gone"]
+    assert {letter["error"] for letter in letters} == {"状态码 404", "状态码 500"}
+
+
+@pytest.mark.asyncio
+async def test_pending_deliveries_survive_restart(tmp_path):
+    """测试进程退出时未投递的回调在下次启动时继续投递"""
+    path = str(tmp_path / "webhooks.db")
+    crashed = WebhookDispatcher(store_path=path, allowed_hosts=("hooks.local",))
+
+    async def runner(tool, arguments):
+        return ToolResult([], None)
+
+    manager = JobManager(runner, ["text_to_video"], on_finished=crashed.job_finished)
+    job = manager.submit("text_to_video", {"prompt": "durable"})
+    crashed.register(job.id, "https://hooks.local/ok")
+    await _wait_for(lambda: job.status.finished)
+    # 等待数据库线程写入投递记录; 投递协程从未启动, 相当于进程在投递前退出
+    await crashed._run(lambda: None)
+    await crashed._run(crashed._close)
+
+    requests: list[httpx.Request] = []
+    restarted = WebhookDispatcher(store_path=path, allowed_hosts=("hooks.local",))
+    with patch("jimeng_mcp.webhooks.get_http_client", return_value=_receiver(requests)):
+        await restarted.start()
+        await _wait_for(lambda: restarted.delivered == 1)
+        await restarted.stop()
+
+    assert json.loads(requests[0].content)["job"]["job_id"] == job.id
+
+
+@pytest.mark.asyncio
+async def test_internal_callback_addresses_are_refused(tmp_path):
+    """测试未配置允许列表时拒绝内网和本机地址: 字面量在提交时拒绝, 解析到内网的主机不投递"""
+    dispatcher = WebhookDispatcher(store_path=str(tmp_path / "webhooks.db"))
+    for url in (
+        "http://127.0.0.1:8000/hook", "http://localhost/hook", "http://169.254.169.254/latest/meta-data",
+        "http://10.0.0.8/hook", "http://[::1]/hook", "http://[::ffff:192.168.1.1]/hook",
+    ):
+        with pytest.raises(InvalidCallbackError):
+            dispatcher.check(url)
+    dispatcher.check("https://hooks.example.com/ok")
+    # 允许列表中的主机可以是内网地址
+    WebhookDispatcher(allowed_hosts=("127.0.0.1",)).check("http://127.0.0.1:8000/hook")
+
+    async def runner(tool, arguments):
+        return ToolResult([], None)
+
+    manager = JobManager(runner, ["text_to_image"], on_finished=dispatcher.job_finished)
+    requests: list[httpx.Request] = []
+    resolved = {"rebind.example.com": ["93.184.216.34", "192.168.0.10"], "hooks.example.com": ["93.184.216.34"]}
+    with patch("jimeng_mcp.webhooks.get_http_client", return_value=_receiver(requests)), \
+            patch("jimeng_mcp.http_client.resolve_host", AsyncMock(side_effect=lambda host, port: resolved[host])):
+        await dispatcher.start()
+        for host in resolved:
+            job = manager.submit("text_to_image", {"prompt": host})
+            dispatcher.register(job.id, f"https://{host}/hook")
+        await _wait_for(lambda: dispatcher.delivered == 1 and dispatcher.dead == 1)
+        await dispatcher.stop()
+
+    assert [request.url.host for request in requests] == ["hooks.example.com"]
+
+
+@pytest.mark.asyncio
+async def test_http_generation_with_callback_returns_immediately(monkeypatch):
+    """测试带 callback_url 的生成请求立即返回202和任务, 无效的回调地址返回400"""
+    from jimeng_mcp import server
+
+    monkeypatch.setattr(server, "webhooks", WebhookDispatcher(allowed_hosts=("hooks.local",)))
+    app = server.create_http_app()
+    transport = httpx.ASGITransport(app=app)
+    release = asyncio.Event()
+
+    async def slow_request(*args, **kwargs):
+        await release.wait()
+        return {"data": [{"url": "https://stub.local/v.mp4"}]}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        with patch("jimeng_mcp.server.make_api_request", AsyncMock(side_effect=slow_request)):
+            accepted = await client.post("/text-to-video", json={
+                "prompt": "callback video", "callback_url": "https://hooks.local/ok", "callback_secret": "k",
+            })
+            rejected = await client.post("/text-to-video", json={
+                "prompt": "callback video", "callback_url": "ftp://hooks.local/ok",
+            })
+            internal = await client.post("/text-to-video", json={
+                "prompt": "callback video", "callback_url": "http://169.254.169.254/latest",
+            })
+            release.set()
+            job = await server.job_manager.get(accepted.json()["job"]["job_id"])
+            await _wait_for(lambda: job.status.finished)
+
+    assert accepted.status_code == 202
+    assert accepted.json()["job"]["tool"] == "text_to_video"
+    assert rejected.status_code == 400
+    assert rejected.json()["error"]["code"] == "invalid_callback"
+    assert internal.status_code == 400
+    with pytest.raises(InvalidCallbackError):
+        server.submit_job("text_to_video", {"prompt": "x"}, callback_url="not a url")